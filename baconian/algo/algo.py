@@ -35,6 +35,16 @@ class Algo(Basic):
     def append_to_memory(self, *args, **kwargs):
         raise NotImplementedError
 
+    def reset_episode(self, index: int = None):
+        """
+        Called when the env sampled by the agent is reset, the algo holding per-episode state (e.g. a cached plan)
+        should drop it here.
+
+        :param index: row of the batched observations (i.e. the sub-env of a VectorSampler) whose env is reset, None
+                      if all the envs are reset
+        """
+        pass
+
     @property
     def is_training(self):
         """
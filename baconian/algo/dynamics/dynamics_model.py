@@ -12,7 +12,7 @@ from baconian.common.error import *
 from baconian.core.core import EnvSpec, Env
 from baconian.algo.dynamics.reward_func.reward_func import RewardFunc
 from baconian.algo.dynamics.terminal_func.terminal_func import TerminalFunc
-from copy import deepcopy
+from baconian.common.spaces import Box
 
 
 class DynamicsModel(Basic):
@@ -68,10 +68,45 @@ class DynamicsModel(Basic):
         self.state = new_state
         return new_state
 
+    @register_counter_info_to_status_decorator(increment=1, info_key='step_batch_counter')
+    def step_batch(self, action: np.ndarray, state: np.ndarray, allow_clip=False, **kwargs_for_transit):
+        """
+        Batched version of step, the first axis of action and state is the batch axis. The bound checks are done on
+        the whole batch and the model is evaluated once by _state_transit_batch. self.state is not changed.
+
+        :param action: batch of actions, (batch_size,) + action_shape
+        :param state: batch of states, (batch_size,) + obs_shape
+        :param allow_clip: clip the states, actions and new states into their spaces
+        :return: batch of new states, (batch_size,) + obs_shape
+        """
+        state = np.asarray(state).reshape((-1,) + tuple(self.env_spec.obs_shape))
+        action = np.asarray(action).reshape((len(state),) + tuple(self.env_spec.action_shape))
+        if allow_clip is True:
+            state = _clip_batch(self.env_spec.obs_space, state)
+            action = _clip_batch(self.env_spec.action_space, action)
+        assert _batch_contains(self.env_spec.action_space, action)
+        assert _batch_contains(self.env_spec.obs_space, state)
+        new_state = self._state_transit_batch(state=state, action=self.env_spec.action_space.flatten_n(action),
+                                              **kwargs_for_transit)
+        new_state = np.asarray(new_state).reshape((len(state),) + tuple(self.env_spec.obs_shape))
+        if allow_clip is True:
+            new_state = _clip_batch(self.env_spec.obs_space, new_state)
+        if _batch_contains(self.env_spec.obs_space, new_state) is False:
+            raise DynamicsNextStepOutputBoundError(
+                'new state {} out of bound of {}'.format(new_state, self.env_spec.obs_space.bound()))
+        return new_state
+
     @abc.abstractmethod
     def _state_transit(self, state, action, **kwargs) -> np.ndarray:
         raise NotImplementedError
 
+    def _state_transit_batch(self, state, action, **kwargs) -> np.ndarray:
+        """
+        Compute the new states of a batch of states and flat actions, models should override it with a vectorized
+        version, the default one calls _state_transit on each row.
+        """
+        return np.array([self._state_transit(state=st, action=ac, **kwargs) for st, ac in zip(state, action)])
+
     def copy_from(self, obj) -> bool:
         if not isinstance(obj, type(self)):
             raise TypeError('Wrong type of obj %s to be copied, which should be %s' % (type(obj), type(self)))
@@ -92,6 +127,18 @@ class DynamicsModel(Basic):
                                   name=self._name + '_env')
 
 
+def _batch_contains(space, x) -> bool:
+    if isinstance(space, Box):
+        return bool((x >= space.low).all() and (x <= space.high).all())
+    return all(space.contains(x_i) for x_i in x)
+
+
+def _clip_batch(space, x):
+    if isinstance(space, Box):
+        return np.clip(x, space.low, space.high)
+    return np.array([space.clip(x_i) if not space.contains(x_i) else x_i for x_i in x])
+
+
 class LocalDyanmicsModel(DynamicsModel):
     pass
 
@@ -136,7 +183,7 @@ class DerivableDynamics(object):
         if batch_flag:
             raise NotImplementedError
         node = key_or_node if isinstance(key_or_node, tf.Tensor) else self.input_node_dict[key_or_node]
-        if node not in self._grad_dict:
+        if node not in self._grad_dict[order]:
             if order == 1:
                 grad_op = [tf_batch_jacobian(output=o_node, inp=node) for o_node in self.output_node_list]
             else:
@@ -186,13 +233,34 @@ class DynamicsEnvWrapper(Env):
         self._terminal_func = None
 
     def step(self, action: np.ndarray, **kwargs):
+        """
+        If a batch of states is given with the state argument, the call is forwarded to step_batch.
+        """
+        if 'state' in kwargs and np.ndim(kwargs['state']) > len(self._dynamics.env_spec.obs_shape):
+            return self.step_batch(action=action, **kwargs)
         super().step(action)
-        state = deepcopy(self.get_state()) if 'state' not in kwargs else kwargs['state']
+        # the dynamics model does not modify the state in place, so no copy is needed
+        state = self.get_state() if 'state' not in kwargs else kwargs['state']
         new_state = self._dynamics.step(action=action, **kwargs)
         re = self._reward_func(state=state, new_state=new_state, action=action)
         terminal = self._terminal_func(state=state, action=action, new_state=new_state)
         return new_state, re, terminal, ()
 
+    def step_batch(self, action: np.ndarray, state: np.ndarray, **kwargs):
+        """
+        Step a batch of states with one call of the dynamics model, the first axis of action and state is the batch
+        axis.
+
+        :return: new states, rewards with shape (batch_size,), terminal signals with shape (batch_size,) and info
+        """
+        super().step(action)
+        state = np.asarray(state).reshape((-1,) + tuple(self._dynamics.env_spec.obs_shape))
+        action = np.asarray(action).reshape((len(state),) + tuple(self._dynamics.env_spec.action_shape))
+        new_state = self._dynamics.step_batch(action=action, state=state, **kwargs)
+        re = self._reward_func.call_batch(state=state, new_state=new_state, action=action)
+        terminal = self._terminal_func.call_batch(state=state, action=action, new_state=new_state)
+        return new_state, re, terminal, ()
+
     def reset(self):
         super(DynamicsEnvWrapper, self).reset()
         self._dynamics.reset_state()
@@ -53,6 +53,15 @@ class GaussianProcessDyanmicsModel(TrainableDyanmicsModel):
         else:
             return np.squeeze(deltas) + state
 
+    def _state_transit_batch(self, state, action, required_var=False, **kwargs):
+        # mgpr returns the predictions with shape (state_dim, batch_size, 1)
+        deltas, vars = self.mgpr_model.predict(x=np.concatenate([state, action], axis=1))
+        deltas = np.transpose(deltas[..., 0])
+        if required_var is True:
+            return deltas + state, np.transpose(vars[..., 0])
+        else:
+            return deltas + state
+
     def copy_from(self, obj) -> bool:
         raise NotImplementedError
         # return super().copy_from(obj)
@@ -27,6 +27,10 @@ class LinearDynamicsModel(GlobalDynamicsModel):
         new_state = np.dot(self.parameters('F'), np.concatenate((state, action))) + self.parameters('f')
         return self.env_spec.obs_space.clip(new_state)
 
+    def _state_transit_batch(self, state, action, **kwargs) -> np.ndarray:
+        new_state = np.dot(np.concatenate((state, action), axis=1), self.parameters('F').T) + self.parameters('f')
+        return np.clip(new_state, self.env_spec.obs_space.low, self.env_spec.obs_space.high)
+
     def make_copy(self):
         return LinearDynamicsModel(env_spec=self.env_spec,
                                    state_transition_matrix=deepcopy(self.parameters('F')),
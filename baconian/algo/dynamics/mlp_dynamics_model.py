@@ -11,12 +11,55 @@ import numpy as np
 from baconian.tf.util import *
 from baconian.algo.placeholder_input import PlaceholderInput
 import overrides
+import queue
+import threading
 
 from baconian.common.logging import record_return_decorator
+from baconian.common.profiler import profile_decorator
 from baconian.core.status import register_counter_info_to_status_decorator, StatusWithSubInfo
 from baconian.common.spaces.box import Box
 
 
+class _MinibatchPrefetcher(object):
+    """
+    Gather shuffled minibatches of a set of aligned arrays in a background thread, so the fancy indexing of the next
+    minibatch overlaps with the sess.run of the current one. The arrays are reshuffled every time an epoch is
+    exhausted, the last minibatch of an epoch may be smaller than batch_size.
+    """
+
+    def __init__(self, arrays: list, batch_size: int, queue_size: int = 4):
+        assert len(arrays) > 0 and batch_size > 0
+        self._arrays = arrays
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def _produce(self):
+        data_num = len(self._arrays[0])
+        while not self._stop_event.is_set():
+            index = np.random.permutation(data_num)
+            for start in range(0, data_num, self._batch_size):
+                batch_index = index[start: start + self._batch_size]
+                batch = [arr[batch_index] for arr in self._arrays]
+                while not self._stop_event.is_set():
+                    try:
+                        self._queue.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if self._stop_event.is_set():
+                    return
+
+    def get(self) -> list:
+        return self._queue.get()
+
+    def close(self):
+        self._stop_event.set()
+        self._thread.join()
+
+
 class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, PlaceholderInput,
                                        TrainableDyanmicsModel):
     STATUS_LIST = GlobalDynamicsModel.STATUS_LIST + ('TRAIN',)
@@ -31,7 +74,17 @@ class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, P
                  input_norm: np.ndarray = None,
                  output_low: np.ndarray = None,
                  output_high: np.ndarray = None,
-                 init_state=None):
+                 init_state=None,
+                 train_batch_size: int = None,
+                 validation_split: float = 0.0,
+                 early_stopping_patience: int = 5):
+        """
+
+        :param train_batch_size: minibatch size of train, if None, every train iteration is a full batch step on the
+        whole batch_data
+        :param validation_split: fraction of batch_data held out to early stop the minibatch train, 0.0 to disable it
+        :param early_stopping_patience: number of validations without improvement before the minibatch train stops
+        """
         if not isinstance(env_spec.obs_space, Box):
             raise TypeError('ContinuousMLPGlobalDynamicsModel only support to predict state that hold space Box type')
         GlobalDynamicsModel.__init__(self,
@@ -64,7 +117,10 @@ class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, P
                                                       rest_parameters=dict(output_low=output_low,
                                                                            output_high=output_high,
                                                                            input_norm=input_norm,
-                                                                           learning_rate=learning_rate))
+                                                                           learning_rate=learning_rate,
+                                                                           train_batch_size=train_batch_size,
+                                                                           validation_split=validation_split,
+                                                                           early_stopping_patience=early_stopping_patience))
         with tf.variable_scope(name_scope):
             with tf.variable_scope('train'):
                 new_state_output = mlp_net.output + state_input
@@ -108,17 +164,39 @@ class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, P
     def step(self, action: np.ndarray, state=None, **kwargs_for_transit):
         return super().step(action, state, **kwargs_for_transit)
 
+    @profile_decorator('dynamics/train')
     @record_return_decorator(which_recorder='self')
     @register_counter_info_to_status_decorator(increment=1, info_key='train_counter', under_status='TRAIN')
     @typechecked
     def train(self, batch_data: TransitionData, **kwargs) -> dict:
+        """
+        Train the model on batch_data. By default every train iteration is one Adam step on the whole batch_data.
+        If a batch size is given (train_batch_size of the model or batch_size in kwargs), every iteration is one step
+        on a minibatch drawn from epoch-wise shuffled data instead, and if a validation split is given the train
+        stops early once the loss on the held-out data has not improved for early_stopping_patience validations.
+
+        :param batch_data: transitions to fit
+        :param kwargs: sess, train_iter, batch_size, validation_split, early_stopping_patience and validation_interval
+        (steps between two validations, one epoch of the train split by default)
+        :return: dict of the average train loss, plus the best validation loss and the number of steps if the train is
+        done in minibatch
+        """
         self.set_status('TRAIN')
         tf_sess = kwargs['sess'] if ('sess' in kwargs and kwargs['sess']) else tf.get_default_session()
         train_iter = self.parameters('train_iter') if 'train_iter' not in kwargs else kwargs['train_iter']
+        batch_size = kwargs['batch_size'] if 'batch_size' in kwargs else self.parameters('train_batch_size')
+        state = batch_data.state_set
+        action = flatten_n(self.env_spec.action_space, batch_data.action_set)
+        delta_state = batch_data.new_state_set - state
+        if batch_size is not None:
+            extra_kwargs = {key: val for key, val in kwargs.items() if key not in ('sess', 'train_iter', 'batch_size')}
+            return self._train_with_minibatch(state=state, action=action, delta_state=delta_state,
+                                              train_iter=train_iter, batch_size=batch_size, sess=tf_sess,
+                                              **extra_kwargs)
         feed_dict = {
-            self.state_input: batch_data.state_set,
-            self.action_input: flatten_n(self.env_spec.action_space, batch_data.action_set),
-            self.delta_state_label_ph: batch_data.new_state_set - batch_data.state_set,
+            self.state_input: state,
+            self.action_input: action,
+            self.delta_state_label_ph: delta_state,
             **self.parameters.return_tf_parameter_feed_dict()
         }
         average_loss = 0.0
@@ -129,6 +207,62 @@ class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, P
             average_loss += loss
         return dict(average_loss=average_loss / train_iter)
 
+    def _train_with_minibatch(self, state, action, delta_state, train_iter, batch_size, sess, **kwargs) -> dict:
+        validation_split = kwargs['validation_split'] if 'validation_split' in kwargs else self.parameters(
+            'validation_split')
+        patience = kwargs['early_stopping_patience'] if 'early_stopping_patience' in kwargs else self.parameters(
+            'early_stopping_patience')
+        data_num = len(state)
+        validation_num = int(data_num * validation_split) if validation_split else 0
+        if validation_num >= data_num:
+            raise ValueError('validation_split {} leaves no data to train on'.format(validation_split))
+        index = np.random.permutation(data_num)
+        validation_index, train_index = index[:validation_num], index[validation_num:]
+        validation_interval = kwargs['validation_interval'] if 'validation_interval' in kwargs else int(
+            np.ceil(len(train_index) / batch_size))
+        tf_parameter_feed_dict = self.parameters.return_tf_parameter_feed_dict()
+        if validation_num > 0:
+            validation_feed_dict = {
+                self.state_input: state[validation_index],
+                self.action_input: action[validation_index],
+                self.delta_state_label_ph: delta_state[validation_index],
+                **tf_parameter_feed_dict
+            }
+        best_validation_loss = np.inf
+        validation_without_improvement = 0
+
+        prefetcher = _MinibatchPrefetcher(arrays=[state[train_index], action[train_index], delta_state[train_index]],
+                                          batch_size=batch_size)
+        average_loss = 0.0
+        step = 0
+        try:
+            while step < train_iter:
+                state_batch, action_batch, delta_state_batch = prefetcher.get()
+                loss, _ = sess.run([self.loss, self.optimize_op],
+                                   feed_dict={
+                                       self.state_input: state_batch,
+                                       self.action_input: action_batch,
+                                       self.delta_state_label_ph: delta_state_batch,
+                                       **tf_parameter_feed_dict
+                                   })
+                average_loss += loss
+                step += 1
+                if validation_num > 0 and step % validation_interval == 0:
+                    validation_loss = sess.run(self.loss, feed_dict=validation_feed_dict)
+                    if validation_loss < best_validation_loss:
+                        best_validation_loss = validation_loss
+                        validation_without_improvement = 0
+                    else:
+                        validation_without_improvement += 1
+                        if validation_without_improvement >= patience:
+                            break
+        finally:
+            prefetcher.close()
+        res = dict(average_loss=average_loss / max(step, 1), train_step=step)
+        if validation_num > 0:
+            res['validation_loss'] = best_validation_loss
+        return res
+
     def save(self, *args, **kwargs):
         return PlaceholderInput.save(self, *args, **kwargs)
 
@@ -156,6 +290,15 @@ class ContinuousMLPGlobalDynamicsModel(GlobalDynamicsModel, DerivableDynamics, P
                                 })
         return np.clip(np.squeeze(new_state), self.parameters('output_low'), self.parameters('output_high'))
 
+    def _state_transit_batch(self, state, action, **kwargs) -> np.ndarray:
+        tf_sess = kwargs['sess'] if 'sess' in kwargs else tf.get_default_session()
+        new_state = tf_sess.run(self.new_state_output,
+                                feed_dict={
+                                    self.action_input: action,
+                                    self.state_input: state
+                                })
+        return np.clip(new_state, self.parameters('output_low'), self.parameters('output_high'))
+
     def _setup_loss(self):
         reg_loss = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES, scope=self.name_scope)
         loss = tf.reduce_sum((self.mlp_net.output - self.delta_state_label_ph) ** 2) + reg_loss
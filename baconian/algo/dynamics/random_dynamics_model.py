@@ -20,5 +20,8 @@ class UniformRandomDynamicsModel(GlobalDynamicsModel):
     def _state_transit(self, state, action, **kwargs) -> np.ndarray:
         return self.env_spec.obs_space.sample()
 
+    def _state_transit_batch(self, state, action, **kwargs) -> np.ndarray:
+        return np.array([self.env_spec.obs_space.sample() for _ in range(len(state))])
+
     def make_copy(self):
         return UniformRandomDynamicsModel(env_spec=self.env_spec)
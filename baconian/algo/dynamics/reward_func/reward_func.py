@@ -13,6 +13,16 @@ class RewardFunc(Basic):
     def __call__(self, state, action, new_state, **kwargs) -> float:
         raise NotImplementedError
 
+    def call_batch(self, state, action, new_state, **kwargs) -> np.ndarray:
+        """
+        Rewards of a batch of transitions, the first axis of state, action and new_state is the batch axis.
+        Subclasses should override it with a vectorized version, the default one calls __call__ on each row.
+
+        :return: rewards with shape (batch_size,)
+        """
+        return np.array([self.__call__(state=st, action=ac, new_state=new_st, **kwargs)
+                         for st, ac, new_st in zip(state, action, new_state)], dtype=np.float64).reshape(-1)
+
     def init(self):
         pass
 
@@ -28,6 +38,9 @@ class RandomRewardFunc(RewardFunc):
     def __call__(self, state=None, action=None, new_state=None, **kwargs) -> float:
         return np.random.random()
 
+    def call_batch(self, state, action=None, new_state=None, **kwargs) -> np.ndarray:
+        return np.random.random(len(state))
+
 
 class CostFunc(RewardFunc):
     pass
@@ -44,6 +57,11 @@ class RewardFuncCostWrapper(CostFunc):
                                           action=action,
                                           new_state=new_state) * -1.0
 
+    def call_batch(self, state, action, new_state, **kwargs) -> np.ndarray:
+        return self._reward_func.call_batch(state=state,
+                                            action=action,
+                                            new_state=new_state) * -1.0
+
     def init(self):
         self._reward_func.init()
 
@@ -73,3 +91,19 @@ class QuadraticCostFunc(CostFunc):
             self.state_action_flat_dim, 1)
         res = 0.5 * np.dot(np.dot(u_s.T, self.C), u_s) + np.dot(u_s.T, self.c).reshape(())
         return float(res)
+
+    def call_batch(self, state=None, action=None, new_state=None, **kwargs) -> np.ndarray:
+        batch_size = len(state)
+        u_s = np.concatenate((np.reshape(state, (batch_size, -1)), np.reshape(action, (batch_size, -1))), axis=1)
+        return 0.5 * np.einsum('ni,ij,nj->n', u_s, self.C, u_s) + np.dot(u_s, self.c.reshape(-1))
+
+    def grad_and_hessian_batch(self, state, action, **kwargs):
+        """
+        Analytic gradient and hessian of the cost on [state, action] for a batch of inputs.
+
+        :return: gradients with shape (batch_size, dim) and hessians with shape (batch_size, dim, dim)
+        """
+        batch_size = len(state)
+        u_s = np.concatenate((np.reshape(state, (batch_size, -1)), np.reshape(action, (batch_size, -1))), axis=1)
+        sym_C = 0.5 * (self.C + self.C.T)
+        return np.dot(u_s, sym_C.T) + self.c.reshape(-1), np.repeat(sym_C[None], batch_size, axis=0)
@@ -13,6 +13,16 @@ class TerminalFunc(Basic):
     def __call__(self, state, action, new_state, **kwargs) -> bool:
         raise NotImplementedError
 
+    def call_batch(self, state, action, new_state, **kwargs) -> np.ndarray:
+        """
+        Terminal signals of a batch of transitions, the first axis of state, action and new_state is the batch axis.
+        Subclasses should override it with a vectorized version, the default one calls __call__ on each row.
+
+        :return: bool array with shape (batch_size,)
+        """
+        return np.array([self.__call__(state=st, action=ac, new_state=new_st, **kwargs)
+                         for st, ac, new_st in zip(state, action, new_state)], dtype=bool).reshape(-1)
+
     def init(self):
         pass
 
@@ -28,6 +38,9 @@ class RandomTerminalFunc(TerminalFunc):
     def __call__(self, state=None, action=None, new_state=None, **kwargs) -> bool:
         return np.random.random() > 0.5
 
+    def call_batch(self, state, action=None, new_state=None, **kwargs) -> np.ndarray:
+        return np.random.random(len(state)) > 0.5
+
 
 class FixedEpisodeLengthTerminalFunc(Basic):
 
@@ -42,3 +55,6 @@ class FixedEpisodeLengthTerminalFunc(Basic):
             return True
         else:
             return False
+
+    def call_batch(self, state, action=None, new_state=None, **kwargs) -> np.ndarray:
+        return np.full(len(state), self.__call__(), dtype=bool)
@@ -1,14 +1,25 @@
 import numpy as np
+import tensorflow as tf
 from scipy.linalg import inv
 from scipy.optimize import approx_fprime
 from baconian.core.core import EnvSpec
 from baconian.algo.dynamics.reward_func.reward_func import CostFunc
-from baconian.algo.dynamics.dynamics_model import DynamicsEnvWrapper
+from baconian.algo.dynamics.dynamics_model import DynamicsEnvWrapper, DerivableDynamics
 
 
 class iLQR(object):
 
-    def __init__(self, env_spec: EnvSpec, delta, T, dyn_model: DynamicsEnvWrapper, cost_fn: CostFunc):
+    def __init__(self, env_spec: EnvSpec, delta, T, dyn_model: DynamicsEnvWrapper, cost_fn: CostFunc,
+                 analytic_derivative=True):
+        """
+        :param delta: perturbation of the finite differences
+        :param T: horizon
+        :param dyn_model: dynamics model
+        :param cost_fn: cost function
+        :param analytic_derivative: use the tensorflow jacobian of a DerivableDynamics model and the
+                                    grad_and_hessian_batch method of the cost function when they are available,
+                                    otherwise the derivatives are computed by finite differences
+        """
 
         self.env_spec = env_spec
         self.min_factor = 2
@@ -19,6 +30,7 @@ class iLQR(object):
         self.T = T
         self.dyn_model = dyn_model
         self.cost_fn = cost_fn
+        self.analytic_derivative = analytic_derivative
         self.control_low = self.env_spec.action_space.low
         self.control_high = self.env_spec.action_space.high
         self.K, self.k, self.std = None, None, None
@@ -77,31 +89,73 @@ class iLQR(object):
 
     def differentiate(self, x_seq, u_seq):
 
-        "get gradient values using finite difference"
+        "get derivatives of all the time steps at once, the control of the last time step is zero"
 
-        C, F, c, f = [], [], [], []
-
-        for t in range(self.T - 1):
-            Ct, Ft, ct, ft = self.finite_difference(x_seq[t], u_seq[t])
-
-            C.append(Ct)
-            F.append(Ft)
-            c.append(ct)
-            f.append(ft)
-
-        "TODO : C, F, c, f for time step T are different. Why ?"
-
-        u = np.zeros((u_seq[0].shape))
-
-        Ct, Ft, ct, ft = self.finite_difference(x_seq[-1], u)
-
-        C.append(Ct)
-        F.append(Ft)
-        c.append(ct)
-        f.append(ft)
+        x_seq = np.asarray(x_seq)
+        u_seq = np.concatenate((np.reshape(u_seq, (-1,) + self.control_low.shape)[:self.T - 1],
+                                np.zeros((1,) + self.control_low.shape)), axis=0)
+        if self.analytic_derivative is True and isinstance(self.dyn_model, DerivableDynamics):
+            F = self._dynamics_jacobian(x_seq, u_seq)
+        else:
+            F = None
+        if self.analytic_derivative is True and hasattr(self.cost_fn, 'grad_and_hessian_batch'):
+            c, C = self.cost_fn.grad_and_hessian_batch(state=x_seq, action=u_seq)
+        else:
+            c, C = None, None
+        if F is None or c is None:
+            F_fd, c_fd, C_fd = self.batch_finite_difference(x_seq, u_seq, only_dynamics=c is not None)
+            F = F_fd if F is None else F
+            c, C = (c_fd, C_fd) if c is None else (c, C)
+        f = np.zeros((len(x_seq), x_seq.shape[1]))
 
         return C, F, c, f
 
+    def _dynamics_jacobian(self, x_seq, u_seq):
+        "jacobian of the new state on [x, u] for all time steps by one sess.run, the ops are cached by the model"
+        grad_x = self.dyn_model.grad_on_input_(self.dyn_model.state_input)[0]
+        grad_u = self.dyn_model.grad_on_input_(self.dyn_model.action_input)[0]
+        jac_x, jac_u = tf.get_default_session().run([grad_x, grad_u],
+                                                    feed_dict={self.dyn_model.state_input: x_seq,
+                                                               self.dyn_model.action_input: u_seq})
+        return np.concatenate((jac_x, jac_u), axis=2)
+
+    def batch_finite_difference(self, x_seq, u_seq, only_dynamics=False):
+        """
+        Central finite differences for all time steps, all the perturbed points are evaluated with one call of the
+        dynamics model and one call of the cost function.
+
+        :return: F with shape (T, n, n + m), cost gradient c (T, n + m) and hessian C (T, n + m, n + m)
+        """
+        n = x_seq.shape[1]
+        xu = np.concatenate((x_seq, u_seq), axis=1)
+        T, d = xu.shape
+        eye = np.eye(d) * self.delta
+        # (T, 2d, d): xu + delta * e_i, then xu - delta * e_i
+        grad_points = xu[:, None, :] + np.concatenate((eye, -eye), axis=0)[None]
+        points = [grad_points.reshape(-1, d)]
+        if not only_dynamics:
+            # (T, 4, d, d, d): xu + s_i * delta * e_i + s_j * delta * e_j for the four sign pairs (s_i, s_j)
+            signs = np.array([[1., 1.], [1., -1.], [-1., 1.], [-1., -1.]])
+            hessian_points = xu[:, None, None, None, :] + \
+                             signs[None, :, 0, None, None, None] * eye[None, None, :, None, :] + \
+                             signs[None, :, 1, None, None, None] * eye[None, None, None, :, :]
+            points.append(hessian_points.reshape(-1, d))
+        points = np.concatenate(points, axis=0)
+        next_x = self.dyn_model.step_batch(state=points[:, :n], action=points[:, n:], allow_clip=True)
+        next_x = np.reshape(next_x, (len(points), -1))
+
+        grad_next_x = next_x[:T * 2 * d].reshape(T, 2, d, -1)
+        F = np.transpose(grad_next_x[:, 0] - grad_next_x[:, 1], (0, 2, 1)) / (2 * self.delta)
+        if only_dynamics:
+            return F, None, None
+        cost = self.cost_fn.call_batch(state=points[:, :n], action=points[:, n:], new_state=next_x)
+        grad_cost = cost[:T * 2 * d].reshape(T, 2, d)
+        c = (grad_cost[:, 0] - grad_cost[:, 1]) / (2 * self.delta)
+        hessian_cost = cost[T * 2 * d:].reshape(T, 4, d, d)
+        C = (hessian_cost[:, 0] - hessian_cost[:, 1] - hessian_cost[:, 2] + hessian_cost[:, 3]) / (
+                4 * self.delta ** 2)
+        return F, c, C
+
     def backward(self, x_seq, u_seq):
 
         "initialize F_t, C_t, f_t, c_t, V_t, v_t"
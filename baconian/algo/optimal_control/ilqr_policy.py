@@ -24,14 +24,41 @@ class iLQRPolicy(DeterministicPolicy):
     @typechecked
     def __init__(self, env_spec: EnvSpec, T: int, delta: float, iteration: int, cost_fn: CostFunc,
                  dynamics_model_train_iter: int,
-                 dynamics: DynamicsEnvWrapper):
+                 dynamics: DynamicsEnvWrapper,
+                 receding_horizon: bool = False,
+                 cost_tolerance: float = None,
+                 replan_every: int = 1):
+        """
+
+        :param env_spec:
+        :param T: horizon
+        :param delta: perturbation of the finite differences
+        :param iteration: max number of backward/forward passes for one plan
+        :param cost_fn:
+        :param dynamics_model_train_iter:
+        :param dynamics:
+        :param receding_horizon: warm start each plan with the previous control sequence shifted by the number of
+                                 actions executed since it was planned
+        :param cost_tolerance: stop the passes when the relative improvement of the trajectory cost is below it
+        :param replan_every: plan once every replan_every actions, the actions in between are given by the cached
+                             feedback gains around the planned trajectory (closed-loop)
+        """
+        assert replan_every >= 1
         param = Parameters(parameters=dict(T=T, delta=delta,
                                            iteration=iteration,
-                                           dynamics_model_train_iter=dynamics_model_train_iter))
+                                           dynamics_model_train_iter=dynamics_model_train_iter,
+                                           receding_horizon=receding_horizon,
+                                           cost_tolerance=cost_tolerance,
+                                           replan_every=replan_every))
         super().__init__(env_spec, param)
         self.dynamics = dynamics
         self.U_hat = None
         self.X_hat = None
+        # number of actions emitted since the last plan, None if there is no valid plan
+        self._step_since_plan = None
+        # the plans of the rows > 0 of a batch (U_hat, X_hat, step since plan, feedback gains), the attributes above
+        # hold the one of row 0
+        self._row_plans = dict()
         self.iLqr_instance = iLQR_algo(env_spec=env_spec,
                                        delta=self.parameters('delta'),
                                        T=self.parameters('T'),
@@ -45,8 +72,13 @@ class iLQRPolicy(DeterministicPolicy):
             step = kwargs['step']
         else:
             step = None
-        for obs_i in obs:
-            action_i = self._forward(obs_i, step=step)
+        for i, obs_i in enumerate(obs):
+            # each row (e.g. each sub-env of a VectorSampler) is planned and warm started with its own trajectory
+            self._swap_plan(i)
+            try:
+                action_i = self._forward(obs_i, step=step)
+            finally:
+                self._swap_plan(i)
             action.append(action_i)
         return np.array(action)
 
@@ -64,7 +96,11 @@ class iLQRPolicy(DeterministicPolicy):
                           delta=self.parameters('delta'),
                           iteration=self.parameters('iteration'),
                           cost_fn=self.iLqr_instance.cost_fn,
-                          dynamics=dynamics)
+                          dynamics_model_train_iter=self.parameters('dynamics_model_train_iter'),
+                          dynamics=dynamics,
+                          receding_horizon=self.parameters('receding_horizon'),
+                          cost_tolerance=self.parameters('cost_tolerance'),
+                          replan_every=self.parameters('replan_every'))
 
     def init(self, source_obj=None):
         self.parameters.init()
@@ -74,19 +110,49 @@ class iLQRPolicy(DeterministicPolicy):
     def get_status(self):
         return super().get_status()
 
+    def reset(self, index: int = None):
+        """
+        Drop the cached plan, the next action will be planned from scratch.
+
+        :param index: row of the batched observations whose plan is dropped, all of them if None
+        """
+        if index is None or index == 0:
+            self.U_hat = None
+            self.X_hat = None
+            self._step_since_plan = None
+        if index is None:
+            self._row_plans = dict()
+        else:
+            self._row_plans.pop(index, None)
+
+    def _swap_plan(self, row):
+        # exchange the plan of the row with the one held by the attributes, calling it twice restores them
+        if row == 0:
+            return
+        plan = self._row_plans.get(row, (None, None, None, None))
+        self._row_plans[row] = (self.U_hat, self.X_hat, self._step_since_plan, self.iLqr_instance.K)
+        self.U_hat, self.X_hat, self._step_since_plan, self.iLqr_instance.K = plan
+
     def _forward(self, obs, step: None):
-        if not step:
+        obs = np.array(obs)
+        if self._step_since_plan is not None and self._step_since_plan < min(self.parameters('replan_every'),
+                                                                             self.T - 1):
+            # closed-loop control around the cached trajectory, no re-optimization
+            t = self._step_since_plan
+            self._step_since_plan += 1
+            u = self.U_hat[t] + np.dot(self.iLqr_instance.K[t], obs - self.X_hat[t])
+            return np.clip(u, self.iLqr_instance.control_low, self.iLqr_instance.control_high)
+
+        if self.parameters('receding_horizon') is True and self.U_hat is not None:
+            # warm start: drop the actions executed since the last plan and pad with the last one
+            shift = self._step_since_plan if self._step_since_plan is not None else 1
+            self.U_hat = np.concatenate((self.U_hat[shift:], np.repeat(self.U_hat[-1:], shift, axis=0)), axis=0)
+            self.X_hat = self._rollout(obs, self.U_hat)
+        elif not step or self.U_hat is None:
             self.U_hat = np.reshape([np.zeros(self.action_space.sample().shape) for _ in range(self.T - 1)],
                                     (self.T - 1, self.action_space.shape[0]))
-
-            self.X_hat = []
-            self.X_hat.append(obs)
-            x = obs
-            for i in range(self.T - 1):
-                next_obs, _, _, _ = self.dynamics.step(action=self.U_hat[i, :], state=x, allow_clip=True)
-                self.X_hat.append(next_obs)
-                x = next_obs
-            self.X_hat = np.array(self.X_hat)
+            self.X_hat = self._rollout(obs, self.U_hat)
+        cost = self._trajectory_cost(self.X_hat, self.U_hat)
         for i in range(self.parameters('iteration')):
             self.iLqr_instance.backward(self.X_hat, self.U_hat)
             x = obs
@@ -102,8 +168,25 @@ class iLQRPolicy(DeterministicPolicy):
             X[-1] = x
             self.X_hat = X
             self.U_hat = U
+            new_cost = self._trajectory_cost(self.X_hat, self.U_hat)
+            if self.parameters('cost_tolerance') is not None and \
+                    cost - new_cost < self.parameters('cost_tolerance') * max(abs(cost), 1e-8):
+                break
+            cost = new_cost
+        self._step_since_plan = 1
         return self.U_hat[0]
 
+    def _rollout(self, obs, U):
+        X = [obs]
+        x = obs
+        for i in range(self.T - 1):
+            x, _, _, _ = self.dynamics.step(action=U[i], state=x, allow_clip=True)
+            X.append(x)
+        return np.array(X)
+
+    def _trajectory_cost(self, X, U):
+        return float(np.sum(self.iLqr_instance.cost_fn.call_batch(state=X[:-1], action=U, new_state=X[1:])))
+
     @property
     def T(self):
         return self.parameters('T')
@@ -125,6 +208,10 @@ class iLQRAlogWrapper(ModelBasedAlgo):
     def append_to_memory(self, *args, **kwargs):
         pass
 
+    def reset_episode(self, index: int = None):
+        # the cached plan belongs to the finished episode
+        self.policy.reset(index=index)
+
     def init(self):
         self.policy.init()
         self.dynamics_env.init()
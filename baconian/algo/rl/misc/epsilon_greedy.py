@@ -28,6 +28,13 @@ class EpsilonGreedy(ExplorationStrategy):
                                      name='eps_greedy_params')
 
     def predict(self, **kwargs):
+        if kwargs.get('batch_flag', False) is True:
+            # one query of the algo for the whole batch, then each row is replaced by a random action independently
+            algo = kwargs.pop('algo')
+            action = list(algo.predict(**kwargs))
+            for i in np.nonzero(np.random.random(len(action)) < self.parameters('random_prob_func')())[0]:
+                action[i] = self.action_space.sample()
+            return action
         if np.random.random() < self.parameters('random_prob_func')():
             return self.action_space.sample()
         else:
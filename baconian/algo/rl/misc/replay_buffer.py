@@ -2,6 +2,8 @@ import numpy as np
 from typeguard import typechecked
 from baconian.common.sampler.sample_data import TransitionData, TrajectoryData, SampleData
 from baconian.common.error import *
+from baconian.common.replay_buffer import SumSegmentTree, MinSegmentTree
+from baconian.common.profiler import profile_decorator
 
 
 class RingBuffer(object):
@@ -35,12 +37,27 @@ class RingBuffer(object):
             raise RuntimeError()
         self.data[(self.start + self.length - 1) % self.maxlen] = v
 
-
-def array_min2d(x):
-    x = np.array(x)
-    if x.ndim >= 2:
-        return x
-    return x.reshape(-1, 1)
+    def extend(self, values):
+        """
+        Append a batch of values (first axis as the batch axis) with at most two slice assignments.
+        """
+        count = len(values)
+        if count == 0:
+            return
+        if count >= self.maxlen:
+            self.data[:] = values[count - self.maxlen:]
+            self.start = 0
+            self.length = self.maxlen
+            return
+        end = (self.start + self.length) % self.maxlen
+        first_part = min(count, self.maxlen - end)
+        self.data[end: end + first_part] = values[:first_part]
+        self.data[:count - first_part] = values[first_part:]
+        if self.length + count > self.maxlen:
+            self.start = (self.start + self.length + count - self.maxlen) % self.maxlen
+            self.length = self.maxlen
+        else:
+            self.length += count
 
 
 class BaseReplayBuffer(object):
@@ -58,6 +75,7 @@ class BaseReplayBuffer(object):
     def sample(self, batch_size):
         raise NotImplementedError
 
+    @profile_decorator('replay_buffer/insert')
     def append(self, obs0, obs1, action, reward, terminal1, training=True):
         if not training:
             return
@@ -67,6 +85,21 @@ class BaseReplayBuffer(object):
         self.observations1.append(obs1)
         self.terminals1.append(terminal1)
 
+    @profile_decorator('replay_buffer/insert')
+    @typechecked
+    def extend(self, samples: TransitionData, training=True):
+        """
+        Insert all the transitions in samples, each ring buffer is filled by one slice assignment instead of calling
+        append row by row.
+        """
+        if not training:
+            return
+        self.observations0.extend(samples.state_set)
+        self.actions.extend(samples.action_set)
+        self.rewards.extend(samples.reward_set)
+        self.observations1.extend(samples.new_state_set)
+        self.terminals1.extend(samples.done_set)
+
     @property
     def nb_entries(self):
         return len(self.observations0)
@@ -84,6 +117,7 @@ class UniformRandomReplayBuffer(BaseReplayBuffer):
     def __init__(self, limit, action_shape, observation_shape):
         super().__init__(limit, action_shape, observation_shape)
 
+    @profile_decorator('replay_buffer/sample')
     def sample(self, batch_size) -> SampleData:
         if self.nb_entries < batch_size:
             raise MemoryBufferLessThanBatchSizeError()
@@ -96,16 +130,100 @@ class UniformRandomReplayBuffer(BaseReplayBuffer):
         reward_batch = self.rewards.get_batch(batch_idxs)
         terminal1_batch = self.terminals1.get_batch(batch_idxs)
 
-        result = {
-            'obs0': array_min2d(obs0_batch),
-            'obs1': array_min2d(obs1_batch),
-            'rewards': array_min2d(reward_batch),
-            'actions': array_min2d(action_batch),
-            'terminals1': array_min2d(terminal1_batch),
-        }
+        res = TransitionData(obs_shape=self.obs_shape, action_shape=self.action_shape)
+        res.append_batch(state=obs0_batch,
+                         new_state=obs1_batch,
+                         action=action_batch,
+                         done=terminal1_batch,
+                         reward=reward_batch)
+        return res
+
+
+class PrioritizedReplayBuffer(BaseReplayBuffer):
+    """
+    Proportional prioritized replay (Schaul et al., 2015). The priorities of all the slots of the ring buffers are
+    kept in numpy segment trees, so sampling a batch, computing its importance weights and updating its priorities
+    are all done with batched array operations. The sampled TransitionData carries two extra sets: ``weight_set``
+    (importance sampling weights) and ``index_set`` (slot indexes to pass back to ``update_priorities``).
+    """
+
+    def __init__(self, limit, action_shape, observation_shape, alpha=0.6, beta=0.4, eps=1e-6):
+        super().__init__(limit, action_shape, observation_shape)
+        assert alpha >= 0
+        self.alpha = alpha
+        self.beta = beta
+        self.eps = eps
+        it_capacity = 1
+        while it_capacity < limit:
+            it_capacity *= 2
+        self._it_sum = SumSegmentTree(it_capacity)
+        self._it_min = MinSegmentTree(it_capacity)
+        self._max_priority = 1.0
+
+    def append(self, obs0, obs1, action, reward, terminal1, training=True):
+        if not training:
+            return
+        slot = self._next_slot()
+        super().append(obs0, obs1, action, reward, terminal1, training)
+        self._set_priorities(np.array([slot]), self._max_priority)
+
+    @typechecked
+    def extend(self, samples: TransitionData, training=True):
+        if not training or len(samples) == 0:
+            return
+        count = len(samples)
+        slots = np.arange(self.limit) if count >= self.limit else (self._next_slot() + np.arange(count)) % self.limit
+        super().extend(samples, training)
+        self._set_priorities(slots, self._max_priority)
+
+    @profile_decorator('replay_buffer/sample')
+    def sample(self, batch_size, beta=None) -> SampleData:
+        if self.nb_entries < batch_size:
+            raise MemoryBufferLessThanBatchSizeError()
+        beta = self.beta if beta is None else beta
+        p_total = self._it_sum.sum()
+        # stratified sampling, one uniform draw in each of batch_size equal segments of the total priority mass
+        mass = (np.random.random(batch_size) + np.arange(batch_size)) * (p_total / batch_size)
+        # a float rounding overshoot of the prefix sum must not pick an empty slot before the buffer is full
+        slots = np.minimum(self._it_sum.find_prefixsum_idx(mass), self.nb_entries - 1)
+
+        p_min = self._it_min.min() / p_total
+        max_weight = (p_min * self.nb_entries) ** (-beta)
+        p_sample = self._it_sum[slots] / p_total
+        weights = (p_sample * self.nb_entries) ** (-beta) / max_weight
 
         res = TransitionData(obs_shape=self.obs_shape, action_shape=self.action_shape)
-        for obs0, obs1, action, terminal, re in zip(result['obs0'], result['obs1'], result['actions'],
-                                                    result['terminals1'], result['rewards']):
-            res.append(state=obs0, new_state=obs1, action=action, done=terminal, reward=re)
+        res.append_batch(state=self.observations0.data[slots],
+                         new_state=self.observations1.data[slots],
+                         action=self.actions.data[slots],
+                         done=self.terminals1.data[slots],
+                         reward=self.rewards.data[slots])
+        res.append_new_set(name='weight_set', data_set=weights.astype(np.float32), shape=[])
+        res.append_new_set(name='index_set', data_set=slots, shape=[])
         return res
+
+    def update_priorities(self, idxes, priorities):
+        """
+        Set the priorities (e.g. absolute TD errors) of the slots returned in ``index_set`` of a sampled batch.
+        """
+        idxes = np.asarray(idxes, dtype=np.int64).reshape(-1)
+        priorities = np.abs(np.asarray(priorities, dtype=np.float64).reshape(-1)) + self.eps
+        assert len(idxes) == len(priorities)
+        if len(idxes) == 0:
+            return
+        assert np.all(idxes >= 0) and np.all(idxes < self.limit)
+        self._set_priorities(idxes, priorities)
+        self._max_priority = max(self._max_priority, np.max(priorities))
+
+    def reset(self):
+        super().reset()
+        self._it_sum = SumSegmentTree(self._it_sum._capacity)
+        self._it_min = MinSegmentTree(self._it_min._capacity)
+        self._max_priority = 1.0
+
+    def _next_slot(self):
+        return (self.observations0.start + self.observations0.length) % self.limit
+
+    def _set_priorities(self, slots, priorities):
+        self._it_sum[slots] = priorities ** self.alpha
+        self._it_min[slots] = priorities ** self.alpha
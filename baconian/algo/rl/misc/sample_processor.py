@@ -10,48 +10,65 @@ def discount(x, gamma):
     return scipy.signal.lfilter([1.0], [1.0, -gamma], x[::-1])[::-1]
 
 
+def segment_discount(x, gamma, episode_offsets):
+    """
+    Discounted forward sum of several sequences concatenated in x, the sum of each sequence stops at its end.
+    One lfilter runs over the whole x, then the part carried over from the following sequences,
+    gamma ** (end - t) * y[end], is removed from each point.
+
+    :param x: 1-d array of the concatenated sequences
+    :param gamma: discount factor
+    :param episode_offsets: start of each sequence in x followed by len(x), see TrajectoryData.episode_offsets
+    :return: 1-d array of the discounted sums, aligned with x
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = discount(x, gamma)
+    episode_offsets = np.asarray(episode_offsets)
+    lengths = np.diff(episode_offsets)
+    end = np.repeat(episode_offsets[1:], lengths)
+    carry = np.append(y, 0.0)[end]
+    return y - np.power(gamma, end - np.arange(len(x))) * carry
+
+
 class SampleProcessor(object):
 
     @staticmethod
     def add_gae(data: TrajectoryData, gamma, lam, value_func: ValueFunction = None, name='advantage_set'):
-        for traj in data.trajectories:
-            # scale if gamma less than 1
-            rewards = traj('reward_set') * (1 - gamma) if gamma < 0.999 else traj('reward_set')
-            try:
-                traj('v_value_set')
-            except ValueError:
-                if value_func is None:
-                    raise ValueError('v_value_set did not existed, pass in value_func parameter to compute v_value_set')
-                SampleProcessor.add_estimated_v_value(
-                    data=traj,
-                    value_func=value_func
-                )
-            finally:
-                values = traj('v_value_set')
-            # todo better way to handle shape error (no squeeze)
-            tds = np.squeeze(rewards) - np.squeeze(values) + np.append(values[1:] * gamma, 0)
-            advantages = discount(tds, gamma * lam)
-            traj.append_new_set(name=name, data_set=make_batch(advantages, original_shape=[]), shape=[])
+        try:
+            data('v_value_set')
+        except ValueError:
+            if value_func is None:
+                raise ValueError('v_value_set did not existed, pass in value_func parameter to compute v_value_set')
+            SampleProcessor.add_estimated_v_value(
+                data=data,
+                value_func=value_func
+            )
+        episode_offsets = data.episode_offsets
+        # scale if gamma less than 1
+        rewards = np.reshape(data('reward_set'), [-1])
+        rewards = rewards * (1 - gamma) if gamma < 0.999 else rewards
+        values = np.reshape(data('v_value_set'), [-1])
+        next_values = np.append(values[1:], 0.0)
+        # no bootstrap from the first state of the next trajectory
+        next_values[episode_offsets[1:] - 1] = 0.0
+        tds = rewards - values + next_values * gamma
+        data.append_new_set(name=name, data_set=segment_discount(tds, gamma * lam, episode_offsets), shape=[])
 
     @staticmethod
     def add_discount_sum_reward(data: TrajectoryData, gamma, name='discount_set'):
-        for traj in data.trajectories:
-            # scale if gamma less than 1
-            dis_set = traj('reward_set') * (1 - gamma) if gamma < 0.999 else traj('reward_set')
-            dis_set = discount(dis_set, gamma)
-            traj.append_new_set(name=name, data_set=make_batch(dis_set, original_shape=[]), shape=[])
+        # scale if gamma less than 1
+        rewards = np.reshape(data('reward_set'), [-1])
+        rewards = rewards * (1 - gamma) if gamma < 0.999 else rewards
+        data.append_new_set(name=name, data_set=segment_discount(rewards, gamma, data.episode_offsets), shape=[])
 
     @staticmethod
     def add_estimated_v_value(data: (TrajectoryData, TransitionData), value_func: ValueFunction, name='v_value_set'):
-        if isinstance(data, TrajectoryData):
-            for path in data.trajectories:
-                SampleProcessor._add_estimated_v_value(path, value_func, name)
-        else:
-            SampleProcessor._add_estimated_v_value(data, value_func, name)
+        # the sets of a TrajectoryData are the flattened sets of all the trajectories, so one call covers all of them
+        SampleProcessor._add_estimated_v_value(data, value_func, name)
 
     @staticmethod
-    def _add_estimated_v_value(data: TransitionData, value_func: ValueFunction, name):
-        v_set = value_func.forward(data.state_set)
+    def _add_estimated_v_value(data: (TrajectoryData, TransitionData), value_func: ValueFunction, name):
+        v_set = value_func.forward(data('state_set'))
         data.append_new_set(name=name, data_set=make_batch(np.array(v_set), original_shape=[]), shape=[])
 
     @staticmethod
@@ -1,3 +1,4 @@
+import numpy as np
 from baconian.algo.rl.rl_algo import ModelBasedAlgo
 from baconian.algo.dynamics.dynamics_model import DynamicsModel
 from baconian.config.dict_config import DictConfig
@@ -11,10 +12,31 @@ from baconian.algo.rl.policy.policy import Policy
 from baconian.common.logging import ConsoleLogger
 from baconian.common.sampler.sample_data import TransitionData
 from baconian.common.logging import record_return_decorator
+from baconian.common.spaces import Box
 
 
 class ModelPredictiveControl(ModelBasedAlgo):
+    """
+    Model predictive control with a batched planner: all the SAMPLED_PATH_NUM candidate paths are rolled out together
+    on the dynamics model, one (SAMPLED_PATH_NUM, obs_dim) batch per horizon step, and the first action of the best
+    path is returned.
+
+    The planner is selected by the optional config key PLANNER:
+
+    - 'random_shooting' (default): the actions of the paths come from the policy.
+    - 'cem': cross entropy method, the action sequences are drawn from a gaussian which is refitted to the
+      CEM_ELITE_NUM best sequences for CEM_ITERATION iterations.
+    - 'mppi': same as 'cem' but the gaussian mean is the average of all the sequences weighted by
+      exp(return / MPPI_TEMPERATURE).
+
+    'cem' and 'mppi' only support Box action space.
+    """
     required_key_dict = DictConfig.load_json(file_path=GlobalConfig().DEFAULT_MPC_REQUIRED_KEY_LIST)
+    PLANNER_LIST = ('random_shooting', 'cem', 'mppi')
+    DEFAULT_PLANNER_CONFIG = dict(PLANNER='random_shooting',
+                                  CEM_ITERATION=5,
+                                  CEM_ELITE_NUM=5,
+                                  MPPI_TEMPERATURE=1.0)
 
     def __init__(self, env_spec, dynamics_model: DynamicsModel,
                  config_or_config_dict: (DictConfig, dict),
@@ -24,9 +46,15 @@ class ModelPredictiveControl(ModelBasedAlgo):
         super().__init__(env_spec, dynamics_model, name)
         self.config = construct_dict_config(config_or_config_dict, self)
         self.policy = policy
-        self.parameters = Parameters(parameters=dict(),
+        self.parameters = Parameters(parameters={key: val for key, val in self.DEFAULT_PLANNER_CONFIG.items() if
+                                                 key not in self.config.config_dict},
                                      source_config=self.config,
                                      name=name + '_' + 'mpc_param')
+        if self.parameters('PLANNER') not in self.PLANNER_LIST:
+            raise ValueError('planner {} is not supported, use one of {}'.format(self.parameters('PLANNER'),
+                                                                                self.PLANNER_LIST))
+        if self.parameters('PLANNER') != 'random_shooting' and not isinstance(self.env_spec.action_space, Box):
+            raise TypeError('planner {} only supports Box action space'.format(self.parameters('PLANNER')))
         self.memory = TransitionData(env_spec=env_spec)
 
     def init(self, source_obj=None):
@@ -59,22 +87,69 @@ class ModelPredictiveControl(ModelBasedAlgo):
     def predict(self, obs, **kwargs):
         if self.is_training is True:
             return self.env_spec.action_space.sample()
-        rollout = TrajectoryData(env_spec=self.env_spec)
-        state = obs
-        for i in range(self.parameters('SAMPLED_PATH_NUM')):
-            path = TransitionData(env_spec=self.env_spec)
-            # todo terminal_func signal problem to be consider?
-            for _ in range(self.parameters('SAMPLED_HORIZON')):
-                ac = self.policy.forward(obs=state)
-                new_state, re, done, _ = self.dynamics_env.step(action=ac, state=state)
-                path.append(state=state, action=ac, new_state=new_state, reward=re, done=done)
-                state = new_state
-            rollout.append(path)
-        rollout.trajectories.sort(key=lambda x: x.cumulative_reward, reverse=True)
-        ac = rollout.trajectories[0].action_set[0]
+        state = np.repeat(np.expand_dims(np.array(obs).reshape(self.env_spec.obs_shape), axis=0),
+                          repeats=self.parameters('SAMPLED_PATH_NUM'), axis=0)
+        if self.parameters('PLANNER') == 'random_shooting':
+            path_return, path_action = self._rollout(state=state)
+            ac = path_action[np.argmax(path_return)][0]
+        else:
+            ac = self._plan_with_action_distribution(state=state)
         assert self.env_spec.action_space.contains(ac)
         return ac
 
+    def _plan_with_action_distribution(self, state):
+        """
+        CEM/MPPI refinement of a gaussian over the action sequences, each iteration evaluates all the sampled
+        sequences with one batched rollout.
+        """
+        path_num = self.parameters('SAMPLED_PATH_NUM')
+        horizon = self.parameters('SAMPLED_HORIZON')
+        low, high = self.env_spec.action_space.bounds
+        mean = np.tile((low + high) / 2.0, (horizon,) + (1,) * len(low.shape))
+        std = np.tile((high - low) / 4.0, (horizon,) + (1,) * len(low.shape))
+        for _ in range(self.parameters('CEM_ITERATION')):
+            action_seq = np.clip(mean + std * np.random.randn(path_num, *mean.shape), low, high)
+            path_return, _ = self._rollout(state=state, action_seq=action_seq)
+            if self.parameters('PLANNER') == 'cem':
+                elite = action_seq[np.argsort(path_return)[-self.parameters('CEM_ELITE_NUM'):]]
+                mean, std = elite.mean(axis=0), elite.std(axis=0)
+            else:
+                weight = np.exp((path_return - np.max(path_return)) / self.parameters('MPPI_TEMPERATURE'))
+                weight /= np.sum(weight)
+                mean = np.tensordot(weight, action_seq, axes=1)
+        return np.clip(mean[0], low, high).astype(self.env_spec.action_space.low.dtype)
+
+    def _rollout(self, state, action_seq=None):
+        """
+        Roll out all the paths together on the dynamics model, rewards after a terminal signal are not counted.
+
+        :param state: start states of the paths, first axis as the path axis
+        :param action_seq: (path_num, horizon) + action_shape, if None the actions are given by the policy
+        :return: return of each path and the actions taken, (path_num, horizon) + action_shape
+        """
+        path_num = len(state)
+        path_return = np.zeros(path_num)
+        alive = np.ones(path_num, dtype=bool)
+        path_action = []
+        for t in range(self.parameters('SAMPLED_HORIZON')):
+            ac = action_seq[:, t] if action_seq is not None else self._policy_batch_forward(state)
+            new_state, re, done = self._batch_step(state=state, action=ac)
+            path_return += re * alive
+            alive &= np.logical_not(done)
+            path_action.append(ac)
+            state = new_state
+        return path_return, np.stack(path_action, axis=1)
+
+    def _policy_batch_forward(self, state):
+        ac = np.asarray(self.policy.forward(obs=state))
+        # policies which return one action regardless of the batch (e.g. constant action) are broadcast
+        return np.broadcast_to(ac.reshape((-1,) + tuple(self.env_spec.action_shape)),
+                               (len(state),) + tuple(self.env_spec.action_shape)).copy()
+
+    def _batch_step(self, state, action):
+        new_state, re, done, _ = self.dynamics_env.step_batch(action=action, state=state)
+        return new_state, re, done
+
     def append_to_memory(self, samples: TransitionData):
         self.memory.union(samples)
 
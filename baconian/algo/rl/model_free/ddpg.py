@@ -2,7 +2,8 @@ from baconian.core.core import EnvSpec
 from baconian.algo.rl.rl_algo import ModelFreeAlgo, OffPolicyAlgo
 from baconian.config.dict_config import DictConfig
 from baconian.algo.rl.value_func.mlp_q_value import MLPQValueFunction
-from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, BaseReplayBuffer
+from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, BaseReplayBuffer, \
+    PrioritizedReplayBuffer
 import tensorflow as tf
 import tensorflow.contrib as tf_contrib
 from baconian.common.sampler.sample_data import TransitionData, TrajectoryData
@@ -13,6 +14,7 @@ from baconian.algo.rl.policy.deterministic_mlp import DeterministicMLPPolicy
 from baconian.tf.util import *
 from baconian.common.misc import *
 from baconian.common.logging import record_return_decorator
+from baconian.common.profiler import profile_decorator
 from baconian.core.status import register_counter_info_to_status_decorator
 from baconian.algo.placeholder_input import MultiPlaceholderInput
 from baconian.common.error import *
@@ -30,11 +32,18 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
                  policy: DeterministicMLPPolicy,
                  schedule_param_list=None,
                  name='ddpg',
-                 replay_buffer=None):
+                 replay_buffer=None,
+                 fused_update: bool = False):
+        """
+
+        :param fused_update: train with one sess.run per iteration which computes the target Q in the graph and
+        updates the critic, the actor and (at the last iteration) the target networks together, see _fused_train
+        """
         ModelFreeAlgo.__init__(self, env_spec=env_spec, name=name)
         config = construct_dict_config(config_or_config_dict, self)
 
         self.config = config
+        self.fused_update = fused_update
         self.actor = policy
         self.target_actor = self.actor.make_copy(name_scope='{}_target_actor'.format(self.name),
                                                  name='{}_target_actor'.format(self.name),
@@ -47,7 +56,7 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         self.state_input = self.actor.state_input
 
         if replay_buffer:
-            assert issubclass(replay_buffer, BaseReplayBuffer)
+            assert isinstance(replay_buffer, BaseReplayBuffer)
             self.replay_buffer = replay_buffer
         else:
             self.replay_buffer = UniformRandomReplayBuffer(limit=self.config('REPLAY_BUFFER_SIZE'),
@@ -71,6 +80,8 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
 
         with tf.variable_scope(name):
             self.reward_input = tf.placeholder(shape=[None, 1], dtype=tf.float32)
+            # importance sampling weights of a prioritized replay batch, all ones by default
+            self.weight_input = tf.placeholder_with_default(tf.ones_like(self.reward_input), shape=[None, 1])
             self.next_state_input = tf.placeholder(shape=[None, self.env_spec.flat_obs_dim], dtype=tf.float32)
             self.done_input = tf.placeholder(shape=[None, 1], dtype=tf.bool)
             self.target_q_input = tf.placeholder(shape=[None, 1], dtype=tf.float32)
@@ -81,6 +92,8 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
                 self.critic_grads = self._setup_critic_loss()
                 self.actor_loss, self.actor_update_op, self.target_actor_update_op, self.action_optimizer, \
                 self.actor_grads = self._set_up_actor_loss()
+        if fused_update is True:
+            self._set_up_fused_update()
 
         var_list = get_tf_collection_var_list(
             '{}/train'.format(name)) + self.critic_optimizer.variables() + self.action_optimizer.variables()
@@ -111,6 +124,7 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
             self.copy_from(source_obj)
         super().init()
 
+    @profile_decorator('ddpg/train')
     @record_return_decorator(which_recorder='self')
     @register_counter_info_to_status_decorator(increment=1, info_key='train', under_status='TRAIN')
     @typechecked
@@ -122,12 +136,16 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         train_iter = self.parameters("TRAIN_ITERATION") if not train_iter else train_iter
         average_critic_loss = 0.0
         average_actor_loss = 0.0
+        prioritized = batch_data is None and isinstance(self.replay_buffer, PrioritizedReplayBuffer)
+        if self.fused_update is True:
+            return self._fused_train(batch_data, train_iter, tf_sess, update_target=update_target,
+                                     prioritized=prioritized)
         for i in range(train_iter):
             train_batch = self.replay_buffer.sample(
                 batch_size=self.parameters('BATCH_SIZE')) if batch_data is None else batch_data
             assert isinstance(train_batch, TransitionData)
 
-            critic_loss, _ = self._critic_train(train_batch, tf_sess)
+            critic_loss, _ = self._critic_train(train_batch, tf_sess, prioritized=prioritized)
 
             actor_loss, _ = self._actor_train(train_batch, tf_sess)
 
@@ -138,7 +156,7 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         return dict(average_actor_loss=average_actor_loss / train_iter,
                     average_critic_loss=average_critic_loss / train_iter)
 
-    def _critic_train(self, batch_data, sess) -> ():
+    def _critic_train(self, batch_data, sess, prioritized=False) -> ():
         target_q = sess.run(
             self._target_critic_with_target_actor_output.q_tensor,
             feed_dict={
@@ -146,18 +164,22 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
                 self.target_actor.state_input: batch_data.new_state_set
             }
         )
-        loss, _, grads = sess.run(
-            [self.critic_loss, self.critic_update_op, self.critic_grads
-             ],
-            feed_dict={
-                self.target_q_input: target_q,
-                self.critic.state_input: batch_data.state_set,
-                self.critic.action_input: batch_data.action_set,
-                self.done_input: batch_data.done_set,
-                self.reward_input: batch_data.reward_set,
-                **self.parameters.return_tf_parameter_feed_dict()
-            }
+        feed_dict = {
+            self.target_q_input: target_q,
+            self.critic.state_input: batch_data.state_set,
+            self.critic.action_input: batch_data.action_set,
+            self.done_input: batch_data.done_set,
+            self.reward_input: batch_data.reward_set,
+            **self.parameters.return_tf_parameter_feed_dict()
+        }
+        if prioritized:
+            feed_dict[self.weight_input] = np.reshape(batch_data('weight_set'), [-1, 1])
+        loss, td_error, _, grads = sess.run(
+            [self.critic_loss, self.td_error, self.critic_update_op, self.critic_grads],
+            feed_dict=feed_dict
         )
+        if prioritized:
+            self.replay_buffer.update_priorities(idxes=batch_data('index_set'), priorities=td_error)
         return loss, grads
 
     def _actor_train(self, batch_data, sess) -> ():
@@ -171,6 +193,54 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         )
         return loss, grads
 
+    def _fused_train(self, batch_data, train_iter, sess, update_target, prioritized) -> dict:
+        """
+        The minibatches of the iterations are staged into the graph with one sess.run, then each iteration is one
+        sess.run feeding only the index of its minibatch. At most train_iter minibatches are staged, fewer if the
+        replay buffer does not hold that many yet, in which case the iterations cycle over them. A prioritized batch is
+        fed directly instead since its priorities have to be updated before the next one is sampled.
+        """
+        param_feed_dict = self.parameters.return_tf_parameter_feed_dict()
+        batch_size = len(batch_data) if batch_data is not None else self.parameters('BATCH_SIZE')
+        # a given batch_data is staged once and trained on for all the iterations
+        staged_num = 1
+        if not prioritized:
+            if batch_data is None:
+                staged_num = max(1, min(train_iter, self.replay_buffer.nb_entries // batch_size))
+            staged_batch = batch_data if batch_data is not None else self.replay_buffer.sample(
+                batch_size=batch_size * staged_num)
+            assert isinstance(staged_batch, TransitionData)
+            sess.run(self._fused_stage_op, feed_dict=self._fused_batch_feed_dict(staged_batch,
+                                                                                 input_dict=self._fused_stage_input))
+        average_critic_loss = 0.0
+        average_actor_loss = 0.0
+        for i in range(train_iter):
+            op = self._fused_update_with_target_op if update_target and i == train_iter - 1 else self._fused_update_op
+            if prioritized:
+                train_batch = self.replay_buffer.sample(batch_size=batch_size)
+                feed_dict = {**self._fused_batch_feed_dict(train_batch, input_dict=self._fused_input),
+                             self._fused_input['weight']: np.reshape(train_batch('weight_set'), [-1, 1])}
+            else:
+                feed_dict = {self._fused_batch_index_input: i % staged_num,
+                             self._fused_batch_size_input: batch_size}
+            critic_loss, actor_loss, td_error, _ = sess.run(
+                [self._fused_critic_loss, self._fused_actor_loss, self._fused_td_error, op],
+                feed_dict={**feed_dict, **param_feed_dict})
+            if prioritized:
+                self.replay_buffer.update_priorities(idxes=train_batch('index_set'), priorities=td_error)
+            average_actor_loss += actor_loss
+            average_critic_loss += critic_loss
+        return dict(average_actor_loss=average_actor_loss / train_iter,
+                    average_critic_loss=average_critic_loss / train_iter)
+
+    @staticmethod
+    def _fused_batch_feed_dict(batch_data: TransitionData, input_dict: dict) -> dict:
+        return {input_dict['state']: batch_data.state_set,
+                input_dict['action']: batch_data.action_set,
+                input_dict['reward']: np.reshape(batch_data.reward_set, [-1, 1]),
+                input_dict['done']: np.reshape(batch_data.done_set, [-1, 1]),
+                input_dict['new_state']: batch_data.new_state_set}
+
     @register_counter_info_to_status_decorator(increment=1, info_key='test', under_status='TEST')
     def test(self, *arg, **kwargs) -> dict:
         return super().test(*arg, **kwargs)
@@ -186,14 +256,7 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
 
     @typechecked
     def append_to_memory(self, samples: TransitionData):
-        iter_samples = samples.return_generator()
-
-        for obs0, obs1, action, reward, terminal1 in iter_samples:
-            self.replay_buffer.append(obs0=obs0,
-                                      obs1=obs1,
-                                      action=action,
-                                      reward=reward,
-                                      terminal1=terminal1)
+        self.replay_buffer.extend(samples)
 
     @record_return_decorator(which_recorder='self')
     def save(self, global_step, save_path=None, name=None, **kwargs):
@@ -211,7 +274,8 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
 
     def _setup_critic_loss(self):
         reg_loss = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES, scope=self.critic.name_scope)
-        loss = tf.reduce_sum((self.predict_q_value - self.critic.q_tensor) ** 2) + tf.reduce_sum(reg_loss)
+        self.td_error = self.predict_q_value - self.critic.q_tensor
+        loss = tf.reduce_sum(self.weight_input * self.td_error ** 2) + tf.reduce_sum(reg_loss)
         optimizer = tf.train.AdamOptimizer(learning_rate=self.parameters('CRITIC_LEARNING_RATE'))
         grad_var_pair = optimizer.compute_gradients(loss=loss, var_list=self.critic.parameters('tf_var_list'))
         grads = [g[0] for g in grad_var_pair]
@@ -241,7 +305,7 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
             grad_var_pair, grads = clip_grad(optimizer=optimizer,
                                              loss=loss,
                                              var_list=self.actor.parameters('tf_var_list'),
-                                             clip_norm=self.parameters('critic_clip_norm'))
+                                             clip_norm=self.parameters('actor_clip_norm'))
         optimize_op = optimizer.apply_gradients(grad_var_pair)
         op = []
         for var, target_var in zip(self.actor.parameters('tf_var_list'),
@@ -250,3 +314,91 @@ class DDPG(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
             op.append(tf.assign(target_var, ref_val))
 
         return loss, optimize_op, op, optimizer, grads
+
+    def _set_up_fused_update(self):
+        """
+        Build the fused update on copies of the networks which share the variables of the original ones and take
+        the minibatch from the staged batch (or from the feed). Both gradients are computed before any variable is
+        updated, so the actor is updated against the critic before its update of the same iteration, and the target
+        networks are updated after both. The existing optimizers are reused so the two update paths share their state.
+        """
+        obs_dim = self.env_spec.flat_obs_dim
+        action_dim = self.env_spec.flat_action_dim
+        critic_reg_loss = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES, scope=self.critic.name_scope)
+        actor_reg_loss = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES, scope=self.actor.name_scope)
+        with tf.variable_scope('{}_fused'.format(self.name)):
+            data_spec = dict(state=([None, obs_dim], tf.float32),
+                             action=([None, action_dim], tf.float32),
+                             reward=([None, 1], tf.float32),
+                             done=([None, 1], tf.bool),
+                             new_state=([None, obs_dim], tf.float32))
+            self._fused_batch_index_input = tf.placeholder_with_default(0, shape=[])
+            self._fused_batch_size_input = tf.placeholder_with_default(1, shape=[])
+            self._fused_input = dict()
+            self._fused_stage_input = dict()
+            stage_op = []
+            for key, (shape, dtype) in data_spec.items():
+                stage_ph = tf.placeholder(shape=shape, dtype=dtype, name='stage_{}'.format(key))
+                # kept out of the global variables so they are neither initialized nor saved with the parameters
+                staged_var = tf.Variable(tf.zeros([0] + shape[1:], dtype=dtype), trainable=False,
+                                         validate_shape=False, collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                                         name='staged_{}'.format(key))
+                stage_op.append(tf.assign(staged_var, stage_ph, validate_shape=False))
+                start = self._fused_batch_index_input * self._fused_batch_size_input
+                minibatch = tf.reshape(staged_var.value(), [-1] + shape[1:])[start:start + self._fused_batch_size_input]
+                self._fused_input[key] = tf.placeholder_with_default(minibatch, shape=shape, name=key)
+                self._fused_stage_input[key] = stage_ph
+            self._fused_input['weight'] = tf.placeholder_with_default(tf.ones_like(self._fused_input['reward']),
+                                                                      shape=[None, 1])
+            self._fused_stage_op = tf.group(*stage_op)
+
+        critic = self.critic.make_copy(reuse=True, name='fused_{}'.format(self.critic.name),
+                                       state_input=self._fused_input['state'],
+                                       action_input=self._fused_input['action'])
+        actor = self.actor.make_copy(reuse=True, name='fused_{}'.format(self.actor.name),
+                                     state_input=self._fused_input['state'])
+        critic_with_actor_output = self.critic.make_copy(reuse=True,
+                                                         name='fused_actor_input_{}'.format(self.critic.name),
+                                                         state_input=self._fused_input['state'],
+                                                         action_input=actor.action_tensor)
+        target_actor = self.target_actor.make_copy(reuse=True, name='fused_{}'.format(self.target_actor.name),
+                                                   state_input=self._fused_input['new_state'])
+        target_critic = self.target_critic.make_copy(reuse=True, name='fused_{}'.format(self.target_critic.name),
+                                                     state_input=self._fused_input['new_state'],
+                                                     action_input=target_actor.action_tensor)
+        with tf.variable_scope('{}_fused'.format(self.name)):
+            done = tf.cast(self._fused_input['done'], dtype=tf.float32)
+            predict_q_value = tf.stop_gradient(
+                (1. - done) * self.config('GAMMA') * target_critic.q_tensor + self._fused_input['reward'])
+            self._fused_td_error = predict_q_value - critic.q_tensor
+            self._fused_critic_loss = tf.reduce_sum(self._fused_input['weight'] * self._fused_td_error ** 2) + \
+                                      tf.reduce_sum(critic_reg_loss)
+            self._fused_actor_loss = -tf.reduce_mean(critic_with_actor_output.q_tensor) + tf.reduce_sum(actor_reg_loss)
+            critic_grad_var_pair = self._fused_grad_var_pair(optimizer=self.critic_optimizer,
+                                                             loss=self._fused_critic_loss,
+                                                             var_list=self.critic.parameters('tf_var_list'),
+                                                             clip_norm=self.parameters('critic_clip_norm'))
+            actor_grad_var_pair = self._fused_grad_var_pair(optimizer=self.action_optimizer,
+                                                            loss=self._fused_actor_loss,
+                                                            var_list=self.actor.parameters('tf_var_list'),
+                                                            clip_norm=self.parameters('actor_clip_norm'))
+            with tf.control_dependencies([g for g, _ in critic_grad_var_pair + actor_grad_var_pair] +
+                                         [self._fused_critic_loss, self._fused_actor_loss, self._fused_td_error]):
+                self._fused_update_op = tf.group(self.critic_optimizer.apply_gradients(critic_grad_var_pair),
+                                                 self.action_optimizer.apply_gradients(actor_grad_var_pair))
+            with tf.control_dependencies([self._fused_update_op]):
+                op = []
+                for var, target_var in zip(self.critic.parameters('tf_var_list') + self.actor.parameters('tf_var_list'),
+                                           self.target_critic.parameters('tf_var_list') +
+                                           self.target_actor.parameters('tf_var_list')):
+                    # read_value under the control dependency reads the variables after the update
+                    ref_val = self.parameters('DECAY') * target_var.read_value() + \
+                              (1.0 - self.parameters('DECAY')) * var.read_value()
+                    op.append(tf.assign(target_var, ref_val))
+                self._fused_update_with_target_op = tf.group(*op)
+
+    @staticmethod
+    def _fused_grad_var_pair(optimizer, loss, var_list, clip_norm):
+        if clip_norm is not None:
+            return clip_grad(optimizer=optimizer, loss=loss, var_list=var_list, clip_norm=clip_norm)[0]
+        return optimizer.compute_gradients(loss=loss, var_list=var_list)
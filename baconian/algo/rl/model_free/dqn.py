@@ -4,7 +4,8 @@ from baconian.config.dict_config import DictConfig
 from typeguard import typechecked
 from baconian.core.util import init_func_arg_record_decorator
 from baconian.tf.util import *
-from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, BaseReplayBuffer
+from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, BaseReplayBuffer, \
+    PrioritizedReplayBuffer
 import tensorflow as tf
 import tensorflow.contrib as tfcontrib
 import numpy as np
@@ -14,6 +15,7 @@ from baconian.config.global_config import GlobalConfig
 from baconian.common.misc import *
 from baconian.algo.rl.value_func.mlp_q_value import MLPQValueFunction
 from baconian.common.logging import record_return_decorator
+from baconian.common.profiler import profile_decorator
 from baconian.core.status import register_counter_info_to_status_decorator
 from baconian.algo.placeholder_input import MultiPlaceholderInput
 
@@ -34,13 +36,15 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         self.config = construct_dict_config(config_or_config_dict, self)
 
         if replay_buffer:
-            assert issubclass(replay_buffer, BaseReplayBuffer)
+            assert isinstance(replay_buffer, BaseReplayBuffer)
             self.replay_buffer = replay_buffer
         else:
             self.replay_buffer = UniformRandomReplayBuffer(limit=self.config('REPLAY_BUFFER_SIZE'),
                                                            action_shape=self.env_spec.action_shape,
                                                            observation_shape=self.env_spec.obs_shape)
         self.q_value_func = value_func
+        # one-hot codes of all the actions, tiled for each batch in _one_hot_action_table
+        self._one_hot_actions = generate_n_actions_hot_code(n=self.env_spec.flat_action_dim)
         self.state_input = self.q_value_func.state_input
         self.action_input = self.q_value_func.action_input
 
@@ -53,6 +57,8 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
 
         with tf.variable_scope(name):
             self.reward_input = tf.placeholder(shape=[None, 1], dtype=tf.float32)
+            # importance sampling weights of a prioritized replay batch, all ones by default
+            self.weight_input = tf.placeholder_with_default(tf.ones_like(self.reward_input), shape=[None, 1])
             self.next_state_input = tf.placeholder(shape=[None, self.env_spec.flat_obs_dim], dtype=tf.float32)
             self.done_input = tf.placeholder(shape=[None, 1], dtype=tf.bool)
             self.target_q_input = tf.placeholder(shape=[None, 1], dtype=tf.float32)
@@ -86,6 +92,7 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
         if source_obj:
             self.copy_from(source_obj)
 
+    @profile_decorator('dqn/train')
     @record_return_decorator(which_recorder='self')
     @register_counter_info_to_status_decorator(increment=1, info_key='train_counter', under_status='TRAIN')
     @typechecked
@@ -115,8 +122,13 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
                 self.target_q_input: target_q_val_on_new_s,
                 **self.parameters.return_tf_parameter_feed_dict()
             }
-            res, _ = tf_sess.run([self.q_value_func_loss, self.update_q_value_func_op],
-                                 feed_dict=feed_dict)
+            prioritized = batch_data is None and isinstance(self.replay_buffer, PrioritizedReplayBuffer)
+            if prioritized:
+                feed_dict[self.weight_input] = np.reshape(train_data('weight_set'), [-1, 1])
+            res, td_error, _ = tf_sess.run([self.q_value_func_loss, self.td_error, self.update_q_value_func_op],
+                                           feed_dict=feed_dict)
+            if prioritized:
+                self.replay_buffer.update_priorities(idxes=train_data('index_set'), priorities=td_error)
             average_loss += res
 
         average_loss /= train_iter
@@ -168,16 +180,8 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
     @register_counter_info_to_status_decorator(increment=1, info_key='append_to_memory')
     @typechecked
     def append_to_memory(self, samples: TransitionData):
-        iter_samples = samples.return_generator()
-        data_count = 0
-        for obs0, obs1, action, reward, terminal1 in iter_samples:
-            self.replay_buffer.append(obs0=obs0,
-                                      obs1=obs1,
-                                      action=action,
-                                      reward=reward,
-                                      terminal1=terminal1)
-            data_count += 1
-        self._status.update_info(info_key='replay_buffer_data_total_count', increment=data_count)
+        self.replay_buffer.extend(samples)
+        self._status.update_info(info_key='replay_buffer_data_total_count', increment=len(samples))
 
     @record_return_decorator(which_recorder='self')
     def save(self, global_step, save_path=None, name=None, **kwargs):
@@ -196,31 +200,45 @@ class DQN(ModelFreeAlgo, OffPolicyAlgo, MultiPlaceholderInput):
     def _predict_action(self, obs: np.ndarray, q_value_tensor: tf.Tensor, action_ph: tf.Tensor, state_ph: tf.Tensor,
                         sess=None):
         assert self.env_spec.obs_space.contains(obs)
-        obs = repeat_ndarray(obs, repeats=self.env_spec.flat_action_dim)
-        tf_sess = sess if sess else tf.get_default_session()
-        feed_dict = {action_ph: generate_n_actions_hot_code(n=self.env_spec.flat_action_dim),
-                     state_ph: obs, **self.parameters.return_tf_parameter_feed_dict()}
-        res = tf_sess.run([q_value_tensor],
-                          feed_dict=feed_dict)[0]
-        return np.argmax(res, axis=0), np.max(res, axis=0)
+        return self._predict_batch_action(obs=np.expand_dims(obs, axis=0),
+                                          q_value_tensor=q_value_tensor,
+                                          action_ph=action_ph,
+                                          state_ph=state_ph,
+                                          sess=sess)
 
     def _predict_batch_action(self, obs: np.ndarray, q_value_tensor: tf.Tensor, action_ph: tf.Tensor,
                               state_ph: tf.Tensor, sess=None):
-        actions = []
-        q_values = []
-        for obs_i in obs:
-            action, q_val = self._predict_action(obs=obs_i,
-                                                 q_value_tensor=q_value_tensor,
-                                                 action_ph=action_ph,
-                                                 state_ph=state_ph,
-                                                 sess=sess)
-            actions.append(np.argmax(action, axis=0))
-            q_values.append(np.max(q_val, axis=0))
-        return np.array(actions), np.array(q_values)
+        q_values = self._predict_all_q_value(obs=obs,
+                                             q_value_tensor=q_value_tensor,
+                                             action_ph=action_ph,
+                                             state_ph=state_ph,
+                                             sess=sess)
+        return np.argmax(q_values, axis=1), np.max(q_values, axis=1)
+
+    def _predict_all_q_value(self, obs: np.ndarray, q_value_tensor: tf.Tensor, action_ph: tf.Tensor,
+                             state_ph: tf.Tensor, sess=None) -> np.ndarray:
+        """
+        Q values of all the actions for a batch of observations with one sess.run, each observation is repeated
+        n_actions times and paired with the cached one-hot action table.
+
+        :return: Q values with shape (batch_size, n_actions)
+        """
+        n_actions = self.env_spec.flat_action_dim
+        obs = np.reshape(obs, (-1, self.env_spec.flat_obs_dim))
+        tf_sess = sess if sess else tf.get_default_session()
+        feed_dict = {action_ph: self._one_hot_action_table(batch_size=len(obs)),
+                     state_ph: np.repeat(obs, repeats=n_actions, axis=0),
+                     **self.parameters.return_tf_parameter_feed_dict()}
+        res = tf_sess.run(q_value_tensor, feed_dict=feed_dict)
+        return np.reshape(res, (len(obs), n_actions))
+
+    def _one_hot_action_table(self, batch_size):
+        return np.tile(self._one_hot_actions, (batch_size, 1))
 
     def _set_up_loss(self):
         reg_loss = tf.get_collection(tf.GraphKeys.REGULARIZATION_LOSSES, scope=self.q_value_func.name_scope)
-        loss = tf.reduce_sum((self.predict_q_value - self.q_value_func.q_tensor) ** 2) + tf.reduce_sum(reg_loss)
+        self.td_error = self.predict_q_value - self.q_value_func.q_tensor
+        loss = tf.reduce_sum(self.weight_input * self.td_error ** 2) + tf.reduce_sum(reg_loss)
 
         optimizer = tf.train.AdamOptimizer(learning_rate=self.parameters('LEARNING_RATE'))
         optimize_op = optimizer.minimize(loss=loss, var_list=self.q_value_func.parameters('tf_var_list'))
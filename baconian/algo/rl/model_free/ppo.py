@@ -13,6 +13,7 @@ from baconian.tf.util import *
 from baconian.common.misc import *
 from baconian.algo.rl.misc.sample_processor import SampleProcessor
 from baconian.common.logging import record_return_decorator
+from baconian.common.profiler import profile_decorator
 from baconian.core.status import register_counter_info_to_status_decorator
 from baconian.algo.placeholder_input import MultiPlaceholderInput, PlaceholderInput
 from baconian.common.error import *
@@ -95,6 +96,7 @@ class PPO(ModelFreeAlgo, OnPolicyAlgo, MultiPlaceholderInput):
             self.copy_from(source_obj)
         super().init()
 
+    @profile_decorator('ppo/train')
     @record_return_decorator(which_recorder='self')
     @register_counter_info_to_status_decorator(increment=1, info_key='train', under_status='TRAIN')
     @typechecked
@@ -20,14 +20,16 @@ class DeterministicMLPPolicy(DeterministicPolicy, PlaceholderInput):
                  output_norm: np.ndarray = None,
                  output_low: np.ndarray = None,
                  output_high: np.ndarray = None,
+                 state_input: tf.Tensor = None,
                  reuse=False):
         DeterministicPolicy.__init__(self, env_spec=env_spec, name=name, parameters=None)
         obs_dim = env_spec.flat_obs_dim
         action_dim = env_spec.flat_action_dim
         assert action_dim == mlp_config[-1]['N_UNITS']
 
-        with tf.variable_scope(name_scope):
-            state_input = tf.placeholder(shape=[None, obs_dim], dtype=tf.float32, name='state_ph')
+        if state_input is None:
+            with tf.variable_scope(name_scope):
+                state_input = tf.placeholder(shape=[None, obs_dim], dtype=tf.float32, name='state_ph')
 
         mlp_kwargs = dict(
             reuse=reuse,
@@ -13,6 +13,10 @@ class UniformRandomPolicy(Policy):
 
     @overrides
     def forward(self, obs, **kwargs):
+        obs = np.asarray(obs)
+        if obs.ndim > len(self.env_spec.obs_shape):
+            # a batch of observations, one independent random action for each of them
+            return np.array([self.action_space.sample() for _ in range(obs.shape[0])])
         return np.array(self.action_space.sample())
 
     def save(self, global_step, save_path=None, name=None, **kwargs):
@@ -44,6 +44,22 @@ def save_to_json(obj: (list, dict), path=None, fp=None, file_name=None):
             json.dump(obj=obj, fp=f, indent=4, sort_keys=True)
 
 
+def save_to_json_lines(obj_list: list, path, file_name):
+    """
+    Append the objects to path/file_name as json lines (one json document per line) with a single write.
+    """
+    if not os.path.exists(path):
+        os.makedirs(path)
+    content = ''.join(json.dumps(val, sort_keys=True) + '\n' for val in convert_to_jsonable(dict_or_list=obj_list))
+    with open(os.path.join(path, file_name), 'a') as f:
+        f.write(content)
+
+
+def load_json_lines(file_path) -> list:
+    with open(file_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
 def convert_to_jsonable(dict_or_list) -> (list, dict):
     if isinstance(dict_or_list, list):
         jsonable_dict = []
@@ -1,14 +1,20 @@
 import abc
+import atexit
 import logging
 import os
+import queue
+import threading
 from copy import deepcopy
 
+import numpy as np
+
 from typeguard import typechecked
 
 from baconian.common.misc import construct_dict_config
 from baconian.common import files as files
 from baconian.core.global_var import get_all
 from baconian.config.global_config import GlobalConfig
+from baconian.common.profiler import Profiler, profile_decorator
 from functools import wraps
 """
 Logger Module
@@ -93,6 +99,57 @@ class _SingletonConsoleLogger(BaseLogger):
             handler.flush()
 
 
+class _AsyncRecordWriter(object):
+    """
+    Write the records flushed from the recorders in a background thread, so flushing a recorder only hands its
+    records over and never waits for the serialization. The records of each object (and status) are appended to a
+    json lines file, one record per line. The thread is a daemon one, so the records still queued are written at the
+    exit of the interpreter.
+    """
+    RECORD_FILE_NAME = 'log.jsonl'
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        atexit.register(self.wait)
+
+    def put(self, obj_log: dict, by_status_flag: bool, record_dir: str):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((obj_log, by_status_flag, record_dir))
+
+    def wait(self):
+        """
+        Block until all the records handed over are written.
+        """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            obj_log, by_status_flag, record_dir = self._queue.get()
+            try:
+                self._write(obj_log, by_status_flag, record_dir)
+            except Exception as e:
+                ConsoleLogger().print('error', 'failed to write records into {}: {}'.format(record_dir, e))
+            finally:
+                self._queue.task_done()
+
+    @profile_decorator('logging/write')
+    def _write(self, obj_log: dict, by_status_flag: bool, record_dir: str):
+        records_by_path = dict()
+        for obj, attr_log_dict in obj_log.items():
+            for records in attr_log_dict.values():
+                for record in records:
+                    if by_status_flag is True:
+                        path = os.path.join(record_dir, str(obj.name), str(record['status']))
+                    else:
+                        path = os.path.join(record_dir, str(obj.name))
+                    records_by_path.setdefault(path, []).append(record)
+        for path, records in records_by_path.items():
+            files.save_to_json_lines(records, path=path, file_name=self.RECORD_FILE_NAME)
+
+
 class _SingletonLogger(BaseLogger):
     """
     A private class that should never be instanced, it is used to implement the singleton design pattern for Logger
@@ -106,6 +163,7 @@ class _SingletonLogger(BaseLogger):
         self._record_file_log_dir = None
         self.logger_config = None
         self.log_level = None
+        self._writer = _AsyncRecordWriter()
 
     def init(self, config_or_config_dict,
              log_path, log_level=None, **kwargs):
@@ -137,8 +195,15 @@ class _SingletonLogger(BaseLogger):
     def close(self):
         self._save_all_obj_final_status()
         self.flush_recorder()
+        self.wait_flush()
         self._registered_recorders = []
 
+    def wait_flush(self):
+        """
+        Block until all the flushed records are written into the files.
+        """
+        self._writer.wait()
+
     def append_recorder(self, recorder):
         self._registered_recorders.append(recorder)
 
@@ -149,31 +214,15 @@ class _SingletonLogger(BaseLogger):
         self._registered_recorders = []
         self.inited_flag = False
 
+    @profile_decorator('logging/flush')
     def _flush(self, recorder):
         if recorder.is_empty():
             return
-        log_dict, by_status_flag = recorder.get_obj_log_to_flush(clear_obj_log_flag=True)
-        for obj_name, obj_log_dict in log_dict.items():
-            if by_status_flag is True:
-                for status, status_log_dict in obj_log_dict.items():
-                    ConsoleLogger().print('info', 'save {}, with status: {} log into {}'.format(str(obj_name),
-                                                                                                str(status),
-                                                                                                os.path.join(
-                                                                                                    self._record_file_log_dir,
-                                                                                                    str(obj_name),
-                                                                                                    str(status))))
-                    self.out_to_file(
-                        file_path=os.path.join(self._record_file_log_dir, str(obj_name), str(status)),
-                        content=status_log_dict,
-                        file_name='log.json')
-            else:
-                ConsoleLogger().print('info', 'save {} log into {}'.format(str(obj_name),
-                                                                           os.path.join(
-                                                                               self._record_file_log_dir,
-                                                                               str(obj_name))))
-                self.out_to_file(file_path=os.path.join(self._record_file_log_dir, str(obj_name)),
-                                 content=obj_log_dict,
-                                 file_name='log.json')
+        by_status_flag = recorder.flush_by_split_status
+        ConsoleLogger().print('info', 'save log of {} into {}'.format(
+            ', '.join(str(obj.name) for obj in recorder._obj_log), self._record_file_log_dir))
+        self._writer.put(obj_log=recorder.pop_obj_log(), by_status_flag=by_status_flag,
+                         record_dir=self._record_file_log_dir)
 
     def _save_all_obj_final_status(self):
         final_status = dict()
@@ -197,6 +246,13 @@ class _SingletonLogger(BaseLogger):
                          content=GlobalConfig().return_all_as_dict(),
                          force_new=True,
                          file_name='global_config.json')
+        if Profiler().enabled and not Profiler().is_empty():
+            ConsoleLogger().print('info', 'save profile into {}, time (s) per stage:\n{}'.format(
+                self._record_file_log_dir, Profiler().report()))
+            self.out_to_file(file_path=os.path.join(self._record_file_log_dir),
+                             content=Profiler().summary(),
+                             force_new=True,
+                             file_name='profile.json')
 
     @staticmethod
     @typechecked
@@ -237,11 +293,19 @@ class ConsoleLogger(object):
 
 
 class Recorder(object):
-    def __init__(self, flush_by_split_status=True):
+    def __init__(self, flush_by_split_status=True, flush_record_num: int = None):
+        """
+
+        :param flush_by_split_status: save the records of each status of an object into its own file
+        :param flush_record_num: number of records kept in memory before the recorder is flushed, default as
+        GlobalConfig().DEFAULT_LOG_FLUSH_RECORD_NUM, the recorder is only flushed by the Logger if it is 0
+        """
         self._obj_log = {}
+        self._record_num = 0
         self._registered_log_attr_by_get_dict = {}
         Logger().append_recorder(self)
         self.flush_by_split_status = flush_by_split_status
+        self.flush_record_num = flush_record_num
 
     @typechecked
     def append_to_obj_log(self, obj, attr_name: str, status_info: dict, log_val):
@@ -250,10 +314,27 @@ class Recorder(object):
             self._obj_log[obj] = {}
         if attr_name not in self._obj_log[obj]:
             self._obj_log[obj][attr_name] = []
-        info = deepcopy(status_info)
-        info['attr_name'] = deepcopy(attr_name)
-        info['log_val'] = deepcopy(log_val)
+        info = dict(status_info)
+        info['attr_name'] = attr_name
+        # scalars are immutable, only the other values are copied to keep what was logged at this point
+        info['log_val'] = log_val if np.isscalar(log_val) or log_val is None else deepcopy(log_val)
         self._obj_log[obj][attr_name].append(info)
+        self._record_num += 1
+        flush_record_num = self.flush_record_num if self.flush_record_num is not None else \
+            GlobalConfig().DEFAULT_LOG_FLUSH_RECORD_NUM
+        if 0 < flush_record_num <= self._record_num and Logger().inited_flag is True:
+            self.flush()
+        for listener in _record_listeners:
+            listener(obj, attr_name, info, log_val)
+
+    def pop_obj_log(self) -> dict:
+        """
+        Return the records and clear them from the recorder.
+        """
+        obj_log = self._obj_log
+        self._obj_log = {}
+        self._record_num = 0
+        return obj_log
 
     def is_empty(self):
         return len(self._obj_log) == 0
@@ -299,7 +380,7 @@ class Recorder(object):
                     res.pop('attr_name')
                     filtered_res[obj.name][val_dict['status']][val_dict['attr_name']].append(res)
         if clear_obj_log_flag is True:
-            self._obj_log = {}
+            self.pop_obj_log()
         return filtered_res
 
     def get_obj_log_to_flush(self, clear_obj_log_flag) -> (dict, bool):
@@ -315,11 +396,11 @@ class Recorder(object):
                         res = deepcopy(val_dict)
                         res.pop('attr_name')
                         filtered_res[obj.name][val_dict['attr_name']].append(res)
-            self._obj_log = {}
+            self.pop_obj_log()
             return filtered_res, self.flush_by_split_status
 
     def reset(self):
-        self._obj_log = {}
+        self.pop_obj_log()
         self._registered_log_attr_by_get_dict = {}
 
     def flush(self):
@@ -372,6 +453,23 @@ def record_return_decorator(which_recorder: str = 'global'):
     return wrap
 
 
+_record_listeners = []
+
+
+def register_record_listener(listener):
+    """
+    Call listener(obj, attr_name, status_info, log_val) on each record appended to any recorder, e.g. to watch the
+    intermediate results of an experiment while it runs.
+    """
+    if listener not in _record_listeners:
+        _record_listeners.append(listener)
+
+
+def remove_record_listener(listener):
+    if listener in _record_listeners:
+        _record_listeners.remove(listener)
+
+
 _global_recorder = Recorder()
 
 
@@ -387,3 +485,4 @@ def reset_logging():
     Logger().reset()
     ConsoleLogger().reset()
     reset_global_recorder()
+    Profiler().reset()
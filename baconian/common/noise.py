@@ -100,6 +100,17 @@ class AgentActionNoiseWrapper(object):
         self.noise_weight_scheduler = noise_weight_scheduler
         self.noise = noise
 
-    def __call__(self, action, **kwargs):
-        noise = self.noise()
+    def __call__(self, action, batch_flag: bool = False, **kwargs):
+        """
+
+        :param action:
+        :param batch_flag: action is a batch (e.g. one row for each sub-env of a VectorSampler), then one noise is drawn
+        for each row
+        """
+        if batch_flag is True:
+            action = np.asarray(action)
+            noise = np.stack([np.asarray(self.noise()) for _ in range(len(action))])
+            noise = np.reshape(noise, noise.shape + (1,) * (action.ndim - noise.ndim))
+        else:
+            noise = self.noise()
         return self.action_weight_scheduler.value() * action + self.noise_weight_scheduler.value() * noise
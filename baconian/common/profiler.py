@@ -0,0 +1,119 @@
+"""
+Opt-in timing of the hot paths of an experiment (env step, agent predict, replay buffer, train, logging ...).
+Enabled by GlobalConfig().DEFAULT_PROFILE_FLAG, the durations of each stage are aggregated into a per-stage summary
+which is saved as profile.json beside final_status.json and printed when the logger is closed.
+"""
+import time
+from array import array
+from functools import wraps
+
+import numpy as np
+
+from baconian.config.global_config import GlobalConfig
+
+
+class _SingletonProfiler(object):
+    """
+    A private class that should never be instanced, it is used to implement the singleton design pattern for Profiler
+    """
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self._durations = dict()
+
+    @property
+    def enabled(self) -> bool:
+        return GlobalConfig().DEFAULT_PROFILE_FLAG is True
+
+    def add(self, stage: str, duration: float):
+        if stage not in self._durations:
+            self._durations[stage] = array('d')
+        self._durations[stage].append(duration)
+
+    def is_empty(self):
+        return len(self._durations) == 0
+
+    def summary(self) -> dict:
+        """
+
+        :return: dict of each stage with the call count, the total/mean/max time and the percentiles in seconds
+        """
+        res = dict()
+        for stage, durations in self._durations.items():
+            durations = np.frombuffer(durations, dtype=np.float64)
+            if len(durations) == 0:
+                continue
+            res[stage] = dict(count=len(durations),
+                              total=float(np.sum(durations)),
+                              mean=float(np.mean(durations)),
+                              max=float(np.max(durations)),
+                              **{'p{}'.format(p): float(v) for p, v in
+                                 zip(self.PERCENTILES, np.percentile(durations, self.PERCENTILES))})
+        return res
+
+    def report(self) -> str:
+        """
+
+        :return: table of the summary, one line per stage sorted by the total time
+        """
+        summary = self.summary()
+        columns = ('count', 'total', 'mean') + tuple('p{}'.format(p) for p in self.PERCENTILES) + ('max',)
+        width = max([len('stage')] + [len(stage) for stage in summary])
+        lines = ['{:<{}}'.format('stage', width) + ''.join('{:>12}'.format(c) for c in columns)]
+        for stage, res in sorted(summary.items(), key=lambda x: x[1]['total'], reverse=True):
+            lines.append('{:<{}}'.format(stage, width) + '{:>12d}'.format(res['count']) +
+                         ''.join('{:>12.6f}'.format(res[c]) for c in columns[1:]))
+        return '\n'.join(lines)
+
+    def reset(self):
+        self._durations = dict()
+
+
+class Profiler(object):
+    only_instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if Profiler.only_instance is None:
+            Profiler.only_instance = _SingletonProfiler()
+        return Profiler.only_instance
+
+
+class ProfileScope(object):
+    """
+    Context manager that times its block as one call of stage, nothing is timed if the profiling is disabled.
+    """
+    __slots__ = ('stage', '_start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter() if Profiler().enabled else None
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._start is not None:
+            Profiler().add(self.stage, time.perf_counter() - self._start)
+        return False
+
+
+def profile_decorator(stage: str):
+    """
+    Time each call of the decorated function as one call of stage.
+    """
+
+    def wrap(fn):
+        @wraps(fn)
+        def wrap_with_time(*args, **kwargs):
+            if not Profiler().enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                Profiler().add(stage, time.perf_counter() - start)
+
+        return wrap_with_time
+
+    return wrap
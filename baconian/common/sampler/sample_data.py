@@ -38,127 +38,284 @@ class SampleData(object):
 
 
 class TransitionData(SampleData):
+    """
+    Transition samples stored column by column. Each data set is kept in a pre-allocated numpy array which grows
+    geometrically, so appending is amortized O(1) and reading a set (e.g. ``state_set``) returns a read-only view
+    instead of re-building an array from a python list, copy it before modifying it in place. Shuffling only stores
+    a permutation of the rows, which is used by the batch generator and sample_batch to gather each batch and only
+    applied to the data sets when they are read or written as a whole.
+    """
+    INIT_CAPACITY = 64
+
     def __init__(self, env_spec: EnvSpec = None, obs_shape=None, action_shape=None):
         super(TransitionData, self).__init__(env_spec=env_spec, obs_shape=obs_shape, action_shape=action_shape)
 
         self.cumulative_reward = 0.0
         self.step_count_per_episode = 0
-
-        self._internal_data_dict = {
-            'state_set': [[], self.obs_shape],
-            'new_state_set': [[], self.obs_shape],
-            'action_set': [[], self.action_shape],
-            'reward_set': [[], [1]],
-            'done_set': [[], [1]],
-        }
         assert isinstance(self.obs_shape, (list, tuple))
         assert isinstance(self.action_shape, (list, tuple))
+
+        # each value is [data array (None before the first write), shape of the set, shape of a stored row]
+        self._data_set_dict = {
+            'state_set': [None, self.obs_shape, tuple(self.obs_shape)],
+            'new_state_set': [None, self.obs_shape, tuple(self.obs_shape)],
+            'action_set': [None, self.action_shape, tuple(self.action_shape)],
+            'reward_set': [None, [1], ()],
+            'done_set': [None, [1], ()],
+        }
+        self._size = 0
+        self._capacity = 0
+        self._permutation = None
         self.current_index = 0
 
     def __len__(self):
-        return len(self._internal_data_dict['state_set'][0])
+        return self._size
 
     def __call__(self, set_name, **kwargs):
         if set_name not in self._allowed_data_set_keys:
             raise ValueError('pass in set_name within {} '.format(self._allowed_data_set_keys))
-        return make_batch(np.array(self._internal_data_dict[set_name][0]),
-                          original_shape=self._internal_data_dict[set_name][1])
+        self._apply_permutation()
+        data, shape, _ = self._data_set_dict[set_name]
+        if data is None:
+            res = np.zeros([0] + list(shape))
+        else:
+            res = np.reshape(data[:self._size], [self._size] + list(shape))
+        # the set shares the memory of the stored data, writing into it would silently change the transitions
+        res.setflags(write=False)
+        return res
 
     def reset(self):
-        for key, data_set in self._internal_data_dict.items():
-            self._internal_data_dict[key][0] = []
+        # keep the allocated arrays so the memory can be reused by the following appends
+        self._size = 0
+        self._permutation = None
         self.cumulative_reward = 0.0
         self.step_count_per_episode = 0
 
     def append(self, state: np.ndarray, action: np.ndarray, new_state: np.ndarray, done: bool, reward: float):
-        self._internal_data_dict['state_set'][0].append(np.reshape(state, self.obs_shape))
-        self._internal_data_dict['new_state_set'][0].append(np.reshape(new_state, self.obs_shape))
-        self._internal_data_dict['reward_set'][0].append(reward)
-        self._internal_data_dict['done_set'][0].append(done)
-        self._internal_data_dict['action_set'][0].append(np.reshape(action, self.action_shape))
+        self._apply_permutation()
+        self._reserve(self._size + 1)
+        index = self._size
+        self._write(key='state_set', index=index, value=state)
+        self._write(key='new_state_set', index=index, value=new_state)
+        self._write(key='action_set', index=index, value=action)
+        self._write(key='reward_set', index=index, value=reward)
+        self._write(key='done_set', index=index, value=done)
+        self._size += 1
         self.cumulative_reward += reward
 
+    def append_batch(self, state: np.ndarray, action: np.ndarray, new_state: np.ndarray, done: np.ndarray,
+                     reward: np.ndarray):
+        """
+        Append a batch of transitions (first axis as the batch axis) with one slice assignment per data set.
+        """
+        count = len(state)
+        assert len(action) == len(new_state) == len(done) == len(reward) == count
+        self._apply_permutation()
+        self._reserve(self._size + count)
+        index = slice(self._size, self._size + count)
+        self._write(key='state_set', index=index, value=state)
+        self._write(key='new_state_set', index=index, value=new_state)
+        self._write(key='action_set', index=index, value=action)
+        self._write(key='reward_set', index=index, value=reward)
+        self._write(key='done_set', index=index, value=done)
+        self._size += count
+        self.cumulative_reward += float(np.sum(reward))
+
     def union(self, sample_data):
         assert isinstance(sample_data, type(self))
+        self._apply_permutation()
+        sample_data._apply_permutation()
         self.cumulative_reward += sample_data.cumulative_reward
         self.step_count_per_episode += sample_data.step_count_per_episode
-        for key, val in self._internal_data_dict.items():
-            assert self._internal_data_dict[key][1] == sample_data._internal_data_dict[key][1]
-            self._internal_data_dict[key][0] += deepcopy(sample_data._internal_data_dict[key][0])
+        count = len(sample_data)
+        if count == 0:
+            return
+        self._reserve(self._size + count)
+        for key, val in self._data_set_dict.items():
+            assert list(val[1]) == list(sample_data._data_set_dict[key][1])
+            self._write(key=key, index=slice(self._size, self._size + count),
+                        value=sample_data._data_set_dict[key][0][:count])
+        self._size += count
 
     def get_copy(self):
-        return deepcopy(self)
+        self._apply_permutation()
+        obj = type(self)(env_spec=self.env_spec, obs_shape=self.obs_shape, action_shape=self.action_shape)
+        obj.cumulative_reward = deepcopy(self.cumulative_reward)
+        obj.step_count_per_episode = self.step_count_per_episode
+        obj.current_index = self.current_index
+        obj._size = self._size
+        obj._capacity = self._size
+        obj._data_set_dict = dict()
+        for key, (data, shape, row_shape) in self._data_set_dict.items():
+            obj._data_set_dict[key] = [data[:self._size].copy() if data is not None else None, shape, row_shape]
+        return obj
+
+    def get_view(self, start=0, end=None):
+        """
+        Return a TransitionData of the rows [start, end) which shares the memory of this one, no data is copied.
+        Appending to the view re-allocates its own arrays, so it never writes into this object.
+        """
+        self._apply_permutation()
+        end = self._size if end is None else end
+        assert 0 <= start <= end <= self._size
+        obj = type(self)(env_spec=self.env_spec, obs_shape=self.obs_shape, action_shape=self.action_shape)
+        obj._size = end - start
+        obj._capacity = end - start
+        obj._data_set_dict = {key: [data[start:end] if data is not None else None, shape, row_shape]
+                              for key, (data, shape, row_shape) in self._data_set_dict.items()}
+        if obj._data_set_dict['reward_set'][0] is not None:
+            obj.cumulative_reward = float(np.sum(obj._data_set_dict['reward_set'][0]))
+        return obj
 
     def append_new_set(self, name, data_set: (list, np.ndarray), shape: (tuple, list)):
         assert len(data_set) == len(self)
-        assert len(np.array(data_set).shape) - 1 == len(shape)
+        self._apply_permutation()
+        data_set = np.asarray(data_set)
+        assert len(data_set.shape) - 1 == len(shape)
         if len(shape) > 0:
-            assert np.equal(np.array(data_set).shape[1:], shape).all()
-        if isinstance(data_set, np.ndarray):
-            data_set = data_set.tolist()
+            assert np.equal(data_set.shape[1:], shape).all()
         shape = tuple(shape)
-        self._internal_data_dict[name] = [data_set, shape]
+        data = np.empty((self._capacity,) + shape, dtype=data_set.dtype)
+        data[:self._size] = data_set
+        self._data_set_dict[name] = [data, shape, shape]
 
-    def sample_batch(self, batch_size, shuffle_flag=True, **kwargs) -> dict:
+    def sample_batch(self, batch_size, shuffle_flag=True, rng: np.random.RandomState = None, **kwargs) -> dict:
+        """
+        Sample batch_size transitions uniformly with replacement.
+
+        :param rng: random state used for the sampling, the global numpy one if None
+        """
         if shuffle_flag is False:
             raise NotImplementedError
         total_num = len(self)
-        id_index = np.random.randint(low=0, high=total_num, size=batch_size)
+        id_index = (rng if rng is not None else np.random).randint(low=0, high=total_num, size=batch_size)
+        # the rows are picked at random anyway, so the pending permutation (if any) can be ignored here
         batch_data = dict()
-        for key in self._internal_data_dict.keys():
-            batch_data[key] = self(key)[id_index]
+        for key, (data, shape, _) in self._data_set_dict.items():
+            batch_data[key] = np.reshape(data[id_index], [batch_size] + list(shape)) if data is not None else None
         return batch_data
 
     def get_mean_of(self, set_name):
-        return make_batch(np.array(self._internal_data_dict[set_name][0]),
-                          original_shape=self._internal_data_dict[set_name][1]).mean().item()
+        return self(set_name).mean().item()
 
     def get_sum_of(self, set_name):
-        return make_batch(np.array(self._internal_data_dict[set_name][0]),
-                          original_shape=self._internal_data_dict[set_name][1]).sum().item()
-
-    def shuffle(self, index: list = None):
-        if not index:
-            index = np.arange(len(self._internal_data_dict['state_set'][0]))
-            np.random.shuffle(index)
-        for key in self._internal_data_dict.keys():
-            self._internal_data_dict[key][0] = deepcopy([self._internal_data_dict[key][0][i] for i in index])
-
-    def return_generator(self, batch_size=None, shuffle_flag=False, assigned_keys=None, infinite_run=False):
+        return self(set_name).sum().item()
+
+    def shuffle(self, index: list = None, rng: np.random.RandomState = None):
+        """
+        Shuffle the transitions. A permutation of all the transitions is only stored as an index, no data set is
+        copied here. Any other index (e.g. a subset of the transitions) selects the rows of the data sets right away,
+        so the data keeps len(index) transitions.
+
+        :param index: new order of the transitions, a random permutation if None
+        :param rng: random state used for the random permutation, the global numpy one if None
+        """
+        if index is None or len(index) == 0:
+            index = (rng if rng is not None else np.random).permutation(len(self))
+        index = np.asarray(index, dtype=np.int64)
+        if len(index) == len(self):
+            self._permutation = index if self._permutation is None else self._permutation[index]
+            return
+        self._apply_permutation()
+        for val in self._data_set_dict.values():
+            if val[0] is not None:
+                val[0] = val[0][:self._size][index]
+        self._size = self._capacity = len(index)
+
+    def return_generator(self, batch_size=None, shuffle_flag=False, assigned_keys=None, infinite_run=False,
+                         rng: np.random.RandomState = None):
+        """
+        Iterate over the transitions in batches (or one by one if batch_size is None). If the data is shuffled,
+        each batch is gathered from the data sets with the permutation index, otherwise it is a view of them.
+
+        :param rng: random state used when shuffle_flag is True, the global numpy one if None
+        """
         if assigned_keys is None:
             assigned_keys = ('state_set', 'new_state_set', 'action_set', 'reward_set', 'done_set')
         # todo unit test should be tested
         if shuffle_flag is True:
-            self.shuffle()
+            self.shuffle(rng=rng)
+        permutation = self._permutation
         if batch_size is not None:
             if batch_size <= 0:
                 raise ValueError()
             start = 0
+            data_sets = [(self._data_set_dict[key][0][:self._size], self._data_set_dict[key][1])
+                         for key in assigned_keys]
+
+            def get_batch(start, end):
+                index = slice(start, end) if permutation is None else permutation[start: end]
+                return [np.reshape(data[index], [end - start] + list(shape)) for data, shape in data_sets]
+
             if infinite_run is True:
                 while True:
                     end = min(start + batch_size, len(self))
-                    yield [make_batch(self._internal_data_dict[key][0][start: end], self._internal_data_dict[key][1])
-                           for key in assigned_keys]
+                    yield get_batch(start, end)
                     start = end % len(self)
             else:
                 while start < len(self):
                     end = min(start + batch_size, len(self))
-                    yield [make_batch(self._internal_data_dict[key][0][start: end], self._internal_data_dict[key][1])
-                           for key in assigned_keys]
+                    yield get_batch(start, end)
                     start = end
         else:
             start = 0
+            data_sets = [self._data_set_dict[key][0] for key in assigned_keys]
+            order = np.arange(len(self)) if permutation is None else permutation
             if infinite_run is True:
                 while True:
-                    yield [self._internal_data_dict[key][0][start] for key in assigned_keys]
+                    yield [self._return_row(data[order[start]]) for data in data_sets]
                     start = (start + 1) % len(self)
             else:
-                for i in range(len(self)):
-                    yield [self._internal_data_dict[key][0][i] for key in assigned_keys]
+                for i in order:
+                    yield [self._return_row(data[i]) for data in data_sets]
+
+    def _apply_permutation(self):
+        # the permuted sets are new arrays, so the memory shared with other views is never written
+        if self._permutation is None:
+            return
+        for val in self._data_set_dict.values():
+            if val[0] is not None:
+                val[0] = val[0][:self._size][self._permutation]
+        self._capacity = self._size
+        self._permutation = None
+
+    def _reserve(self, capacity):
+        if capacity <= self._capacity:
+            return
+        new_capacity = max(capacity, 2 * self._capacity, self.INIT_CAPACITY)
+        for val in self._data_set_dict.values():
+            if val[0] is not None:
+                new_data = np.empty((new_capacity,) + val[2], dtype=val[0].dtype)
+                new_data[:self._size] = val[0][:self._size]
+                val[0] = new_data
+        self._capacity = new_capacity
+
+    def _write(self, key, index, value):
+        value = np.asarray(value)
+        val = self._data_set_dict[key]
+        if val[0] is None:
+            val[0] = np.empty((self._capacity,) + val[2], dtype=value.dtype)
+        elif not np.can_cast(value.dtype, val[0].dtype):
+            val[0] = val[0].astype(np.result_type(val[0].dtype, value.dtype))
+        if isinstance(index, slice):
+            val[0][index] = np.reshape(value, (-1,) + val[2])
+        else:
+            val[0][index] = np.reshape(value, val[2])
+
+    @staticmethod
+    def _return_row(row):
+        # scalar sets (reward, done, discrete action) are returned as python scalar as they were appended
+        return row.item() if np.ndim(row) == 0 else row
+
+    @property
+    def _internal_data_dict(self):
+        self._apply_permutation()
+        return {key: [val[0][:self._size] if val[0] is not None else np.zeros((0,) + val[2]), val[1]]
+                for key, val in self._data_set_dict.items()}
 
     @property
     def _allowed_data_set_keys(self):
-        return list(self._internal_data_dict.keys())
+        return list(self._data_set_dict.keys())
 
     @property
     def state_set(self):
@@ -182,40 +339,89 @@ class TransitionData(SampleData):
 
 
 class TrajectoryData(SampleData):
+    """
+    Trajectories stored as one flat TransitionData holding all the transitions, episode after episode, plus the
+    offsets of the episodes in it. Flattening, per-trajectory access, the aggregations and the batch generator all
+    work on views of the flat buffer, the only copy is the one done by append.
+    """
+
     def __init__(self, env_spec=None, obs_shape=None, action_shape=None):
         super(TrajectoryData, self).__init__(env_spec=env_spec, obs_shape=obs_shape, action_shape=action_shape)
-        self.trajectories = []
+        self._flat = TransitionData(env_spec=env_spec, obs_shape=self.obs_shape, action_shape=self.action_shape)
+        self._offsets = [0]
+        self._trajectory_views = None
 
     def reset(self):
-        self.trajectories = []
+        # a new buffer instead of re-using the old one, so the views already handed out stay valid
+        self._flat = TransitionData(env_spec=self.env_spec, obs_shape=self.obs_shape, action_shape=self.action_shape)
+        self._offsets = [0]
+        self._trajectory_views = None
 
     @typechecked
     def append(self, transition_data: TransitionData):
-        self.trajectories.append(transition_data.get_copy())
+        if len(self._flat) == 0:
+            # take over the extra data sets (if any) of the first trajectory
+            self._flat = transition_data.get_copy()
+        else:
+            self._flat.union(transition_data)
+        self._offsets.append(len(self._flat))
+        self._trajectory_views = None
 
     def union(self, sample_data):
         if not isinstance(sample_data, type(self)):
             raise TypeError()
-        self.trajectories += sample_data.trajectories
+        if len(sample_data) == 0:
+            return
+        base = len(self._flat)
+        if base == 0:
+            self._flat = sample_data._flat.get_copy()
+        else:
+            self._flat.union(sample_data._flat)
+        self._offsets += [base + offset for offset in sample_data._offsets[1:]]
+        self._trajectory_views = None
+
+    def __call__(self, set_name, **kwargs):
+        return self._flat(set_name)
+
+    def append_new_set(self, name, data_set: (list, np.ndarray), shape: (tuple, list)):
+        """
+        Add a data set for all the transitions, data_set is aligned with the flattened transitions (episode after
+        episode).
+        """
+        self._flat.append_new_set(name=name, data_set=data_set, shape=shape)
+        self._trajectory_views = None
+
+    @property
+    def trajectories(self) -> list:
+        """
+        :return: list of TransitionData, one view on the flat buffer for each trajectory
+        """
+        if self._trajectory_views is None:
+            self._trajectory_views = [self._flat.get_view(start, end)
+                                      for start, end in zip(self._offsets[:-1], self._offsets[1:])]
+        return self._trajectory_views
+
+    @property
+    def episode_offsets(self) -> np.ndarray:
+        """
+        :return: start of each trajectory in the flattened transitions, followed by the total number of transitions
+        """
+        return np.array(self._offsets, dtype=np.int64)
 
     def return_as_transition_data(self, shuffle_flag=False) -> TransitionData:
-        transition_set = self.trajectories[0].get_copy()
-        for i in range(1, len(self.trajectories)):
-            transition_set.union(self.trajectories[i].get_copy())
+        transition_set = self._flat.get_view()
         if shuffle_flag is True:
             transition_set.shuffle()
         return transition_set
 
     def get_mean_of(self, set_name):
-        tran = self.return_as_transition_data()
-        return tran.get_mean_of(set_name)
+        return self._flat.get_mean_of(set_name)
 
     def get_sum_of(self, set_name):
-        tran = self.return_as_transition_data()
-        return tran.get_sum_of(set_name)
+        return self._flat.get_sum_of(set_name)
 
     def __len__(self):
-        return len(self.trajectories)
+        return len(self._offsets) - 1
 
     def get_copy(self):
         tmp_traj = TrajectoryData(env_spec=self.env_spec, obs_shape=self.obs_shape, action_shape=self.action_shape)
@@ -223,5 +429,5 @@ class TrajectoryData(SampleData):
         return tmp_traj
 
     def return_generator(self, batch_size=None, shuffle_flag=False):
-        return self.return_as_transition_data(shuffle_flag=False).return_generator(batch_size=batch_size,
-                                                                                   shuffle_flag=shuffle_flag)
+        return self.return_as_transition_data(shuffle_flag=shuffle_flag).return_generator(batch_size=batch_size,
+                                                                                          shuffle_flag=False)
@@ -1,6 +1,9 @@
 from baconian.core.core import Basic, Env
+import numpy as np
 from baconian.common.sampler.sample_data import TransitionData, TrajectoryData
 from typeguard import typechecked
+from baconian.envs.env_pool import SubprocessEnvPool
+from baconian.common.profiler import ProfileScope
 
 
 class Sampler(Basic):
@@ -8,6 +11,7 @@ class Sampler(Basic):
         super().__init__(name)
         self._data = TransitionData(env_spec)
         self.env_spec = env_spec
+        self._pool_sampler = None
 
     def init(self):
         self._data.reset()
@@ -19,9 +23,17 @@ class Sampler(Basic):
                sample_count: int,
                sample_type='transition',
                reset_at_start=False) -> (TransitionData, TrajectoryData):
+        if isinstance(env, SubprocessEnvPool):
+            # a pool of envs is sampled in lockstep by a VectorSampler built on it
+            if self._pool_sampler is None or self._pool_sampler.envs is not env:
+                self._pool_sampler = VectorSampler(env_spec=self.env_spec, name='{}_pool'.format(self.name), envs=env)
+            return self._pool_sampler.sample(env=env, agent=agent, in_which_status=in_which_status,
+                                             sample_count=sample_count, sample_type=sample_type,
+                                             reset_at_start=reset_at_start)
         self.set_status(in_which_status)
         if reset_at_start is True:
             state = env.reset()
+            agent.reset_episode()
         else:
             state = env.get_state()
         if sample_type == 'transition':
@@ -37,7 +49,8 @@ class Sampler(Basic):
 
         for i in range(sample_count):
             action = agent.predict(obs=state)
-            new_state, re, done, info = env.step(action)
+            with ProfileScope('sampler/env_step'):
+                new_state, re, done, info = env.step(action)
             if not isinstance(done, bool):
                 raise TypeError()
             sample_record.append(state=state,
@@ -47,6 +60,7 @@ class Sampler(Basic):
                                  done=done)
             if done:
                 state = env.reset()
+                agent.reset_episode()
             else:
                 state = new_state
         return sample_record
@@ -59,7 +73,8 @@ class Sampler(Basic):
             traj_record = TransitionData(self.env_spec)
             while done is not True:
                 action = agent.predict(obs=state)
-                new_state, re, done, info = env.step(action)
+                with ProfileScope('sampler/env_step'):
+                    new_state, re, done, info = env.step(action)
                 if not isinstance(done, bool):
                     raise TypeError()
                 traj_record.append(state=state,
@@ -69,5 +84,158 @@ class Sampler(Basic):
                                    done=done)
                 state = new_state
             state = env.reset()
+            agent.reset_episode()
             sample_record.append(traj_record)
         return sample_record
+
+
+class VectorSampler(Sampler):
+    """
+    Sampler that steps a list of environments (e.g. several copies of the same GymEnv) in lockstep. At each tick the
+    observations of all the sub-envs are stacked into one (env_num, obs_dim) batch, so the agent is queried once
+    with batch_flag=True instead of once per env. Finished sub-envs are reset automatically. The samples of each
+    sub-env are kept in their own TransitionData/TrajectoryData, see sample_per_env.
+
+    envs can also be a SubprocessEnvPool, then the sub-envs are stepped in parallel by its worker processes.
+    """
+
+    @typechecked
+    def __init__(self, env_spec, name, envs: (list, SubprocessEnvPool)):
+        super().__init__(env_spec=env_spec, name=name)
+        assert len(envs) > 0
+        if isinstance(envs, list):
+            for env in envs:
+                assert isinstance(env, Env)
+        self.envs = envs
+        self._last_obs = None
+
+    @property
+    def env_num(self):
+        return len(self.envs)
+
+    @property
+    def is_pool(self):
+        return isinstance(self.envs, SubprocessEnvPool)
+
+    def init(self):
+        super().init()
+        self._last_obs = None
+
+    @typechecked
+    def sample(self, env: Env,
+               agent,
+               in_which_status: str,
+               sample_count: int,
+               sample_type='transition',
+               reset_at_start=False) -> (TransitionData, TrajectoryData):
+        """
+        Same as Sampler.sample, the samples of all the sub-envs are merged into one data object. The env argument is
+        only kept for compatibility, the sub-envs given at construction are the ones being stepped.
+        """
+        per_env_data = self.sample_per_env(agent=agent,
+                                           in_which_status=in_which_status,
+                                           sample_count=sample_count,
+                                           sample_type=sample_type,
+                                           reset_at_start=reset_at_start)
+        if sample_type == 'transition':
+            res = TransitionData(env_spec=self.env_spec)
+            for data in per_env_data:
+                res.union(data)
+        else:
+            res = TrajectoryData(env_spec=self.env_spec)
+            for data in per_env_data:
+                res.union(data)
+        return res
+
+    @typechecked
+    def sample_per_env(self, agent,
+                       in_which_status: str,
+                       sample_count: int,
+                       sample_type='transition',
+                       reset_at_start=False) -> list:
+        """
+        Sample sample_count transitions (or trajectories) in total from all the sub-envs.
+
+        :return: list of TransitionData (or TrajectoryData), one for each sub-env
+        """
+        self.set_status(in_which_status)
+        if self.is_pool:
+            self.envs.set_status(in_which_status)
+            if reset_at_start is True or self._last_obs is None:
+                self._last_obs = self.envs.reset()
+                agent.reset_episode()
+        else:
+            for env in self.envs:
+                env.set_status(in_which_status)
+            if reset_at_start is True or self._last_obs is None:
+                self._last_obs = np.array([env.reset() for env in self.envs])
+                agent.reset_episode()
+        if sample_type == 'transition':
+            return self._sample_transitions_vectorized(agent, sample_count)
+        elif sample_type == 'trajectory':
+            return self._sample_trajectories_vectorized(agent, sample_count)
+        else:
+            raise ValueError()
+
+    def _step_all(self, agent, active_num):
+        state = self._last_obs[:active_num].copy()
+        action = np.reshape(np.asarray(agent.predict(obs=state, batch_flag=True)),
+                            (active_num,) + tuple(self.env_spec.action_shape))
+        if self.is_pool:
+            index = list(range(active_num))
+            with ProfileScope('sampler/env_step'):
+                new_state, re, done, _ = self.envs.step(action, index=index)
+            self._last_obs[index] = new_state
+            finished = [i for i in index if done[i]]
+            if len(finished) > 0:
+                self._last_obs[finished] = self.envs.reset(index=finished)
+                for i in finished:
+                    agent.reset_episode(index=i)
+            return list(zip(state, action, re.tolist(), new_state, done.tolist()))
+        res = []
+        for i in range(active_num):
+            with ProfileScope('sampler/env_step'):
+                new_state, re, done, info = self.envs[i].step(action[i])
+            if not isinstance(done, (bool, np.bool_)):
+                raise TypeError()
+            res.append((state[i], action[i], re, new_state, bool(done)))
+            if done:
+                self._last_obs[i] = self.envs[i].reset()
+                agent.reset_episode(index=i)
+            else:
+                self._last_obs[i] = new_state
+        return res
+
+    def _sample_transitions_vectorized(self, agent, sample_count):
+        sample_record = [TransitionData(env_spec=self.env_spec) for _ in range(self.env_num)]
+        left_count = sample_count
+        while left_count > 0:
+            # on the last tick only the first few sub-envs are stepped so exactly sample_count samples are returned
+            active_num = min(self.env_num, left_count)
+            for record, (state, action, re, new_state, done) in zip(sample_record, self._step_all(agent, active_num)):
+                record.append(state=state,
+                              action=action,
+                              reward=re,
+                              new_state=new_state,
+                              done=done)
+            left_count -= active_num
+        return sample_record
+
+    def _sample_trajectories_vectorized(self, agent, sample_count):
+        sample_record = [TrajectoryData(env_spec=self.env_spec) for _ in range(self.env_num)]
+        traj_record = [TransitionData(env_spec=self.env_spec) for _ in range(self.env_num)]
+        finished_count = 0
+        while finished_count < sample_count:
+            for i, (state, action, re, new_state, done) in enumerate(self._step_all(agent, self.env_num)):
+                traj_record[i].append(state=state,
+                                      action=action,
+                                      reward=re,
+                                      new_state=new_state,
+                                      done=done)
+                if done and finished_count < sample_count:
+                    sample_record[i].append(traj_record[i])
+                    traj_record[i] = TransitionData(env_spec=self.env_spec)
+                    finished_count += 1
+        # unfinished episodes are dropped, all the sub-envs start from a fresh episode at the next call
+        self._last_obs = None
+        return sample_record
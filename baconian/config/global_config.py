@@ -12,6 +12,8 @@ from baconian.common.error import *
 
 class _SingletonDefaultGlobalConfig(object):
     DEFAULT_MAX_TF_SAVER_KEEP = 5
+    # 'tf' saves the tf parameters by tf.train.Saver, 'npz' snapshots them into memory and writes them in background
+    DEFAULT_TF_CHECKPOINT_TYPE = 'tf'
     DEFAULT_ALLOWED_EXCEPTION_OR_ERROR_LIST = (tf.errors.ResourceExhaustedError,)
     DEFAULT_BASIC_STATUS_LIST = ('TRAIN', 'TEST')
     DEFAULT_BASIC_INIT_STATUS = None
@@ -51,6 +53,8 @@ class _SingletonDefaultGlobalConfig(object):
     DEFAULT_MODEL_CHECKPOINT_PATH = os.path.join(DEFAULT_LOG_PATH, 'model_checkpoints')
     DEFAULT_LOG_CONFIG_DICT = dict()
     DEFAULT_LOG_USE_GLOBAL_MEMO_FLAG = True
+    DEFAULT_LOG_FLUSH_RECORD_NUM = 10000
+    DEFAULT_PROFILE_FLAG = False
 
     DEFAULT_LOGGING_FORMAT = '%(levelname)s:%(asctime)-15s: %(message)s'
     DEFAULT_WRITE_CONSOLE_LOG_TO_FILE_FLAG = True
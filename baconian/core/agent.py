@@ -12,6 +12,7 @@ from baconian.core.util import init_func_arg_record_decorator
 from baconian.config.dict_config import DictConfig
 from baconian.common.misc import *
 from baconian.common.logging import ConsoleLogger
+from baconian.common.profiler import profile_decorator
 from baconian.common.sampler.sample_data import TransitionData, TrajectoryData
 from baconian.common.schedules import EventSchedule
 from baconian.common.noise import AgentActionNoiseWrapper
@@ -65,6 +66,7 @@ class Agent(Basic):
         self.algo_saving_scheduler = algo_saving_scheduler
 
     # @record_return_decorator(which_recorder='self')
+    @profile_decorator('agent/train')
     @register_counter_info_to_status_decorator(increment=1, info_key='update_counter', under_status='TRAIN')
     def train(self, *args, **kwargs):
         """
@@ -118,6 +120,7 @@ class Agent(Basic):
                               in_which_status='TEST')
             self.total_test_samples += len(res)
 
+    @profile_decorator('agent/predict')
     @register_counter_info_to_status_decorator(increment=1, info_key='predict_counter', under_status=('TRAIN', 'TEST'),
                                                ignore_wrong_status=True)
     def predict(self, **kwargs):
@@ -127,11 +130,15 @@ class Agent(Basic):
         :param obs: observation/state
         :return:
         """
+        if kwargs.get('batch_flag', False) is True:
+            # the decorator counts one prediction, count the rest of the rows (e.g. one for each sub-env) here
+            self._status.update_info(info_key='predict_counter', increment=len(kwargs['obs']) - 1)
         if self.explorations_strategy and not self.is_testing:
             return self.explorations_strategy.predict(**kwargs, algo=self.algo)
         else:
             if self.noise_adder and not self.is_testing:
-                return self.env_spec.action_space.clip(self.noise_adder(self.algo.predict(**kwargs)))
+                return self.env_spec.action_space.clip(
+                    self.noise_adder(self.algo.predict(**kwargs), batch_flag=kwargs.get('batch_flag', False)))
             else:
                 return self.algo.predict(**kwargs)
 
@@ -174,6 +181,14 @@ class Agent(Basic):
                                         log_val=batch_data.get_sum_of('reward_set'))
         return batch_data
 
+    def reset_episode(self, index: int = None):
+        """
+        Called by the sampler every time the env is reset.
+
+        :param index: sub-env reset by a VectorSampler, None if all the envs are reset
+        """
+        self.algo.reset_episode(index=index)
+
     def init(self):
         """
 
@@ -45,6 +45,14 @@ class Basic(object):
     def set_status(self, val):
         self._status.set_status(val)
 
+    def update_status_info(self, info_key: str, increment, under_status: str = None):
+        """
+        Add increment to the counter info_key of the status, for the counts which do not come from the methods
+        decorated by register_counter_info_to_status_decorator (e.g. the samples collected by other processes).
+        An increment of 0 creates the counter so it can be queried before the first count.
+        """
+        self._status.update_info(info_key=info_key, increment=increment, under_status=under_status)
+
     @property
     def name(self):
         return self._name
@@ -22,6 +22,34 @@ from baconian.core.status import *
 from baconian.core.flow.train_test_flow import Flow
 from baconian.core.global_var import reset_all as reset_global_var
 from baconian.common.logging import reset_logging
+from baconian.tf.tf_parameters import CheckpointWriter
+
+
+def register_default_global_status_of_agent_env(agent: Agent, env: Env):
+    """
+    Register the sample, update and env step counters of the agent and the env to the global status collector, which
+    are used by the end point of the experiment and the schedules.
+    """
+    get_global_status_collect().register_info_key_status(obj=agent,
+                                                         info_key='predict_counter',
+                                                         under_status='TRAIN',
+                                                         return_name='TOTAL_AGENT_TRAIN_SAMPLE_COUNT')
+    get_global_status_collect().register_info_key_status(obj=agent,
+                                                         info_key='predict_counter',
+                                                         under_status='TEST',
+                                                         return_name='TOTAL_AGENT_TEST_SAMPLE_COUNT')
+    get_global_status_collect().register_info_key_status(obj=agent,
+                                                         info_key='update_counter',
+                                                         under_status='TRAIN',
+                                                         return_name='TOTAL_AGENT_UPDATE_COUNT')
+    get_global_status_collect().register_info_key_status(obj=env,
+                                                         info_key='step',
+                                                         under_status='TEST',
+                                                         return_name='TOTAL_ENV_STEP_TEST_SAMPLE_COUNT')
+    get_global_status_collect().register_info_key_status(obj=env,
+                                                         info_key='step',
+                                                         under_status='TRAIN',
+                                                         return_name='TOTAL_ENV_STEP_TRAIN_SAMPLE_COUNT')
 
 
 class Experiment(Basic):
@@ -57,26 +85,7 @@ class Experiment(Basic):
         # self.status_collector = StatusCollector()
         self.flow = flow
         if register_default_global_status is True:
-            get_global_status_collect().register_info_key_status(obj=agent,
-                                                                 info_key='predict_counter',
-                                                                 under_status='TRAIN',
-                                                                 return_name='TOTAL_AGENT_TRAIN_SAMPLE_COUNT')
-            get_global_status_collect().register_info_key_status(obj=agent,
-                                                                 info_key='predict_counter',
-                                                                 under_status='TEST',
-                                                                 return_name='TOTAL_AGENT_TEST_SAMPLE_COUNT')
-            get_global_status_collect().register_info_key_status(obj=agent,
-                                                                 info_key='update_counter',
-                                                                 under_status='TRAIN',
-                                                                 return_name='TOTAL_AGENT_UPDATE_COUNT')
-            get_global_status_collect().register_info_key_status(obj=env,
-                                                                 info_key='step',
-                                                                 under_status='TEST',
-                                                                 return_name='TOTAL_ENV_STEP_TEST_SAMPLE_COUNT')
-            get_global_status_collect().register_info_key_status(obj=env,
-                                                                 info_key='step',
-                                                                 under_status='TRAIN',
-                                                                 return_name='TOTAL_ENV_STEP_TRAIN_SAMPLE_COUNT')
+            register_default_global_status_of_agent_env(agent=agent, env=env)
 
     def init(self):
         create_new_tf_session(cuda_device=0)
@@ -95,6 +104,7 @@ class Experiment(Basic):
         self._exit()
 
     def _exit(self):
+        CheckpointWriter().wait()
         sess = tf.get_default_session()
         if sess:
             sess.__exit__(None, None, None)
@@ -1,6 +1,9 @@
+import multiprocessing as mp
 import os
 import random
 import time
+import traceback
+from multiprocessing.connection import wait
 
 import numpy as np
 import tensorflow as tf
@@ -10,6 +13,7 @@ from typeguard import typechecked
 from baconian.common import files as file
 from baconian.common.logging import Logger, ConsoleLogger
 from baconian.config.global_config import GlobalConfig
+from baconian.tf.tf_parameters import CheckpointWriter
 from copy import deepcopy
 
 
@@ -34,7 +38,7 @@ def single_exp_runner(task_fn, auto_choose_gpu_flag=False, gpu_id: int = 0, seed
     :param seed:
     :param task_fn_kwargs:
     :param del_if_log_path_existed
-    :return:
+    :return: return value of task_fn
     """
     os.environ['CUDA_DEVICE_ORDER'] = "PCI_BUS_ID"
     if auto_choose_gpu_flag is True:
@@ -58,7 +62,7 @@ def single_exp_runner(task_fn, auto_choose_gpu_flag=False, gpu_id: int = 0, seed
                          level=GlobalConfig().DEFAULT_LOG_LEVEL,
                          logger_name=GlobalConfig().DEFAULT_CONSOLE_LOGGER_NAME)
 
-    task_fn(**task_fn_kwargs)
+    return task_fn(**task_fn_kwargs)
 
 
 @typechecked
@@ -84,3 +88,152 @@ def duplicate_exp_runner(num, task_fn, auto_choose_gpu_flag=False, gpu_id: int =
         single_exp_runner(task_fn=task_fn, auto_choose_gpu_flag=auto_choose_gpu_flag,
                           del_if_log_path_existed=del_if_log_path_existed,
                           gpu_id=gpu_id, seed=seeds[i] if seeds else None, **task_fn_kwargs)
+
+
+def _process_pool_entry(conn, run_fn, job, config_dict, cpu_list, tf_thread_num):
+    res = dict(index=job['index'], seed=job['seed'], log_path=job['log_path'], status='CRASHED', result=None,
+               error=None)
+    try:
+        if cpu_list and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpu_list)
+        # thread budget of the tf session created by the experiment (see baconian.tf.util.make_session) and of the
+        # numpy/blas thread pools
+        os.environ['RCALL_NUM_CPU'] = str(tf_thread_num)
+        os.environ['OMP_NUM_THREADS'] = str(tf_thread_num)
+        GlobalConfig().set_new_config(config_dict)
+        GlobalConfig().set('DEFAULT_LOG_PATH', job['log_path'])
+        res['status'], res['result'] = run_fn(job)
+    except BaseException:
+        res['error'] = traceback.format_exc()
+    finally:
+        # the experiment resets the logging when it exits, only the records and checkpoints still queued need to be
+        # written
+        Logger().wait_flush()
+        CheckpointWriter().wait()
+    try:
+        conn.send(res)
+    except Exception:
+        # e.g. the return value of task_fn can not be pickled
+        res['result'] = None
+        res['status'] = 'CRASHED'
+        res['error'] = traceback.format_exc()
+        conn.send(res)
+    conn.close()
+
+
+def run_in_process_pool(run_fn, job_list: list, process_num: int = None, tf_thread_num: int = None,
+                        cpu_affinity_flag=True, mp_context: str = 'spawn') -> list:
+    """
+    Run each job in a fresh process, at most process_num at the same time. Each process is pinned to its own slice of
+    the cpus, gets a copy of the GlobalConfig of the calling process (the entries that can be json dumped) and logs
+    into the log_path of its job.
+
+    :param run_fn: module level function called as run_fn(job) in the worker process, returns (status, result)
+    :param job_list: list of dict with at least the keys index, seed and log_path, pickled to the worker processes
+    :param process_num: number of processes run at the same time, number of cpus if None
+    :param tf_thread_num: inter/intra op threads of the tf session of each process, the cpus of each process if None
+    :param cpu_affinity_flag: pin each process to its own slice of the cpus
+    :param mp_context: multiprocessing start method, 'spawn' so that no tf runtime is inherited from the parent
+    :return: list of dict (index, seed, log_path, status, result, error traceback) in the order of job_list, the
+    status is 'CRASHED' if run_fn raised or the process died
+    """
+    cpu_list = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(mp.cpu_count()))
+    process_num = min(len(job_list), process_num if process_num else len(cpu_list))
+    if process_num == 0:
+        return []
+    cpu_per_process = max(1, len(cpu_list) // process_num)
+    slot_cpu_list = [cpu_list[(i * cpu_per_process) % len(cpu_list):][:cpu_per_process] for i in range(process_num)]
+    tf_thread_num = tf_thread_num if tf_thread_num else cpu_per_process
+
+    config_dict = {key: val for key, val in GlobalConfig().return_all_as_dict().items()
+                   if val != 'cannot be json dumped'}
+    ctx = mp.get_context(mp_context)
+    pending = list(range(len(job_list)))
+    free_slots = list(range(process_num))
+    running = dict()
+    results = [None] * len(job_list)
+    while len(pending) > 0 or len(running) > 0:
+        while len(pending) > 0 and len(free_slots) > 0:
+            i = pending.pop(0)
+            slot = free_slots.pop(0)
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=_process_pool_entry,
+                            args=(send_conn, run_fn, job_list[i], config_dict,
+                                  slot_cpu_list[slot] if cpu_affinity_flag else None, tf_thread_num))
+            p.start()
+            send_conn.close()
+            running[i] = (p, recv_conn, slot)
+        # results are received as soon as they are sent, so a large result never blocks the exit of a worker
+        wait([p.sentinel for p, _, _ in running.values()] + [conn for _, conn, _ in running.values()])
+        for i, (p, conn, slot) in list(running.items()):
+            if results[i] is None and conn.poll():
+                try:
+                    results[i] = conn.recv()
+                except EOFError:
+                    pass
+            if p.is_alive():
+                continue
+            p.join()
+            if results[i] is None and conn.poll():
+                try:
+                    results[i] = conn.recv()
+                except EOFError:
+                    pass
+            conn.close()
+            job = job_list[i]
+            if results[i] is None:
+                results[i] = dict(index=job['index'], seed=job['seed'], log_path=job['log_path'], status='CRASHED',
+                                  result=None, error='process exited with code {}'.format(p.exitcode))
+            if results[i]['status'] == 'CRASHED':
+                print('experiment {} (seed {}) crashed:\n{}'.format(job['index'], job['seed'], results[i]['error']),
+                      flush=True)
+            free_slots.append(slot)
+            del running[i]
+    return results
+
+
+def _run_exp_job(job):
+    return 'FINISHED', single_exp_runner(task_fn=job['task_fn'], auto_choose_gpu_flag=job['auto_choose_gpu_flag'],
+                                         gpu_id=job['gpu_id'], seed=job['seed'],
+                                         del_if_log_path_existed=job['del_if_log_path_existed'],
+                                         **job['task_fn_kwargs'])
+
+
+@typechecked
+def parallel_exp_runner(num, task_fn, process_num: int = None, tf_thread_num: int = None, cpu_affinity_flag=True,
+                        auto_choose_gpu_flag=False, gpu_id: int = 0, seeds: list = None, del_if_log_path_existed=False,
+                        mp_context: str = 'spawn', **task_fn_kwargs) -> list:
+    """
+    Run num experiments (one per seed) concurrently, each in a fresh process with its own log path
+    (DEFAULT_LOG_PATH/exp_{i} as duplicate_exp_runner), tf thread budget and cpu affinity. An experiment that raises or
+    whose process dies is reported as crashed and does not affect the others.
+
+    task_fn and task_fn_kwargs are pickled to the worker processes, so task_fn should be a module level function.
+    The GlobalConfig of the calling process is copied to the workers (the entries that can be json dumped).
+
+    :param num: number of experiments
+    :param task_fn:
+    :param process_num: number of experiments run at the same time, number of cpus if None
+    :param tf_thread_num: inter/intra op threads of the tf session of each experiment, the cpus of each process if None
+    :param cpu_affinity_flag: pin each process to its own slice of the cpus
+    :param auto_choose_gpu_flag:
+    :param gpu_id:
+    :param seeds:
+    :param del_if_log_path_existed:
+    :param mp_context: multiprocessing start method, 'spawn' so that no tf runtime is inherited from the parent
+    :param task_fn_kwargs:
+    :return: list of dict (index, seed, log_path, status ('FINISHED' or 'CRASHED'), result of task_fn, error
+    traceback) ordered by the experiment index
+    """
+    if seeds:
+        assert len(seeds) == num
+    else:
+        base_seed = int(round(time.time() * 1000)) % (2 ** 32 - 1 - num)
+        seeds = [base_seed + i for i in range(num)]
+    base_log_path = deepcopy(GlobalConfig().DEFAULT_LOG_PATH)
+    job_list = [dict(index=i, seed=seeds[i], log_path=os.path.join(base_log_path, 'exp_{}'.format(i)),
+                     task_fn=task_fn, auto_choose_gpu_flag=auto_choose_gpu_flag, gpu_id=gpu_id,
+                     del_if_log_path_existed=del_if_log_path_existed, task_fn_kwargs=task_fn_kwargs)
+                for i in range(num)]
+    return run_in_process_pool(_run_exp_job, job_list=job_list, process_num=process_num, tf_thread_num=tf_thread_num,
+                               cpu_affinity_flag=cpu_affinity_flag, mp_context=mp_context)
@@ -0,0 +1,247 @@
+"""
+Actor-learner flow for the off-policy algorithms (DDPG, DQN) on one multi-core host. Each actor process runs its own
+copy of the agent and its env, samples with the latest policy weights published by the learner into shared memory,
+and streams the transitions to the learner through a queue. The learner stores them into the replay buffer of its
+agent and trains continuously.
+"""
+import multiprocessing as mp
+import os
+import queue
+import random
+
+import numpy as np
+import tensorflow as tf
+
+from baconian.algo.rl.model_free.ddpg import DDPG
+from baconian.algo.rl.model_free.dqn import DQN
+from baconian.common.logging import ConsoleLogger
+from baconian.common.misc import *
+from baconian.common.sampler.sample_data import TransitionData
+from baconian.config.dict_config import DictConfig
+from baconian.core.experiment import register_default_global_status_of_agent_env
+from baconian.core.flow.train_test_flow import TrainTestFlow
+from baconian.core.status import *
+from baconian.tf.util import create_new_tf_session
+
+
+def acting_parameters(algo):
+    """
+
+    :return: the parameters of the network used by the algo to choose the actions, which are sent to the actors
+    """
+    if isinstance(algo, DDPG):
+        return algo.actor.parameters
+    if isinstance(algo, DQN):
+        return algo.q_value_func.parameters
+    raise TypeError('actor-learner flow only supports DDPG and DQN instead of {}'.format(type(algo).__name__))
+
+
+def _actor_worker(index, actor_agent_fn, actor_agent_fn_kwargs, seed, sample_count, weight_buf, weight_dtype,
+                  weight_version, weight_lock, sample_queue, stop_event):
+    # the actors only run small forward passes, one thread each keeps them from competing for the cores
+    os.environ['RCALL_NUM_CPU'] = '1'
+    os.environ['OMP_NUM_THREADS'] = '1'
+    tf.set_random_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+    ConsoleLogger().init(to_file_flag=False, level='ERROR', logger_name='actor_{}'.format(index))
+    create_new_tf_session(cuda_device=-1)
+    agent = actor_agent_fn(**actor_agent_fn_kwargs)
+    # the schedules (e.g. of the exploration) of an actor follow its own sample count
+    register_default_global_status_of_agent_env(agent=agent, env=agent.env)
+    agent.init()
+    agent.env.init()
+    parameters = acting_parameters(agent.algo)
+    weights = np.frombuffer(weight_buf, dtype=weight_dtype)
+    local_version = 0
+    try:
+        while not stop_event.is_set():
+            if weight_version.value != local_version:
+                with weight_lock:
+                    flat_vec = weights.copy()
+                    local_version = weight_version.value
+                parameters.set_flat(flat_vec)
+            batch_data = agent.sample(env=agent.env, sample_count=sample_count, in_which_status='TRAIN',
+                                      store_flag=False)
+            # the actors do not log, drop the records of the sampling
+            agent.recorder.pop_obj_log()
+            samples = {key: batch_data(key) for key in ('state_set', 'new_state_set', 'action_set', 'reward_set',
+                                                        'done_set')}
+            while not stop_event.is_set():
+                try:
+                    sample_queue.put(samples, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+    except KeyboardInterrupt:
+        pass
+
+
+class ActorLearnerFlow(TrainTestFlow):
+    """
+    The learner side of the actor-learner architecture. actor_agent_fn builds the agent (with its env) of each actor in
+    its own process, so it should be a module level function building the same networks as the agent of the learner.
+    The transitions received from the actors are counted as the train samples of the agent and the train steps of the
+    env of the learner, so the end point and the test schedule of the experiment work as with TrainTestFlow.
+    """
+    required_func = ('train', 'test')
+    required_key_dict = {
+        "TEST_EVERY_SAMPLE_COUNT": 1000,
+        "START_TRAIN_AFTER_SAMPLE_COUNT": 1,
+        "START_TEST_AFTER_SAMPLE_COUNT": 1,
+        "ACTOR_NUM": 2,
+        "ACTOR_SAMPLE_COUNT": 100,
+        "SYNC_WEIGHT_EVERY_TRAIN": 1,
+    }
+
+    def __init__(self,
+                 agent,
+                 actor_agent_fn,
+                 config_or_config_dict: (DictConfig, dict),
+                 func_dict: dict,
+                 train_sample_count_func=None,
+                 actor_agent_fn_kwargs: dict = None,
+                 queue_size: int = None,
+                 mp_context: str = 'spawn'):
+        """
+
+        :param agent: agent of the learner
+        :param actor_agent_fn: module level function returning the agent of an actor
+        :param config_or_config_dict: ACTOR_NUM actors each send ACTOR_SAMPLE_COUNT transitions at a time, the weights
+        are sent to the actors every SYNC_WEIGHT_EVERY_TRAIN calls of train
+        :param func_dict: train and test functions of the learner
+        :param train_sample_count_func: TOTAL_AGENT_TRAIN_SAMPLE_COUNT of the global status by default
+        :param actor_agent_fn_kwargs:
+        :param queue_size: max number of sample batches waiting for the learner, 4 per actor by default
+        :param mp_context: multiprocessing start method of the actors
+        """
+        if train_sample_count_func is None:
+            def train_sample_count_func():
+                return get_global_status_collect()('TOTAL_AGENT_TRAIN_SAMPLE_COUNT')
+        super(ActorLearnerFlow, self).__init__(train_sample_count_func=train_sample_count_func,
+                                               config_or_config_dict=config_or_config_dict,
+                                               func_dict=func_dict)
+        acting_parameters(agent.algo)
+        self.agent = agent
+        self.actor_agent_fn = actor_agent_fn
+        self.actor_agent_fn_kwargs = actor_agent_fn_kwargs if actor_agent_fn_kwargs else dict()
+        self.queue_size = queue_size if queue_size else 4 * self.parameters('ACTOR_NUM')
+        self.mp_context = mp_context
+        self.train_count = 0
+        self._actors = []
+        self._sample_queue = None
+        self._stop_event = None
+        self._weights = None
+        self._weight_version = None
+        self._weight_lock = None
+
+    def _launch(self) -> bool:
+        # the learner never samples by itself, create its counters so the sample count is 0 until the first batch
+        self.agent.update_status_info(info_key='predict_counter', increment=0, under_status='TRAIN')
+        self.agent.update_status_info(info_key='update_counter', increment=0, under_status='TRAIN')
+        self.agent.env.update_status_info(info_key='step', increment=0, under_status='TRAIN')
+        self._start_actors()
+        try:
+            while True:
+                self._check_actors()
+                started = self.time_step_func() > self.parameters('START_TRAIN_AFTER_SAMPLE_COUNT')
+                # wait for the samples until the training starts, then only take the ones already sent
+                self._receive_samples(block=not started)
+                if started:
+                    self._call_func('train')
+                    self.train_count += 1
+                    if self.train_count % self.parameters('SYNC_WEIGHT_EVERY_TRAIN') == 0:
+                        self._publish_weights()
+                if self.time_step_func() - self.parameters(
+                        'TEST_EVERY_SAMPLE_COUNT') >= self.last_test_point and self.time_step_func() > self.parameters(
+                    'START_TEST_AFTER_SAMPLE_COUNT'):
+                    self.last_test_point = self.time_step_func()
+                    self._call_func('test')
+                if self._is_ended() is True:
+                    break
+        finally:
+            self._stop_actors()
+        return True
+
+    def _start_actors(self):
+        ctx = mp.get_context(self.mp_context)
+        flat_vec = acting_parameters(self.agent.algo).get_flat()
+        weight_buf = ctx.RawArray('f' if flat_vec.dtype == np.float32 else 'd', len(flat_vec))
+        self._weights = np.frombuffer(weight_buf, dtype=flat_vec.dtype)
+        self._weight_version = ctx.Value('i', 0)
+        self._weight_lock = ctx.Lock()
+        self._sample_queue = ctx.Queue(maxsize=self.queue_size)
+        self._stop_event = ctx.Event()
+        self._publish_weights(flat_vec)
+        base_seed = np.random.randint(2 ** 31 - 1 - self.parameters('ACTOR_NUM'))
+        for i in range(self.parameters('ACTOR_NUM')):
+            p = ctx.Process(target=_actor_worker,
+                            args=(i, self.actor_agent_fn, self.actor_agent_fn_kwargs, base_seed + i,
+                                  self.parameters('ACTOR_SAMPLE_COUNT'), weight_buf, flat_vec.dtype,
+                                  self._weight_version, self._weight_lock, self._sample_queue, self._stop_event))
+            p.daemon = True
+            p.start()
+            self._actors.append(p)
+
+    def _stop_actors(self):
+        if self._stop_event is None:
+            return
+        self._stop_event.set()
+        for p in self._actors:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+        self._actors = []
+        # drop the samples left in the queue so its feeder thread can exit
+        while True:
+            try:
+                self._sample_queue.get_nowait()
+            except queue.Empty:
+                break
+        self._sample_queue.close()
+        self._stop_event = None
+
+    def _publish_weights(self, flat_vec=None):
+        flat_vec = flat_vec if flat_vec is not None else acting_parameters(self.agent.algo).get_flat()
+        with self._weight_lock:
+            self._weights[:] = flat_vec
+            self._weight_version.value += 1
+
+    def _receive_samples(self, block: bool):
+        """
+        Store the sample batches sent by the actors into the memory of the agent, at most one batch per actor per
+        call so the training is never starved.
+
+        :param block: wait for at least one batch
+        """
+        for i in range(self.parameters('ACTOR_NUM')):
+            try:
+                if block and i == 0:
+                    samples = self._get_blocking()
+                else:
+                    samples = self._sample_queue.get_nowait()
+            except queue.Empty:
+                break
+            batch_data = TransitionData(env_spec=self.agent.env_spec)
+            batch_data.append_batch(state=samples['state_set'], action=samples['action_set'],
+                                    new_state=samples['new_state_set'], done=samples['done_set'],
+                                    reward=samples['reward_set'])
+            self.agent.store_samples(samples=batch_data)
+            # count the samples of the actors as the train samples of the learner
+            self.agent.update_status_info(info_key='predict_counter', increment=len(batch_data), under_status='TRAIN')
+            self.agent.env.update_status_info(info_key='step', increment=len(batch_data), under_status='TRAIN')
+
+    def _get_blocking(self):
+        while True:
+            try:
+                return self._sample_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._check_actors()
+
+    def _check_actors(self):
+        """
+        Raise once all the actors exited, otherwise the sample count would never reach the end point.
+        """
+        if not any(p.is_alive() for p in self._actors):
+            raise RuntimeError('all the actors exited with code {}'.format([p.exitcode for p in self._actors]))
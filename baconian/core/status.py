@@ -51,8 +51,31 @@ class Status(object):
     def get_status(self) -> dict:
         return self()
 
+    @property
+    def status_val(self):
+        return self._status_val
+
 
 class StatusWithInfo(Status):
+    def __init__(self, obj):
+        super().__init__(obj)
+        # (info_key, status) of the counters already created by register_counter
+        self._registered_counter = set()
+
+    def register_counter(self, info_key: str, under_status: tuple):
+        """
+        Create the counter info_key (with value 0) under each status in under_status (None for the current status).
+        Called on every call of a decorated method, so only the first call for a (key, status) does the real work.
+
+        :param info_key:
+        :param under_status: tuple of status
+        """
+        for st in under_status:
+            st = st if st else self._status_val
+            if (info_key, st) not in self._registered_counter:
+                self.append_new_info(info_key=info_key, init_value=0, under_status=st)
+                self._registered_counter.add((info_key, st))
+
     @abc.abstractmethod
     def append_new_info(self, *args, **kwargs):
         raise NotImplementedError
@@ -111,12 +134,15 @@ class StatusWithSingleInfo(StatusWithInfo):
         return info_key in self._info_dict
 
     def update_info(self, info_key, increment, under_status=None):
-        if not self.has_info(info_key=info_key):
+        try:
+            self._info_dict[info_key] += increment
+        except KeyError:
             self.append_new_info(info_key=info_key, init_value=0)
-        self._info_dict[info_key] += increment
+            self._info_dict[info_key] += increment
 
     def reset(self):
         self._info_dict = {}
+        self._registered_counter = set()
 
 
 class StatusWithSubInfo(StatusWithInfo):
@@ -189,50 +215,45 @@ class StatusWithSubInfo(StatusWithInfo):
     def update_info(self, info_key, increment, under_status=None):
         if not under_status:
             under_status = self._status_val
-        if not self.has_info(info_key=info_key, under_status=under_status):
+        try:
+            self._info_dict_with_sub_info[under_status][info_key] += increment
+        except KeyError:
             self.append_new_info(info_key=info_key, init_value=0, under_status=under_status)
-        self._info_dict_with_sub_info[under_status][info_key] += increment
+            self._info_dict_with_sub_info[under_status][info_key] += increment
 
     def reset(self):
         for key in self._status_list:
             self._info_dict_with_sub_info[key] = {}
+        self._registered_counter = set()
 
 
 class StatusCollector(object):
+    """
+    Collect the counters registered from different objects under a return name. The registered entries are kept in
+    a dict by return name, so querying one counter (e.g. in the end point check of the flows) is a single lookup.
+    """
 
     def __init__(self):
-        self._register_status_dict = []
+        self._register_status_dict = dict()
 
     def __call__(self, key: str = None, *args, **kwargs):
         if key:
-            for val in self._register_status_dict:
-                if val['return_name'] == key:
-                    obj = val['obj']
-                    assert hasattr(obj, '_status')
-                    assert isinstance(getattr(obj, '_status'), StatusWithInfo)
-                    if getattr(obj, '_status').has_info(info_key=val['info_key'],
-                                                        under_status=val['under_status']) is False:
-                        raise StatusInfoNotRegisteredError(
-                            '{} do not have {} under {}'.format(obj, val['info_key'], val['under_status']))
-
-                    res = obj._status.get_specific_info_key_status(under_status=val['under_status'],
-                                                                   info_key=val['info_key'])
-                    return deepcopy(res)
+            if key not in self._register_status_dict:
+                return None
+            return self._get_info(self._register_status_dict[key])
         else:
-            stat_dict = dict()
-            for val in self._register_status_dict:
-                obj = val['obj']
-                assert hasattr(obj, '_status')
-                assert isinstance(getattr(obj, '_status'), StatusWithInfo)
-                if getattr(obj, '_status').has_info(info_key=val['info_key'],
-                                                    under_status=val['under_status']) is False:
-                    raise StatusInfoNotRegisteredError(
-                        '{} do not have {} under {}'.format(obj, val['info_key'], val['under_status']))
-
-                res = obj._status.get_specific_info_key_status(under_status=val['under_status'],
-                                                               info_key=val['info_key'])
-                stat_dict[val['return_name']] = deepcopy(res)
-            return stat_dict
+            return {return_name: self._get_info(val) for return_name, val in self._register_status_dict.items()}
+
+    @staticmethod
+    def _get_info(val: dict):
+        obj_status = getattr(val['obj'], '_status', None)
+        assert isinstance(obj_status, StatusWithInfo)
+        if obj_status.has_info(info_key=val['info_key'], under_status=val['under_status']) is False:
+            raise StatusInfoNotRegisteredError(
+                '{} do not have {} under {}'.format(val['obj'], val['info_key'], val['under_status']))
+        res = obj_status.get_specific_info_key_status(under_status=val['under_status'], info_key=val['info_key'])
+        # the counters are scalars, other values are copied so the returned value is a snapshot
+        return res if np.isscalar(res) else deepcopy(res)
 
     def get_status(self) -> dict:
         return self()
@@ -242,10 +263,9 @@ class StatusCollector(object):
                               'registered obj: {}, key: {}, return name: {}, under status: {}'.format(obj, info_key,
                                                                                                       return_name,
                                                                                                       under_status))
-        for val in self._register_status_dict:
-            assert return_name != val['return_name']
-        self._register_status_dict.append(
-            dict(obj=obj, info_key=info_key, under_status=under_status, return_name=return_name))
+        assert return_name not in self._register_status_dict
+        self._register_status_dict[return_name] = dict(obj=obj, info_key=info_key, under_status=under_status,
+                                                       return_name=return_name)
         try:
             self(info_key)
         except StatusInfoNotRegisteredError as e:
@@ -256,7 +276,7 @@ class StatusCollector(object):
                                       under_status))
 
     def reset(self):
-        self._register_status_dict = []
+        self._register_status_dict = dict()
 
 
 def register_counter_info_to_status_decorator(increment, info_key, under_status: (str, tuple) = None,
@@ -271,28 +291,24 @@ def register_counter_info_to_status_decorator(increment, info_key, under_status:
 
         else:
             final_st = (None,)
+        check_st = tuple(st for st in final_st if st) if not ignore_wrong_status else ()
 
         @wraps(fn)
         def wrap_with_self(self, *args, **kwargs):
             # todo record() called in fn will lost the just appended info_key at the very first
-            obj = self
-            if not hasattr(obj, '_status') or not isinstance(getattr(obj, '_status'), StatusWithInfo):
+            obj_status = getattr(self, '_status', None)
+            if not isinstance(obj_status, StatusWithInfo):
                 raise ValueError(
                     ' the object {} does not not have attribute StatusWithInfo instance or hold wrong type of Status'.format(
-                        obj))
-
-            assert isinstance(getattr(obj, '_status'), StatusWithInfo)
-            obj_status = getattr(obj, '_status')
-            for st in final_st:
-                obj_status.append_new_info(info_key=info_key, init_value=0, under_status=st)
+                        self))
+            obj_status.register_counter(info_key=info_key, under_status=final_st)
             res = fn(self, *args, **kwargs)
-            for st in final_st:
-                if st and st != obj.get_status()['status'] and not ignore_wrong_status:
+            current_st = obj_status.status_val
+            for st in check_st:
+                if st != current_st:
                     raise ValueError('register counter info under status: {} but got status {}'.format(st,
-                                                                                                       obj.get_status()[
-                                                                                                           'status']))
-            obj_status.update_info(info_key=info_key, increment=increment,
-                                   under_status=obj.get_status()['status'])
+                                                                                                       current_st))
+            obj_status.update_info(info_key=info_key, increment=increment, under_status=current_st)
             return res
 
         return wrap_with_self
@@ -1,9 +1,337 @@
-from baconian.common.logging import Recorder
+"""
+Hyper parameter tuning: the trials are sampled from a search space over the keys of an experiment config dict (random
+or grid search), each trial is run by single_exp_runner in its own process, and the trials that fall behind are pruned
+by asynchronous successive halving (ASHA) on an intermediate value recorded by the Recorder (e.g. sum_reward of the
+test samples).
+"""
+import itertools
+import math
+import multiprocessing as mp
+import os
+import time
+from copy import deepcopy
+
+import numpy as np
+from typeguard import typechecked
+
+from baconian.common import files as file
+from baconian.common.error import InappropriateParameterSetting, MissedConfigError, TrialPrunedError
+from baconian.common.logging import register_record_listener, remove_record_listener, reset_logging
+from baconian.config.global_config import GlobalConfig
+from baconian.core.experiment_runner import single_exp_runner, run_in_process_pool
+
+
+class SearchSpace(object):
+    def sample(self, rng: np.random.RandomState):
+        raise NotImplementedError
+
+    def grid(self) -> list:
+        raise NotImplementedError
+
+
+class Choice(SearchSpace):
+    @typechecked
+    def __init__(self, values: (list, tuple)):
+        assert len(values) > 0
+        self.values = list(values)
+
+    def sample(self, rng: np.random.RandomState):
+        return self.values[rng.randint(len(self.values))]
+
+    def grid(self) -> list:
+        return list(self.values)
+
+
+class Uniform(SearchSpace):
+    @typechecked
+    def __init__(self, low: (int, float), high: (int, float), grid_num: int = None):
+        """
+
+        :param low:
+        :param high:
+        :param grid_num: number of evenly spaced values (both ends included) used by the grid search
+        """
+        assert low < high
+        self.low = float(low)
+        self.high = float(high)
+        self.grid_num = grid_num
+
+    def sample(self, rng: np.random.RandomState):
+        return float(rng.uniform(self.low, self.high))
+
+    def grid(self) -> list:
+        if not self.grid_num:
+            raise InappropriateParameterSetting('set grid_num of {} to use it in the grid search'.format(
+                type(self).__name__))
+        return [float(v) for v in np.linspace(self.low, self.high, self.grid_num)]
+
+
+class LogUniform(Uniform):
+    def __init__(self, low: (int, float), high: (int, float), grid_num: int = None):
+        assert low > 0
+        super().__init__(low=low, high=high, grid_num=grid_num)
+
+    def sample(self, rng: np.random.RandomState):
+        return float(np.exp(rng.uniform(np.log(self.low), np.log(self.high))))
+
+    def grid(self) -> list:
+        if not self.grid_num:
+            raise InappropriateParameterSetting('set grid_num of {} to use it in the grid search'.format(
+                type(self).__name__))
+        return [float(v) for v in np.geomspace(self.low, self.high, self.grid_num)]
+
+
+class IntUniform(SearchSpace):
+    @typechecked
+    def __init__(self, low: int, high: int):
+        """
+        Integers from low to high, both included.
+        """
+        assert low <= high
+        self.low = low
+        self.high = high
+
+    def sample(self, rng: np.random.RandomState):
+        return int(rng.randint(self.low, self.high + 1))
+
+    def grid(self) -> list:
+        return list(range(self.low, self.high + 1))
+
+
+def set_by_key_path(config: dict, key_path: str, val):
+    """
+    Set the value of a nested config dict, the keys of each level are separated by '/', e.g.
+    'DDPG/config_or_config_dict/CRITIC_LEARNING_RATE'.
+    """
+    keys = key_path.split('/')
+    d = config
+    for key in keys[:-1]:
+        if key not in d or not isinstance(d[key], dict):
+            raise MissedConfigError('key {} of {} not in the config'.format(key, key_path))
+        d = d[key]
+    if keys[-1] not in d:
+        raise MissedConfigError('key {} of {} not in the config'.format(keys[-1], key_path))
+    d[keys[-1]] = val
+
+
+class _AshaReporter(object):
+    """
+    Record listener of a trial, it collects the values of the metric and prunes the trial at the rungs (the
+    grace_report_num * reduction_factor ** k th report) if its value is not in the top 1 / reduction_factor of the
+    values reached at the same rung by all the trials so far.
+    """
+
+    def __init__(self, metric, metric_status, mode, asha_flag, grace_report_num, reduction_factor, rung_dict, lock):
+        self.metric = metric
+        self.metric_status = metric_status
+        self.mode = mode
+        self.asha_flag = asha_flag
+        self.grace_report_num = grace_report_num
+        self.reduction_factor = reduction_factor
+        self.rung_dict = rung_dict
+        self.lock = lock
+        self.values = []
+
+    def __call__(self, obj, attr_name, status_info, log_val):
+        if attr_name != self.metric or status_info.get('status') != self.metric_status:
+            return
+        self.values.append(float(log_val))
+        report_num = len(self.values)
+        if self.asha_flag is not True or not self._is_rung(report_num):
+            return
+        val = self.values[-1] if self.mode == 'max' else -self.values[-1]
+        with self.lock:
+            rung_values = self.rung_dict.get(report_num, []) + [val]
+            self.rung_dict[report_num] = rung_values
+        cutoff = np.percentile(rung_values, (1.0 - 1.0 / self.reduction_factor) * 100.0)
+        if val < cutoff:
+            raise TrialPrunedError('{} {} at report {} is out of the top 1/{} of the rung'.format(
+                self.metric, self.values[-1], report_num, self.reduction_factor))
+
+    def _is_rung(self, report_num):
+        rung = self.grace_report_num
+        while rung < report_num:
+            rung *= self.reduction_factor
+        return rung == report_num
+
+
+def _run_trial_job(job):
+    reporter = _AshaReporter(**job['reporter_kwargs'])
+    register_record_listener(reporter)
+    result = None
+    try:
+        result = single_exp_runner(task_fn=job['task_fn'], auto_choose_gpu_flag=job['auto_choose_gpu_flag'],
+                                   gpu_id=job['gpu_id'], seed=job['seed'], del_if_log_path_existed=True,
+                                   **{job['config_kwarg_name']: job['trial_config']}, **job['task_fn_kwargs'])
+        status = 'FINISHED'
+    except TrialPrunedError:
+        # the experiment stopped before its exit, save its logs here
+        reset_logging()
+        status = 'PRUNED'
+    finally:
+        remove_record_listener(reporter)
+    return status, dict(task_fn_result=result, values=reporter.values)
 
 
 class Tuner(object):
     """
-    Auto hyper parameter tuning module, tobe done
+    Hyper parameter search over an experiment config, the trials run concurrently in a process pool (see
+    baconian.core.experiment_runner.run_in_process_pool) and log into DEFAULT_LOG_PATH/trial_{i}.
+
+    task_fn is called as task_fn(**{config_kwarg_name: trial_config}, **task_fn_kwargs), where trial_config is a copy of
+    base_config with the sampled values, so task_fn should build the experiment from the config it is given and be a
+    module level function.
     """
-    def __init__(self):
-        self.recorder = Recorder()
+    SEARCH_TYPE = ('random', 'grid')
+    MODE = ('max', 'min')
+    RESULT_FILE_NAME = 'tuner_result.json'
+
+    @typechecked
+    def __init__(self, task_fn, search_space: dict, base_config: dict, search_type: str = 'random',
+                 trial_num: int = 10, config_kwarg_name: str = 'exp_config', metric: str = 'sum_reward',
+                 metric_status: str = 'TEST', mode: str = 'max', asha_flag: bool = True, grace_report_num: int = 1,
+                 reduction_factor: int = 3, seed: int = None, process_num: int = None, tf_thread_num: int = None,
+                 cpu_affinity_flag: bool = True, auto_choose_gpu_flag: bool = False, gpu_id: int = 0,
+                 mp_context: str = 'spawn', **task_fn_kwargs):
+        """
+
+        :param task_fn:
+        :param search_space: dict of key path ('/' separated keys of base_config) to SearchSpace
+        :param base_config: experiment config dict shared by the trials
+        :param search_type: 'random' samples trial_num configs, 'grid' runs all the combinations (trial_num is ignored)
+        :param trial_num:
+        :param config_kwarg_name: name of the keyword argument of task_fn that receives the trial config
+        :param metric: attribute name of the records used to compare the trials
+        :param metric_status: only the records under this status are used
+        :param mode: 'max' or 'min' the metric
+        :param asha_flag: prune the trials by asynchronous successive halving
+        :param grace_report_num: number of reports of the metric before the first rung
+        :param reduction_factor: only the top 1 / reduction_factor trials go on at each rung
+        :param seed: seed of the search, the trial i is run with seed + i
+        :param process_num: number of trials run at the same time, number of cpus if None
+        :param tf_thread_num:
+        :param cpu_affinity_flag:
+        :param auto_choose_gpu_flag:
+        :param gpu_id:
+        :param mp_context:
+        :param task_fn_kwargs:
+        """
+        if search_type not in self.SEARCH_TYPE:
+            raise ValueError('search_type should be one of {}'.format(self.SEARCH_TYPE))
+        if mode not in self.MODE:
+            raise ValueError('mode should be one of {}'.format(self.MODE))
+        if reduction_factor < 2 or grace_report_num < 1:
+            raise InappropriateParameterSetting('reduction_factor should be >= 2 and grace_report_num >= 1')
+        for key, space in search_space.items():
+            if not isinstance(space, SearchSpace):
+                raise TypeError('search space of {} should be a SearchSpace instead of {}'.format(
+                    key, type(space).__name__))
+            set_by_key_path(deepcopy(base_config), key, None)
+        self.task_fn = task_fn
+        self.search_space = search_space
+        self.base_config = base_config
+        self.search_type = search_type
+        self.trial_num = trial_num
+        self.config_kwarg_name = config_kwarg_name
+        self.metric = metric
+        self.metric_status = metric_status
+        self.mode = mode
+        self.asha_flag = asha_flag
+        self.grace_report_num = grace_report_num
+        self.reduction_factor = reduction_factor
+        self.seed = seed if seed is not None else int(round(time.time() * 1000)) % (2 ** 31 - 1)
+        self.process_num = process_num
+        self.tf_thread_num = tf_thread_num
+        self.cpu_affinity_flag = cpu_affinity_flag
+        self.auto_choose_gpu_flag = auto_choose_gpu_flag
+        self.gpu_id = gpu_id
+        self.mp_context = mp_context
+        self.task_fn_kwargs = task_fn_kwargs
+        self.results = []
+
+    def generate_trial_params(self) -> list:
+        """
+
+        :return: list of dict of key path to the value of each trial
+        """
+        keys = sorted(self.search_space.keys())
+        if self.search_type == 'grid':
+            return [dict(zip(keys, values)) for values in
+                    itertools.product(*[self.search_space[key].grid() for key in keys])]
+        rng = np.random.RandomState(self.seed)
+        return [{key: self.search_space[key].sample(rng) for key in keys} for _ in range(self.trial_num)]
+
+    def run(self) -> list:
+        """
+        Run all the trials and save the results into DEFAULT_LOG_PATH/tuner_result.json.
+
+        :return: list of dict of each trial (index, seed, log_path, status ('FINISHED', 'PRUNED' or 'CRASHED'),
+        params, values of the metric, last value of the metric, error)
+        """
+        base_log_path = deepcopy(GlobalConfig().DEFAULT_LOG_PATH)
+        manager = mp.get_context(self.mp_context).Manager()
+        reporter_kwargs = dict(metric=self.metric, metric_status=self.metric_status, mode=self.mode,
+                               asha_flag=self.asha_flag, grace_report_num=self.grace_report_num,
+                               reduction_factor=self.reduction_factor, rung_dict=manager.dict(),
+                               lock=manager.Lock())
+        job_list = []
+        for i, params in enumerate(self.generate_trial_params()):
+            trial_config = deepcopy(self.base_config)
+            for key, val in params.items():
+                set_by_key_path(trial_config, key, val)
+            job_list.append(dict(index=i, seed=self.seed + i,
+                                 log_path=os.path.join(base_log_path, 'trial_{}'.format(i)), params=params,
+                                 trial_config=trial_config, task_fn=self.task_fn,
+                                 config_kwarg_name=self.config_kwarg_name, task_fn_kwargs=self.task_fn_kwargs,
+                                 auto_choose_gpu_flag=self.auto_choose_gpu_flag, gpu_id=self.gpu_id,
+                                 reporter_kwargs=reporter_kwargs))
+        try:
+            res_list = run_in_process_pool(_run_trial_job, job_list=job_list, process_num=self.process_num,
+                                           tf_thread_num=self.tf_thread_num, cpu_affinity_flag=self.cpu_affinity_flag,
+                                           mp_context=self.mp_context)
+        finally:
+            manager.shutdown()
+        self.results = []
+        for job, res in zip(job_list, res_list):
+            values = res['result']['values'] if res['result'] else []
+            self.results.append(dict(index=res['index'], seed=res['seed'], log_path=res['log_path'],
+                                     status=res['status'], params=job['params'], values=values,
+                                     last_value=values[-1] if len(values) > 0 else None, error=res['error']))
+        file.save_to_json(self.results, path=base_log_path, file_name=self.RESULT_FILE_NAME)
+        print(self.report(), flush=True)
+        return self.results
+
+    def best_trial(self):
+        """
+
+        :return: the finished trial with the best last value of the metric, None if no trial finished
+        """
+        finished = [res for res in self.results if res['status'] == 'FINISHED' and res['last_value'] is not None]
+        if len(finished) == 0:
+            return None
+        return (max if self.mode == 'max' else min)(finished, key=lambda res: res['last_value'])
+
+    def report(self) -> str:
+        """
+
+        :return: table of the trials, one line per trial, the finished ones first, sorted by the last value of the
+        metric
+        """
+        keys = sorted(self.search_space.keys())
+        status_rank = dict(FINISHED=0, PRUNED=1, CRASHED=2)
+
+        def sort_key(res):
+            if res['last_value'] is None:
+                return status_rank[res['status']], math.inf
+            return status_rank[res['status']], -res['last_value'] if self.mode == 'max' else res['last_value']
+
+        columns = ['trial', 'status', 'reports', self.metric] + keys
+        rows = [[str(res['index']), res['status'], str(len(res['values'])),
+                 '{:.6g}'.format(res['last_value']) if res['last_value'] is not None else '-'] +
+                ['{:.6g}'.format(res['params'][key]) if isinstance(res['params'][key], float)
+                 else str(res['params'][key]) for key in keys]
+                for res in sorted(self.results, key=sort_key)]
+        width = [max([len(c)] + [len(row[i]) for row in rows]) + 2 for i, c in enumerate(columns)]
+        lines = [''.join('{:>{}}'.format(c, w) for c, w in zip(columns, width))]
+        lines += [''.join('{:>{}}'.format(v, w) for v, w in zip(row, width)) for row in rows]
+        return '\n'.join(lines)
@@ -0,0 +1,161 @@
+import multiprocessing as mp
+
+import gym
+import numpy as np
+from typeguard import typechecked
+
+from baconian.core.core import Env
+from baconian.envs.gym_env import GymEnv
+
+"""
+Run a batch of gym environments in worker processes. The observations, rewards and done flags are written by the
+workers into shared memory arrays, only the (small) commands, actions and info dicts go through the pipes.
+"""
+
+
+def _worker(remote, parent_remote, gym_env_id, index, obs_buf, rew_buf, done_buf, obs_shape):
+    parent_remote.close()
+    env = gym.make(gym_env_id)
+    obs = np.frombuffer(obs_buf, dtype=np.float64).reshape((-1,) + obs_shape)
+    rew = np.frombuffer(rew_buf, dtype=np.float64)
+    done = np.frombuffer(done_buf, dtype=np.bool_)
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == 'step':
+                new_obs, re, terminal, info = env.step(data)
+                obs[index] = np.reshape(new_obs, obs_shape)
+                rew[index] = re
+                done[index] = terminal
+                remote.send(info)
+            elif cmd == 'reset':
+                obs[index] = np.reshape(env.reset(), obs_shape)
+                done[index] = False
+                remote.send(None)
+            elif cmd == 'seed':
+                remote.send(env.seed(data))
+            elif cmd == 'close':
+                env.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(cmd)
+    except KeyboardInterrupt:
+        pass
+
+
+class SubprocessEnvPool(Env):
+    """
+    A batch of copies of one gym environment, each one stepped in its own process. step/reset take and return
+    stacked arrays with the sub-env index as the first axis, and both can be restricted to a subset of the sub-envs
+    with the index argument. Finished sub-envs are not reset automatically, so the terminal observation is still
+    returned by step.
+    """
+
+    @typechecked
+    def __init__(self, gym_env_id: str, env_num: int, name: str = None, mp_context: str = None):
+        """
+
+        :param gym_env_id: id of the gym environment
+        :param env_num: number of worker processes/environments
+        :param name:
+        :param mp_context: multiprocessing start method ('fork', 'spawn', 'forkserver'), default of the platform if None
+        """
+        super().__init__(name=name if name else '{}_pool'.format(gym_env_id))
+        assert env_num > 0
+        self.env_id = gym_env_id
+        self.env_num = env_num
+        # the spaces are converted by a local GymEnv so they are the same as the ones of a single env
+        local_env = GymEnv(gym_env_id, name='{}_local'.format(self.name))
+        self.action_space = local_env.action_space
+        self.observation_space = local_env.observation_space
+        self.env_spec = local_env.env_spec
+        self.reward_range = local_env.reward_range
+        local_env.unwrapped.close()
+
+        obs_shape = tuple(self.env_spec.obs_shape)
+        ctx = mp.get_context(mp_context)
+        self._obs_buf = ctx.RawArray('d', int(env_num * np.prod(obs_shape)))
+        self._rew_buf = ctx.RawArray('d', env_num)
+        self._done_buf = ctx.RawArray('b', env_num)
+        self._obs = np.frombuffer(self._obs_buf, dtype=np.float64).reshape((env_num,) + obs_shape)
+        self._rew = np.frombuffer(self._rew_buf, dtype=np.float64)
+        self._done = np.frombuffer(self._done_buf, dtype=np.bool_)
+
+        self._remotes, work_remotes = zip(*[ctx.Pipe() for _ in range(env_num)])
+        self._processes = []
+        for i, (remote, work_remote) in enumerate(zip(self._remotes, work_remotes)):
+            p = ctx.Process(target=_worker,
+                            args=(work_remote, remote, gym_env_id, i, self._obs_buf, self._rew_buf,
+                                  self._done_buf, obs_shape))
+            p.daemon = True
+            p.start()
+            self._processes.append(p)
+        for work_remote in work_remotes:
+            work_remote.close()
+        self._closed = False
+
+    def step(self, action, index=None):
+        """
+
+        :param action: actions of the stepped sub-envs, first axis as the sub-env axis
+        :param index: list of the sub-envs to step, all the sub-envs if None
+        :return: (obs, reward, done, info) of the stepped sub-envs, obs/reward/done are stacked arrays
+        """
+        super().step(action)
+        index = list(range(self.env_num)) if index is None else list(index)
+        assert len(action) == len(index)
+        for i, ac in zip(index, action):
+            self._remotes[i].send(('step', ac))
+        info = [self._remotes[i].recv() for i in index]
+        # the counter of the decorated Env.step counts one step, count the rest of the stepped sub-envs here
+        self._status.update_info(info_key='step', increment=len(index) - 1)
+        return self._obs[index].copy(), self._rew[index].copy(), self._done[index].copy(), info
+
+    def reset(self, index=None):
+        """
+
+        :param index: list of the sub-envs to reset, all the sub-envs if None
+        :return: stacked initial observations of the reset sub-envs
+        """
+        super().reset()
+        index = list(range(self.env_num)) if index is None else list(index)
+        for i in index:
+            self._remotes[i].send(('reset', None))
+        for i in index:
+            self._remotes[i].recv()
+        return self._obs[index].copy()
+
+    def init(self):
+        super().init()
+        return self.reset()
+
+    def seed(self, seed=None):
+        """
+        Seed the sub-envs with seed, seed + 1, ..., seed + env_num - 1.
+
+        :param seed:
+        :return: list of the seeds returned by each sub-env
+        """
+        for i, remote in enumerate(self._remotes):
+            remote.send(('seed', None if seed is None else seed + i))
+        return [remote.recv() for remote in self._remotes]
+
+    def get_state(self):
+        """
+
+        :return: stacked latest observations of all the sub-envs
+        """
+        return self._obs.copy()
+
+    def close(self):
+        if self._closed:
+            return
+        for remote in self._remotes:
+            remote.send(('close', None))
+        for p in self._processes:
+            p.join()
+        self._closed = True
+
+    def __len__(self):
+        return self.env_num
@@ -10,7 +10,7 @@ def reacher_cost_fn(state, action, next_state):
     if len(state.shape) > 1:
         scores = np.zeros((state.shape[0],))
 
-        scores += np.linalg.norm(next_state[:, -1])
+        scores += np.abs(next_state[:, -1])
         return scores
 
     score = np.linalg.norm(next_state[-1])
@@ -101,3 +101,7 @@ class GymEnvCostFunc(CostFunc):
 
     def __call__(self, state, action, new_state, **kwargs) -> float:
         return self.cost_fn(state=state, action=action, next_state=new_state)
+
+    def call_batch(self, state, action, new_state, **kwargs) -> np.ndarray:
+        # the cost functions above handle a batch when state has more than one dimension
+        return self.cost_fn(state=np.asarray(state), action=np.asarray(action), next_state=np.asarray(new_state))
@@ -18,6 +18,13 @@ class PendulumRewardFunc(RewardFunc):
         costs = angle_normalize(th) ** 2 + .1 * thdot ** 2 + .001 * (u ** 2)
         return float(-costs)
 
+    def call_batch(self, state, action, new_state, **kwargs) -> np.ndarray:
+        th = state[:, 0]
+        thdot = state[:, 1]
+        u = np.reshape(action, (len(state), -1))[:, 0]
+        costs = angle_normalize(th) ** 2 + .1 * thdot ** 2 + .001 * (u ** 2)
+        return -costs
+
     def init(self):
         super().init()
 
@@ -130,7 +130,7 @@ class ClassCreatorSetup(unittest.TestCase):
 
         return a, locals()
 
-    def create_ddpg(self, env_id='Pendulum-v0', name='ddpg'):
+    def create_ddpg(self, env_id='Pendulum-v0', name='ddpg', fused_update=False):
         env = make(env_id)
         env_spec = EnvSpec(obs_space=env.observation_space,
                            action_space=env.action_space)
@@ -199,7 +199,8 @@ class ClassCreatorSetup(unittest.TestCase):
             value_func=mlp_q,
             policy=policy,
             name=name,
-            replay_buffer=None
+            replay_buffer=None,
+            fused_update=fused_update
         )
         return ddpg, locals()
 
@@ -1,5 +1,9 @@
 from baconian.test.tests.set_up.setup import TestWithAll
-from baconian.common.sampler.sample_data import SampleData
+from baconian.common.sampler.sample_data import SampleData, TransitionData, TrajectoryData
+from baconian.common.sampler.sampler import VectorSampler
+from baconian.envs.gym_env import make
+from baconian.envs.env_pool import SubprocessEnvPool
+from baconian.core.status import get_global_status_collect
 
 
 class TestAgent(TestWithAll):
@@ -32,3 +36,43 @@ class TestAgent(TestWithAll):
         env.reset()
         agent.test(sample_count=1000, sample_trajectory_flag=False)
         agent.test(sample_count=2, sample_trajectory_flag=True)
+
+    def test_vector_sampler(self):
+        algo, local = self.create_dqn()
+        env = local['env']
+        env_spec = local['env_spec']
+        agent, _ = self.create_agent(algo=algo, env=env,
+                                     env_spec=env_spec,
+                                     eps=self.create_eps(env_spec=env_spec)[0])
+        agent.sampler = VectorSampler(env_spec=env_spec, name='vector_sampler',
+                                      envs=[env] + [make(env.env_id) for _ in range(2)])
+        self.register_global_status_when_test(agent, env)
+        agent.init()
+        data = agent.sample(env=env, sample_count=10, store_flag=True, in_which_status='TRAIN')
+        self.assertTrue(isinstance(data, TransitionData))
+        self.assertEqual(len(data), 10)
+        self.assertEqual(agent.algo.replay_buffer.nb_entries, 10)
+        per_env_data = agent.sampler.sample_per_env(agent=agent, sample_count=7, in_which_status='TEST')
+        self.assertEqual([len(d) for d in per_env_data], [3, 2, 2])
+        data = agent.sample(env=env, sample_count=2, sample_type='trajectory', in_which_status='TEST')
+        self.assertTrue(isinstance(data, TrajectoryData))
+        self.assertEqual(len(data.trajectories), 2)
+        for traj in data.trajectories:
+            self.assertTrue(traj.done_set[-1])
+
+    def test_vector_sampler_counter(self):
+        algo, local = self.create_dqn()
+        env_spec = local['env_spec']
+        agent, _ = self.create_agent(algo=algo, env=local['env'],
+                                     env_spec=env_spec,
+                                     eps=self.create_eps(env_spec=env_spec)[0])
+        pool = SubprocessEnvPool(local['env'].env_id, env_num=3)
+        self.register_global_status_when_test(agent, pool)
+        agent.init()
+        pool.init()
+        # the sampler queries the agent once per tick with the batch of the 3 sub-envs, the last tick with 1 env
+        data = agent.sample(env=pool, sample_count=10, in_which_status='TRAIN')
+        self.assertEqual(len(data), 10)
+        self.assertEqual(get_global_status_collect()('TOTAL_AGENT_TRAIN_SAMPLE_COUNT'), 10)
+        self.assertEqual(get_global_status_collect()('TOTAL_ENV_STEP_TRAIN_SAMPLE_COUNT'), 10)
+        pool.close()
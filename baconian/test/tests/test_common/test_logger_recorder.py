@@ -1,5 +1,10 @@
 from baconian.test.tests.set_up.setup import TestWithAll
 from baconian.common.logging import Logger, ConsoleLogger, Recorder, record_return_decorator
+from baconian.common.files import load_json_lines
+from baconian import ROOT_PATH
+import os
+import subprocess
+import sys
 import numpy as np
 from baconian.core.core import Basic, EnvSpec
 from baconian.algo.rl.model_free.dqn import DQN
@@ -94,6 +99,32 @@ class TestLogger(TestWithAll):
         self.assertTrue(obj.recorder._obj_log[obj]['val2'][1]['log_val'] == 1)
         self.assertTrue(obj.recorder._obj_log[obj]['val2'][2]['log_val'] == 2)
 
+    def test_async_flush(self):
+        obj = Foo(name='foo')
+        obj.recorder.flush_record_num = 4
+        obj.get_by_return(res=1, num=2)
+        self.assertFalse(obj.recorder.is_empty())
+        obj.get_by_return(res=2, num=2)
+        # the recorder is flushed once it holds flush_record_num records
+        self.assertTrue(obj.recorder.is_empty())
+        Logger().wait_flush()
+        records = load_json_lines(os.path.join(Logger()._record_file_log_dir, 'foo', 'log.jsonl'))
+        self.assertEqual(len(records), 4)
+        self.assertEqual([rec['log_val'] for rec in records if rec['attr_name'] == 'val'], [2, 4])
+        self.assertEqual([rec['log_val'] for rec in records if rec['attr_name'] == 'val2'], [1, 2])
+
+    def test_flush_at_exit(self):
+        record_dir = os.path.join(Logger()._record_file_log_dir, 'exit')
+        # the interpreter exits right after handing the records over, they are written by the exit handler
+        script = '\n'.join(["from baconian.common.logging import _AsyncRecordWriter",
+                             "class Obj(object): name = 'bar'",
+                             "obj_log = {Obj(): {'val': [dict(log_val=i) for i in range(1000)]}}",
+                             "_AsyncRecordWriter().put(obj_log=obj_log, by_status_flag=False, record_dir={})".format(
+                                 repr(record_dir))])
+        subprocess.check_call([sys.executable, '-c', script], cwd=os.path.dirname(ROOT_PATH))
+        records = load_json_lines(os.path.join(record_dir, 'bar', 'log.jsonl'))
+        self.assertEqual([rec['log_val'] for rec in records], list(range(1000)))
+
 
 class TesTLoggerWithDQN(TestWithAll):
 
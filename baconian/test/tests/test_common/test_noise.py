@@ -32,3 +32,13 @@ class TestNoise(BaseTestCase):
                 self.assertEqual(noise_wrapper(action=1.0), 1.0)
             global t
             t += 1
+
+    def test_batch_noise(self):
+        noise_wrapper = AgentActionNoiseWrapper(noise=NormalActionNoise(),
+                                                action_weight_scheduler=ConstantSchedule(1.0),
+                                                noise_weight_scheduler=ConstantSchedule(1.0))
+        res = noise_wrapper(action=np.zeros([4, 2]), batch_flag=True)
+        self.assertEqual(res.shape, (4, 2))
+        # one noise for each row, shared by the dims of the row since the noise is a scalar
+        self.assertTrue(np.all(res[:, 0] == res[:, 1]))
+        self.assertEqual(len(set(res[:, 0].tolist())), 4)
@@ -0,0 +1,74 @@
+import os
+
+from baconian.common.files import load_json
+from baconian.common.logging import Logger
+from baconian.common.profiler import Profiler, ProfileScope, profile_decorator
+from baconian.common.sampler.sampler import Sampler
+from baconian.config.global_config import GlobalConfig
+from baconian.core.core import EnvSpec
+from baconian.envs.gym_env import make
+from baconian.test.tests.set_up.setup import TestWithLogSet
+
+
+class _RandomAgent(object):
+    def __init__(self, env_spec):
+        self.env_spec = env_spec
+
+    def predict(self, obs):
+        return self.env_spec.action_space.sample()
+
+    def reset_episode(self, index=None):
+        pass
+
+
+@profile_decorator('test/func')
+def func(x):
+    return x * 2
+
+
+class TestProfiler(TestWithLogSet):
+    def test_profiler(self):
+        Profiler().reset()
+        func(1)
+        with ProfileScope('test/scope'):
+            pass
+        # disabled by default, nothing is recorded
+        self.assertTrue(Profiler().is_empty())
+
+        GlobalConfig().set('DEFAULT_PROFILE_FLAG', True)
+        try:
+            for i in range(10):
+                self.assertEqual(func(i), i * 2)
+            with ProfileScope('test/scope'):
+                func(1)
+            summary = Profiler().summary()
+            self.assertEqual(summary['test/func']['count'], 11)
+            self.assertEqual(summary['test/scope']['count'], 1)
+            self.assertTrue(summary['test/func']['p50'] <= summary['test/func']['p99'] <= summary['test/func']['max'])
+            self.assertTrue('test/scope' in Profiler().report())
+            Logger().close()
+            res = load_json(os.path.join(Logger()._record_file_log_dir, 'profile.json'))
+            self.assertEqual(res['test/func']['count'], 11)
+        finally:
+            GlobalConfig().set('DEFAULT_PROFILE_FLAG', False)
+            Profiler().reset()
+
+    def test_sampler_env_step(self):
+        env = make('Pendulum-v0')
+        env.init()
+        env_spec = EnvSpec(obs_space=env.observation_space, action_space=env.action_space)
+        sampler = Sampler(env_spec=env_spec, name='profiled_sampler')
+        Profiler().reset()
+        GlobalConfig().set('DEFAULT_PROFILE_FLAG', True)
+        try:
+            data = sampler.sample(env=env, agent=_RandomAgent(env_spec), in_which_status='TRAIN', sample_count=20,
+                                  reset_at_start=True)
+            self.assertEqual(Profiler().summary()['sampler/env_step']['count'], len(data))
+            Profiler().reset()
+            data = sampler.sample(env=env, agent=_RandomAgent(env_spec), in_which_status='TRAIN', sample_count=1,
+                                  sample_type='trajectory', reset_at_start=True)
+            self.assertEqual(Profiler().summary()['sampler/env_step']['count'],
+                             sum(len(traj) for traj in data.trajectories))
+        finally:
+            GlobalConfig().set('DEFAULT_PROFILE_FLAG', False)
+            Profiler().reset()
@@ -1,7 +1,10 @@
 from baconian.envs.gym_env import make
 from baconian.core.core import EnvSpec
 from baconian.test.tests.set_up.setup import BaseTestCase
-from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer
+from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, PrioritizedReplayBuffer
+from baconian.common.replay_buffer import SumSegmentTree, MinSegmentTree, ReplayBuffer
+from baconian.common.sampler.sample_data import TransitionData
+import numpy as np
 
 
 class TestReplaybuffer(BaseTestCase):
@@ -23,3 +26,84 @@ class TestReplaybuffer(BaseTestCase):
         self.assertTrue(batch.reward_set.shape[0] == 10)
         self.assertTrue(batch.done_set.shape[0] == 10)
         self.assertTrue(batch.new_state_set.shape[0] == 10)
+
+    def test_extend(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        a = UniformRandomReplayBuffer(limit=50, action_shape=env_spec.action_shape,
+                                      observation_shape=env_spec.obs_shape)
+        data = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(30):
+            ac = env_spec.action_space.sample()
+            st_new, re, done, _ = env.step(action=ac)
+            data.append(state=st, new_state=st_new, action=ac, reward=re, done=done)
+            st = st_new
+        a.extend(data)
+        self.assertEqual(a.nb_entries, 30)
+        a.extend(data)
+        self.assertEqual(a.nb_entries, 50)
+        # the oldest 10 transitions are overwritten, the ring buffer now starts from the 11-th one
+        self.assertTrue(np.isclose(a.observations0[0], data.state_set[10]).all())
+        self.assertTrue(np.isclose(a.rewards[49], data.reward_set[29]).all())
+        batch = a.sample(batch_size=10)
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(batch.reward_set.shape, (10, 1))
+        self.assertEqual(batch.state_set.shape, (10,) + env_spec.obs_shape)
+
+    def test_prioritized_replay_buffer(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        a = PrioritizedReplayBuffer(limit=50, action_shape=env_spec.action_shape,
+                                    observation_shape=env_spec.obs_shape)
+        data = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(30):
+            ac = env_spec.action_space.sample()
+            st_new, re, done, _ = env.step(action=ac)
+            data.append(state=st, new_state=st_new, action=ac, reward=re, done=done)
+            st = st_new
+        a.extend(data)
+        a.extend(data)
+        self.assertEqual(a.nb_entries, 50)
+        batch = a.sample(batch_size=10)
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(batch('weight_set').shape, (10,))
+        # all the transitions are inserted with the same priority, so the importance weights are all one
+        self.assertTrue(np.isclose(batch('weight_set'), 1.0).all())
+        self.assertTrue(np.isclose(batch.state_set, a.observations0.data[batch('index_set')]).all())
+        a.update_priorities(idxes=batch('index_set'), priorities=np.arange(10) + 1.0)
+        self.assertTrue(np.isclose(a._max_priority, 10.0))
+        a.update_priorities(idxes=[], priorities=[])
+        self.assertTrue(np.isclose(a._max_priority, 10.0))
+        batch = a.sample(batch_size=10)
+        self.assertTrue((batch('weight_set') <= 1.0 + 1e-6).all())
+
+    def test_segment_tree(self):
+        tree = SumSegmentTree(8)
+        min_tree = MinSegmentTree(8)
+        value = np.random.rand(8)
+        tree[np.arange(8)] = value
+        min_tree[np.arange(8)] = value
+        self.assertTrue(np.isclose(tree.sum(), value.sum()))
+        self.assertTrue(np.isclose(tree.sum(2, 5), value[2:5].sum()))
+        self.assertTrue(np.isclose(min_tree.min(1, 7), value[1:7].min()))
+        self.assertEqual(tree.sum(0, 0), 0.0)
+        # an empty batch leaves the trees unchanged
+        tree[np.array([], dtype=np.int64)] = np.array([])
+        min_tree[[]] = []
+        self.assertTrue(np.isclose(tree.sum(), value.sum()))
+        self.assertTrue(np.isclose(min_tree.min(), value.min()))
+        prefix_sum = np.random.rand(20) * value.sum()
+        self.assertTrue((tree.find_prefixsum_idx(prefix_sum) ==
+                         np.searchsorted(np.cumsum(value), prefix_sum, side='right')).all())
+
+    def test_legacy_replay_buffer_dtype(self):
+        a = ReplayBuffer(size=10)
+        a.add(obs_t=np.zeros(3), action=1, reward=0, obs_tp1=np.zeros(3), done=False)
+        a.add(obs_t=np.zeros(3), action=1, reward=0.5, obs_tp1=np.zeros(3), done=True)
+        _, _, reward, _, done = a._encode_sample([0, 1])
+        self.assertEqual(reward.tolist(), [0.0, 0.5])
+        self.assertEqual(done.tolist(), [0.0, 1.0])
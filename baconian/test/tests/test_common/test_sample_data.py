@@ -125,6 +125,33 @@ class TestSampleData(BaseTestCase):
         self.assertEqual(a('new_state_set').shape[0], 0)
         self.assertEqual(a('action_set').shape[0], 0)
 
+    def test_transition_data_shuffle(self):
+        a = TransitionData(obs_shape=[2], action_shape=[1])
+        for i in range(10):
+            a.append(state=np.array([i, i]), new_state=np.array([i, i]), action=np.array([i]), done=False,
+                     reward=float(i))
+        b = a.get_view()
+        batch_1 = [batch[3] for batch in a.return_generator(batch_size=4, shuffle_flag=True,
+                                                            rng=np.random.RandomState(1))]
+        index = a._permutation.copy()
+        self.assertTrue(np.equal(np.concatenate(batch_1)[:, 0], index).all())
+        a.shuffle(index=np.arange(len(a)))
+        batch_2 = [batch[3] for batch in a.return_generator(batch_size=4, shuffle_flag=True,
+                                                            rng=np.random.RandomState(1))]
+        self.assertTrue(np.equal(np.concatenate(batch_2)[:, 0], index[np.random.RandomState(1).permutation(10)]).all())
+        self.assertTrue(np.equal(a('reward_set')[:, 0], a('state_set')[:, 0]).all())
+        # the memory shared with the view is never shuffled in place
+        self.assertTrue(np.equal(b('reward_set')[:, 0], np.arange(10)).all())
+        # the sets are views of the stored data, so they can not be written
+        with self.assertRaises(ValueError):
+            b('reward_set')[0] = 1.0
+        # a subset index keeps only the selected transitions
+        c = b.get_copy()
+        c.shuffle(index=[7, 2, 2])
+        self.assertEqual(len(c), 3)
+        self.assertTrue(np.equal(c('state_set')[:, 0], [7, 2, 2]).all())
+        self.assertTrue(np.equal(b('reward_set')[:, 0], np.arange(10)).all())
+
     def test_trajectory_data(self):
         env = make('Acrobot-v1')
         env_spec = EnvSpec(obs_space=env.observation_space,
@@ -155,3 +182,54 @@ class TestSampleData(BaseTestCase):
         for d, re, st in zip(data_gen, re_list, st_list):
             self.assertEqual(d[3], re)
             self.assertTrue(np.equal(st, d[1]).all())
+
+    def test_trajectory_data_view(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        a = TrajectoryData(env_spec)
+        tmp_traj = TransitionData(env_spec)
+        st = env.reset()
+        for length in (3, 1, 5):
+            for i in range(length):
+                ac = env_spec.action_space.sample()
+                st_new, re, done, _ = env.step(action=ac)
+                tmp_traj.append(state=st, new_state=st_new, action=ac, done=i == length - 1, reward=re)
+                st = st_new
+            a.append(tmp_traj)
+            tmp_traj.reset()
+        self.assertTrue(np.equal(a.episode_offsets, [0, 3, 4, 9]).all())
+        self.assertEqual([len(traj) for traj in a.trajectories], [3, 1, 5])
+        data = a.return_as_transition_data()
+        self.assertTrue(np.shares_memory(data.state_set, a('state_set')))
+        self.assertTrue(np.shares_memory(a.trajectories[2].state_set, a('state_set')))
+        self.assertTrue(np.equal(a.trajectories[2].reward_set, data.reward_set[4:]).all())
+        self.assertAlmostEqual(a.get_sum_of('reward_set'), np.sum(data.reward_set))
+        a.append_new_set(name='index_set', data_set=np.arange(9), shape=[])
+        self.assertTrue(np.equal(a.trajectories[1]('index_set'), [3]).all())
+        b = a.get_copy()
+        b.union(a)
+        self.assertEqual(len(b), 6)
+        self.assertTrue(np.equal(b.episode_offsets, [0, 3, 4, 9, 12, 13, 18]).all())
+
+    def test_transition_data_union(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        a = TransitionData(env_spec)
+        b = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(TransitionData.INIT_CAPACITY * 3):
+            ac = env_spec.action_space.sample()
+            st_new, re, done, _ = env.step(action=ac)
+            a.append(state=st, new_state=st_new, action=ac, done=done, reward=re)
+            b.append(state=st, new_state=st_new, action=ac, done=done, reward=re)
+            st = st_new
+        self.assertEqual(len(a), TransitionData.INIT_CAPACITY * 3)
+        c = a.get_copy()
+        a.union(b)
+        self.assertEqual(len(a), TransitionData.INIT_CAPACITY * 6)
+        self.assertEqual(len(c), TransitionData.INIT_CAPACITY * 3)
+        self.assertTrue(np.equal(a.state_set[len(c):], b.state_set).all())
+        self.assertTrue(np.equal(a.reward_set[:len(c)], c.reward_set).all())
+        self.assertAlmostEqual(a.get_sum_of('reward_set'), b.get_sum_of('reward_set') * 2)
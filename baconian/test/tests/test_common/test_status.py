@@ -1,5 +1,23 @@
 from baconian.test.tests.set_up.setup import TestWithAll
-from baconian.core.status import StatusCollector
+from baconian.core.status import StatusCollector, StatusWithSubInfo, register_counter_info_to_status_decorator
+from baconian.core.core import Basic
+
+
+class Foo(Basic):
+    STATUS_LIST = ('TRAIN', 'TEST')
+    INIT_STATUS = 'TRAIN'
+
+    def __init__(self, name='foo_status'):
+        super().__init__(name=name, status=StatusWithSubInfo(obj=self))
+
+    @register_counter_info_to_status_decorator(increment=1, info_key='predict_counter', under_status=('TRAIN', 'TEST'),
+                                               ignore_wrong_status=True)
+    def predict(self):
+        pass
+
+    @register_counter_info_to_status_decorator(increment=2, info_key='train_counter', under_status='TRAIN')
+    def train(self):
+        pass
 
 
 class TestStatus(TestWithAll):
@@ -35,6 +53,28 @@ class TestStatus(TestWithAll):
         self.assertTrue(res['test_counter'] == 10)
         self.assertTrue(res['train_counter'] == 20)
 
+    def test_counter_decorator(self):
+        obj = Foo()
+        a = StatusCollector()
+        a.register_info_key_status(obj=obj, info_key='predict_counter', under_status='TEST',
+                                   return_name='test_predict_counter')
+        obj.predict()
+        # the counters are created under all the given status at the first call
+        self.assertEqual(a('test_predict_counter'), 0)
+        for _ in range(3):
+            obj.train()
+        obj.set_status('TEST')
+        obj.predict()
+        with self.assertRaises(ValueError):
+            obj.train()
+        self.assertEqual(a('test_predict_counter'), 1)
+        self.assertEqual(obj.get_status(), dict(status='TEST', predict_counter=1))
+        obj.set_status('TRAIN')
+        self.assertEqual(obj.get_status(), dict(status='TRAIN', predict_counter=1, train_counter=6))
+        obj._status.reset()
+        obj.predict()
+        self.assertEqual(a(), dict(test_predict_counter=0))
+
 
 class TestStatusWithDQN(TestWithAll):
     def test_with_dqn(self):
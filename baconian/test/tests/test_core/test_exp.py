@@ -1,8 +1,10 @@
 from baconian.test.tests.set_up.setup import BaseTestCase
-from baconian.core.experiment_runner import single_exp_runner, duplicate_exp_runner
+from baconian.core.experiment_runner import single_exp_runner, duplicate_exp_runner, parallel_exp_runner
 from baconian.common.schedules import LinearSchedule, PiecewiseSchedule
 from baconian.config.global_config import GlobalConfig
 from baconian.core.status import get_global_status_collect
+from baconian.core.flow.actor_learner_flow import ActorLearnerFlow
+from baconian.test.tests.set_up.class_creator import ClassCreatorSetup
 import os
 
 
@@ -85,6 +87,56 @@ class TestExperiment(BaseTestCase):
         self.assertTrue(os.path.isfile(os.path.join(base_path, 'exp_0', 'console.log')))
         self.assertTrue(os.path.isfile(os.path.join(base_path, 'exp_1', 'console.log')))
 
+    def test_parallel_exp(self):
+        base_path = GlobalConfig().DEFAULT_LOG_PATH
+        res = parallel_exp_runner(3, _parallel_task_fn, process_num=2, seeds=[1, 2, 3], crash_exp='exp_1')
+        self.assertEqual([r['index'] for r in res], [0, 1, 2])
+        self.assertEqual([r['seed'] for r in res], [1, 2, 3])
+        self.assertEqual([r['status'] for r in res], ['FINISHED', 'CRASHED', 'FINISHED'])
+        self.assertIn('ValueError', res[1]['error'])
+        for i in (0, 2):
+            self.assertEqual(res[i]['result'], os.path.join(base_path, 'exp_{}'.format(i)))
+            self.assertTrue(os.path.isfile(os.path.join(base_path, 'exp_{}'.format(i), 'console.log')))
+
+    def test_actor_learner_flow(self):
+        for algo_name in ('dqn', 'ddpg'):
+            def func():
+                GlobalConfig().set('DEFAULT_EXPERIMENT_END_POINT', dict(TOTAL_AGENT_TRAIN_SAMPLE_COUNT=400,
+                                                                        TOTAL_AGENT_TEST_SAMPLE_COUNT=None,
+                                                                        TOTAL_AGENT_UPDATE_COUNT=None))
+                agent = _actor_learner_agent_fn(algo_name)
+                flow = ActorLearnerFlow(agent=agent,
+                                        actor_agent_fn=_actor_learner_agent_fn,
+                                        actor_agent_fn_kwargs=dict(algo_name=algo_name),
+                                        config_or_config_dict={
+                                            "TEST_EVERY_SAMPLE_COUNT": 100,
+                                            "START_TRAIN_AFTER_SAMPLE_COUNT": 20,
+                                            "START_TEST_AFTER_SAMPLE_COUNT": 20,
+                                            "ACTOR_NUM": 2,
+                                            "ACTOR_SAMPLE_COUNT": 20,
+                                            "SYNC_WEIGHT_EVERY_TRAIN": 5,
+                                        },
+                                        func_dict={
+                                            'test': {'func': agent.test,
+                                                     'args': list(),
+                                                     'kwargs': dict(sample_count=10),
+                                                     },
+                                            'train': {'func': agent.train,
+                                                      'args': list(),
+                                                      'kwargs': dict(),
+                                                      },
+                                        })
+                exp = self.create_exp(name='actor_learner', env=agent.env, agent=agent, flow=flow)
+                exp.run()
+                self.assertGreaterEqual(exp.TOTAL_AGENT_TRAIN_SAMPLE_COUNT(), 400)
+                self.assertEqual(exp.TOTAL_AGENT_TRAIN_SAMPLE_COUNT(), exp.TOTAL_ENV_STEP_TRAIN_SAMPLE_COUNT())
+                self.assertEqual(exp.TOTAL_AGENT_UPDATE_COUNT(), flow.train_count)
+                self.assertEqual(len(flow._actors), 0)
+
+            self.setUp()
+            single_exp_runner(func, auto_choose_gpu_flag=False, gpu_id=0, del_if_log_path_existed=True)
+            self.tearDown()
+
     def test_saving_scheduler_on_all_model_free_algo(self):
         to_test_algo_func = (self.create_ppo, self.create_dqn, self.create_ddpg)
         for func in to_test_algo_func:
@@ -103,6 +155,24 @@ class TestExperiment(BaseTestCase):
             self.tearDown()
 
 
+def _parallel_task_fn(crash_exp):
+    log_path = GlobalConfig().DEFAULT_LOG_PATH
+    if os.path.basename(log_path) == crash_exp:
+        raise ValueError('crash {}'.format(crash_exp))
+    return log_path
+
+
+def _actor_learner_agent_fn(algo_name):
+    creator = ClassCreatorSetup()
+    algo, locals = creator.create_dqn() if algo_name == 'dqn' else creator.create_ddpg()
+    env_spec = locals['env_spec']
+    return creator.create_agent(env=locals['env'],
+                                algo=algo,
+                                name='agent',
+                                eps=creator.create_eps(env_spec)[0],
+                                env_spec=env_spec)[0]
+
+
 def _saving_scheduler(self, creat_func=None):
     def wrap_algo():
         def func(self, creat_func=None):
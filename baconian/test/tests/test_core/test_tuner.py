@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from baconian.common.error import MissedConfigError
+from baconian.common.logging import Recorder, reset_logging
+from baconian.config.global_config import GlobalConfig
+from baconian.core.tuner import Tuner, Choice, Uniform, LogUniform, IntUniform
+from baconian.test.tests.set_up.setup import BaseTestCase
+
+BASE_CONFIG = {'A': {'LR': 0.1, 'X': 1}, 'B': 0}
+
+
+class _TunerTestObj(object):
+    name = 'tuner_test_obj'
+
+
+def _tuner_task_fn(exp_config):
+    recorder = Recorder(flush_by_split_status=False)
+    obj = _TunerTestObj()
+    for i in range(9):
+        recorder.append_to_obj_log(obj=obj, attr_name='sum_reward', status_info=dict(status='TRAIN'),
+                                   log_val=-1000.0)
+        recorder.append_to_obj_log(obj=obj, attr_name='sum_reward', status_info=dict(status='TEST'),
+                                   log_val=exp_config['A']['LR'] * (i + 1) + exp_config['B'])
+    reset_logging()
+    return exp_config['A']['LR']
+
+
+class TestTuner(BaseTestCase):
+    def test_search_space(self):
+        rng = np.random.RandomState(0)
+        for _ in range(100):
+            self.assertTrue(1e-4 <= LogUniform(1e-4, 1e-2).sample(rng) <= 1e-2)
+            self.assertIn(IntUniform(1, 3).sample(rng), (1, 2, 3))
+        self.assertEqual(Uniform(0, 1, grid_num=3).grid(), [0.0, 0.5, 1.0])
+
+        tuner = Tuner(_tuner_task_fn, {'A/LR': Uniform(0.0, 1.0, grid_num=2), 'B': Choice([0, 1])}, BASE_CONFIG,
+                      search_type='grid')
+        self.assertEqual(len(tuner.generate_trial_params()), 4)
+        tuner = Tuner(_tuner_task_fn, {'A/LR': Uniform(0.0, 1.0)}, BASE_CONFIG, trial_num=5, seed=1)
+        self.assertEqual(tuner.generate_trial_params(), tuner.generate_trial_params())
+        self.assertEqual(len(tuner.generate_trial_params()), 5)
+        with self.assertRaises(MissedConfigError):
+            Tuner(_tuner_task_fn, {'A/NOT_EXISTED': Choice([1])}, BASE_CONFIG)
+
+    def test_tuner_run(self):
+        base_path = GlobalConfig().DEFAULT_LOG_PATH
+        tuner = Tuner(_tuner_task_fn, {'A/LR': Uniform(0.0, 1.0, grid_num=4), 'B': Choice([0, 1])}, BASE_CONFIG,
+                      search_type='grid', process_num=2, seed=1)
+        res = tuner.run()
+        self.assertEqual(len(res), 8)
+        for r in res:
+            self.assertIn(r['status'], ('FINISHED', 'PRUNED'))
+            # the rungs are at the 1st, 3rd and 9th reports
+            self.assertIn(len(r['values']), (9,) if r['status'] == 'FINISHED' else (1, 3, 9))
+        self.assertEqual(tuner.best_trial()['params'], {'A/LR': 1.0, 'B': 1})
+        self.assertEqual(tuner.best_trial()['last_value'], 10.0)
+        self.assertTrue(os.path.isfile(os.path.join(base_path, Tuner.RESULT_FILE_NAME)))
+        self.assertTrue(os.path.isdir(os.path.join(base_path, 'trial_0')))
@@ -19,3 +19,17 @@ class TestDynamicsModel(TestWithAll):
         true_new = np.ones([x]) * (x + u) * 0.01 + np.ones([x]) * 0.02
         print('true state', true_new)
         self.assertTrue(np.equal(true_new, new_state).all())
+
+    def test_step_batch(self):
+        real_env = self.create_env('Pendulum-v0')
+        x = real_env.observation_space.flat_dim
+        u = real_env.action_space.flat_dim
+        a = LinearDynamicsModel(env_spec=real_env.env_spec,
+                                state_transition_matrix=np.random.uniform(-0.1, 0.1, (x, x + u)),
+                                bias=np.ones(x) * 0.02)
+        state = np.array([real_env.observation_space.sample() for _ in range(10)])
+        action = np.array([real_env.action_space.sample() for _ in range(10)])
+        new_state = a.step_batch(action=action, state=state)
+        self.assertEqual(new_state.shape, (10, x))
+        for i in range(10):
+            self.assertTrue(np.isclose(new_state[i], a.step(action=action[i], state=state[i])).all())
@@ -49,3 +49,26 @@ class TestDynamicsModel(TestWithAll):
 
         self.assert_var_list_id_no_equal(var_list1=mlp_dyna.parameters('tf_var_list'),
                                          var_list2=mlp_dyna_2.parameters('tf_var_list'))
+
+    def test_minibatch_train(self):
+        mlp_dyna, local = self.create_continue_dynamics_model(name='minibatch_model')
+        env = local['env']
+        env_spec = local['env_spec']
+        mlp_dyna.init()
+        data = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(50):
+            ac = env_spec.action_space.sample()
+            new_st, re, done, info = env.step(action=ac)
+            data.append(state=st,
+                        action=ac,
+                        new_state=new_st,
+                        done=done,
+                        reward=re)
+            st = env.reset() if done else new_st
+        res = mlp_dyna.train(batch_data=data, train_iter=20, batch_size=8)
+        self.assertEqual(res['train_step'], 20)
+        res = mlp_dyna.train(batch_data=data, train_iter=1000, batch_size=8, validation_split=0.2,
+                             early_stopping_patience=1, validation_interval=1)
+        self.assertTrue(res['train_step'] < 1000)
+        self.assertTrue(np.isfinite(res['validation_loss']))
@@ -2,6 +2,9 @@ from baconian.common.sampler.sample_data import TransitionData
 from baconian.test.tests.set_up.setup import TestWithLogSet
 import numpy as np
 from baconian.algo.dynamics.terminal_func.terminal_func import *
+from baconian.algo.dynamics.reward_func.reward_func import QuadraticCostFunc, RewardFuncCostWrapper
+from baconian.envs.gym_reward_func import PendulumRewardFunc
+from baconian.envs.gym_env_cost_fn import GymEnvCostFunc
 
 x = 0
 
@@ -15,6 +18,23 @@ class TestRewardTerminalFunc(TestWithLogSet):
     def test_all_reward_func(self):
         pass
 
+    def test_call_batch(self):
+        state = np.random.uniform(-1.0, 1.0, (10, 3))
+        action = np.random.uniform(-1.0, 1.0, (10, 1))
+        new_state = np.random.uniform(-1.0, 1.0, (10, 3))
+        func_list = [QuadraticCostFunc(C=np.random.rand(4, 4), c=np.random.rand(4)),
+                     RewardFuncCostWrapper(reward_func=PendulumRewardFunc()),
+                     PendulumRewardFunc(),
+                     GymEnvCostFunc(env_id='Pendulum-v0')]
+        for f in func_list:
+            res = f.call_batch(state=state, action=action, new_state=new_state)
+            self.assertEqual(res.shape, (10,))
+            for i in range(10):
+                self.assertTrue(np.isclose(res[i], f(state=state[i], action=action[i], new_state=new_state[i])))
+        res = RandomTerminalFunc().call_batch(state=state, action=action, new_state=new_state)
+        self.assertEqual(res.shape, (10,))
+        self.assertEqual(res.dtype, bool)
+
     def test_all_terminal_func(self):
         a = FixedEpisodeLengthTerminalFunc(max_step_length=10,
                                            step_count_fn=func)
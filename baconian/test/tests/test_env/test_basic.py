@@ -1,6 +1,8 @@
 from baconian.envs.gym_env import GymEnv
 from baconian.test.tests.set_up.setup import TestWithLogSet
 from gym import make
+from baconian.envs.env_pool import SubprocessEnvPool
+import numpy as np
 
 
 class TestEnv(TestWithLogSet):
@@ -22,6 +24,24 @@ class TestEnv(TestWithLogSet):
                 self.assertEqual(a._last_reset_point, a.total_step_count_fn())
                 self.assertEqual(a._last_reset_point, i + 1)
 
+    def test_subprocess_env_pool(self):
+        a = SubprocessEnvPool('Pendulum-v0', env_num=3)
+        a.set_status('TRAIN')
+        a.seed(10)
+        obs = a.init()
+        self.assertEqual(obs.shape, (3,) + a.env_spec.obs_shape)
+        for i in range(10):
+            new_st, re, done, info = a.step(action=np.array([a.action_space.sample() for _ in range(3)]))
+            self.assertEqual(new_st.shape, (3,) + a.env_spec.obs_shape)
+            self.assertEqual(re.shape, (3,))
+            self.assertEqual(len(info), 3)
+            self.assertTrue(np.equal(a.get_state(), new_st).all())
+        self.assertEqual(a.total_step_count_fn(), 30)
+        new_st, re, done, info = a.step(action=np.array([a.action_space.sample()]), index=[1])
+        self.assertEqual(new_st.shape, (1,) + a.env_spec.obs_shape)
+        self.assertEqual(a.reset(index=[0, 2]).shape, (2,) + a.env_spec.obs_shape)
+        a.close()
+
     def test_all_get_state(self):
         type_list = []
         for id in GymEnv._all_gym_env_id:
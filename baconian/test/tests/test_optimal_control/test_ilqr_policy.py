@@ -1,5 +1,7 @@
 from baconian.test.tests.set_up.setup import TestWithAll
-from baconian.algo.dynamics.reward_func.reward_func import CostFunc
+from baconian.algo.dynamics.reward_func.reward_func import CostFunc, QuadraticCostFunc
+from baconian.algo.dynamics.linear_dynamics_model import LinearDynamicsModel
+from baconian.algo.optimal_control.ilqr import iLQR
 from baconian.envs.gym_env import make
 import numpy as np
 from baconian.core.core import EnvSpec
@@ -53,3 +55,89 @@ class TestiLQRPolicy(TestWithAll):
             print("analytical optimal action -0.5, cost -0.25")
             print('state: {}, action: {}, cost {}'.format(st, ac, policy.iLqr_instance.cost_fn(state=st, action=ac,
                                                                                                new_state=None)))
+
+    def test_differentiate(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        n = env_spec.flat_obs_dim
+        m = env_spec.flat_action_dim
+        F = np.random.uniform(-0.1, 0.1, (n, n + m))
+        dyna = LinearDynamicsModel(env_spec=env_spec, state_transition_matrix=F, bias=np.zeros(n))
+        cost_fn = QuadraticCostFunc(C=np.random.rand(n + m, n + m), c=np.random.rand(n + m))
+        x_seq = np.array([env_spec.obs_space.sample() * 0.1 for _ in range(5)])
+        u_seq = np.array([env_spec.action_space.sample() * 0.1 for _ in range(4)])
+        res = []
+        for analytic_derivative in (True, False):
+            ilqr = iLQR(env_spec=env_spec, delta=0.01, T=5, dyn_model=dyna, cost_fn=cost_fn,
+                        analytic_derivative=analytic_derivative)
+            res.append(ilqr.differentiate(x_seq, u_seq))
+        for analytic_res, fd_res in zip(*res):
+            self.assertTrue(np.isclose(analytic_res, fd_res, atol=1e-4).all())
+        self.assertTrue(np.isclose(res[0][1][0], F, atol=1e-4).all())
+
+    def test_receding_horizon(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        dyna = DynamicsEnvWrapper(dynamics=DebugDynamics(env_spec=env_spec))
+        dyna.set_terminal_reward_func(terminal_func=RandomTerminalFunc(),
+                                      reward_func=DebuggingCostFunc())
+        policy = iLQRPolicy(env_spec=env_spec,
+                            T=10,
+                            delta=0.05,
+                            iteration=5,
+                            dynamics=dyna,
+                            dynamics_model_train_iter=10,
+                            cost_fn=DebuggingCostFunc(),
+                            receding_horizon=True,
+                            cost_tolerance=1e-3,
+                            replan_every=3)
+        st = env.reset()
+        for i in range(7):
+            ac = policy.forward(st)
+            self.assertTrue(env_spec.action_space.contains(ac[0]))
+            # one plan every 3 actions, the cached trajectory is used in between
+            self.assertEqual(policy._step_since_plan, i % 3 + 1)
+            st, _, _, _ = env.step(ac[0])
+        self.assertEqual(policy.U_hat.shape, (9,) + env_spec.action_shape)
+        policy.reset()
+        self.assertIsNone(policy.U_hat)
+
+        # without any pass, the warm start drops the replan_every actions executed since the last plan
+        policy = iLQRPolicy(env_spec=env_spec, T=10, delta=0.05, iteration=0, dynamics=dyna,
+                            dynamics_model_train_iter=10, cost_fn=DebuggingCostFunc(), receding_horizon=True,
+                            replan_every=3)
+        policy.forward(st)
+        policy.U_hat = np.arange(9, dtype=np.float64).reshape(9, 1)
+        policy._step_since_plan = 3
+        self.assertEqual(float(policy.forward(st)[0][0]), 3.0)
+        self.assertEqual(policy.U_hat[:, 0].tolist(), [3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 8.0, 8.0, 8.0])
+
+    def test_batch_plan(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        dyna = DynamicsEnvWrapper(dynamics=DebugDynamics(env_spec=env_spec))
+        dyna.set_terminal_reward_func(terminal_func=RandomTerminalFunc(),
+                                      reward_func=DebuggingCostFunc())
+
+        def create_policy():
+            return iLQRPolicy(env_spec=env_spec, T=10, delta=0.05, iteration=2, dynamics=dyna,
+                              dynamics_model_train_iter=10, cost_fn=DebuggingCostFunc(), receding_horizon=True,
+                              replan_every=2)
+
+        obs = np.array([env.reset(), env.reset()])
+        policy = create_policy()
+        single_policy = [create_policy(), create_policy()]
+        for i in range(3):
+            # each row is planned, warm started and controlled closed-loop with its own trajectory
+            ac = policy.forward(obs)
+            for j in range(2):
+                self.assertTrue(np.isclose(ac[j], single_policy[j].forward(obs[j])[0]).all())
+            obs = obs + 0.01
+        self.assertEqual(policy._step_since_plan, 1)
+        self.assertEqual(policy._row_plans[1][2], 1)
+        policy.reset(index=1)
+        self.assertNotIn(1, policy._row_plans)
+        self.assertIsNotNone(policy.U_hat)
@@ -0,0 +1,34 @@
+from baconian.algo.rl.misc.sample_processor import SampleProcessor, discount
+from baconian.common.sampler.sample_data import TransitionData, TrajectoryData
+from baconian.test.tests.set_up.setup import BaseTestCase
+from baconian.core.core import EnvSpec
+from baconian.envs.gym_env import make
+import numpy as np
+
+
+class TestSampleProcessor(BaseTestCase):
+    def test_batched_gae(self):
+        env = make('Pendulum-v0')
+        env_spec = EnvSpec(obs_space=env.observation_space,
+                           action_space=env.action_space)
+        data = TrajectoryData(env_spec)
+        tmp_traj = TransitionData(env_spec)
+        st = env.reset()
+        for length in (4, 1, 6):
+            for i in range(length):
+                ac = env_spec.action_space.sample()
+                st_new, re, done, _ = env.step(action=ac)
+                tmp_traj.append(state=st, new_state=st_new, action=ac, done=i == length - 1, reward=re)
+                st = st_new
+            data.append(tmp_traj)
+            tmp_traj.reset()
+        data.append_new_set(name='v_value_set', data_set=np.random.rand(11), shape=[])
+        gamma, lam = 0.99, 0.95
+        SampleProcessor.add_gae(data, gamma=gamma, lam=lam)
+        SampleProcessor.add_discount_sum_reward(data, gamma=gamma)
+        for traj in data.trajectories:
+            rewards = np.reshape(traj('reward_set'), [-1]) * (1 - gamma)
+            values = traj('v_value_set')
+            tds = rewards - values + np.append(values[1:] * gamma, 0)
+            self.assertTrue(np.allclose(traj('advantage_set'), discount(tds, gamma * lam)))
+            self.assertTrue(np.allclose(traj('discount_set'), discount(rewards, gamma)))
@@ -1,4 +1,8 @@
 from baconian.common.sampler.sample_data import TransitionData
+from baconian.algo.rl.model_based.mpc import ModelPredictiveControl
+from baconian.algo.rl.policy.random_policy import UniformRandomPolicy
+from baconian.algo.dynamics.reward_func.reward_func import RandomRewardFunc
+from baconian.algo.dynamics.terminal_func.terminal_func import RandomTerminalFunc
 import unittest
 from baconian.test.tests.set_up.setup import TestTensorflowSetup
 
@@ -47,6 +51,26 @@ class TestMPC(TestTensorflowSetup):
                         done=done)
         print(algo.train(batch_data=data))
 
+    def test_planner(self):
+        mlp_dyna, local = self.create_continue_dynamics_model(env_id='Pendulum-v0')
+        env_spec = local['env_spec']
+        for planner in ModelPredictiveControl.PLANNER_LIST:
+            algo = ModelPredictiveControl(dynamics_model=mlp_dyna,
+                                          env_spec=env_spec,
+                                          config_or_config_dict=dict(SAMPLED_HORIZON=3,
+                                                                     SAMPLED_PATH_NUM=10,
+                                                                     dynamics_model_train_iter=10,
+                                                                     PLANNER=planner,
+                                                                     CEM_ITERATION=2,
+                                                                     CEM_ELITE_NUM=3),
+                                          name='mpc_{}'.format(planner),
+                                          policy=UniformRandomPolicy(env_spec=env_spec, name='unp_{}'.format(planner)))
+            algo.set_terminal_reward_function_for_dynamics_env(terminal_func=RandomTerminalFunc(name='random_p'),
+                                                               reward_func=RandomRewardFunc('re_fun'))
+            algo.init()
+            for _ in range(10):
+                self.assertTrue(env_spec.action_space.contains(algo.predict(env_spec.obs_space.sample())))
+
     def test_mpc_polymorphism(self):
         policy_func = (
             self.create_mlp_deterministic_policy, self.create_normal_dist_mlp_policy, self.create_uniform_policy,
@@ -1,3 +1,6 @@
+import numpy as np
+import tensorflow as tf
+
 from baconian.common.sampler.sample_data import TransitionData
 from baconian.test.tests.set_up.setup import TestWithAll
 from baconian.config.global_config import GlobalConfig
@@ -59,3 +62,55 @@ class TestDDPG(TestWithAll):
 
         self.assert_var_list_equal(ddpg.actor.parameters('tf_var_list'),
                                    new_ddpg.actor.parameters('tf_var_list'))
+
+    def test_fused_update(self):
+        ddpg, locals = self.create_ddpg(fused_update=True)
+        env = locals['env']
+        env_spec = locals['env_spec']
+        ddpg.init()
+        data = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(100):
+            ac = ddpg.predict(st)
+            new_st, re, done, _ = env.step(ac)
+            data.append(state=st, new_state=new_st, action=ac, reward=re, done=done)
+            st = new_st
+        ddpg.append_to_memory(data)
+        new_ddpg, _ = self.create_ddpg(name='new_ddpg')
+        new_ddpg.copy_from(ddpg)
+
+        # the buffer holds 2 minibatches of BATCH_SIZE 50, the 5 iterations cycle over them
+        # targets are untouched without update_target, and nothing is added to the graph after the first call
+        res = ddpg.train(train_iter=5, update_target=False)
+        self.assertTrue(np.isfinite(res['average_critic_loss']) and np.isfinite(res['average_actor_loss']))
+        op_num = len(tf.get_default_graph().get_operations())
+        self.assert_var_list_at_least_not_equal(ddpg.critic.parameters('tf_var_list'),
+                                                new_ddpg.critic.parameters('tf_var_list'))
+        self.assert_var_list_at_least_not_equal(ddpg.actor.parameters('tf_var_list'),
+                                                new_ddpg.actor.parameters('tf_var_list'))
+        self.assert_var_list_equal(ddpg.target_critic.parameters('tf_var_list'),
+                                   new_ddpg.target_critic.parameters('tf_var_list'))
+        self.assert_var_list_equal(ddpg.target_actor.parameters('tf_var_list'),
+                                   new_ddpg.target_actor.parameters('tf_var_list'))
+
+        ddpg.train(batch_data=data, train_iter=3)
+        self.assertEqual(op_num, len(tf.get_default_graph().get_operations()))
+        self.assert_var_list_at_least_not_equal(ddpg.target_critic.parameters('tf_var_list'),
+                                                new_ddpg.target_critic.parameters('tf_var_list'))
+        self.assert_var_list_at_least_not_equal(ddpg.target_actor.parameters('tf_var_list'),
+                                                new_ddpg.target_actor.parameters('tf_var_list'))
+
+        # the in-graph target gives the same critic loss as the target fed back by _critic_train
+        target_q = tf.get_default_session().run(
+            ddpg._target_critic_with_target_actor_output.q_tensor,
+            feed_dict={ddpg._target_critic_with_target_actor_output.state_input: data.new_state_set,
+                       ddpg.target_actor.state_input: data.new_state_set})
+        loss = tf.get_default_session().run(ddpg.critic_loss, feed_dict={ddpg.target_q_input: target_q,
+                                                                        ddpg.critic.state_input: data.state_set,
+                                                                        ddpg.critic.action_input: data.action_set,
+                                                                        ddpg.done_input: data.done_set,
+                                                                        ddpg.reward_input: data.reward_set})
+        fused_loss = tf.get_default_session().run(ddpg._fused_critic_loss,
+                                                  feed_dict=ddpg._fused_batch_feed_dict(
+                                                      data, input_dict=ddpg._fused_input))
+        np.testing.assert_allclose(loss, fused_loss, rtol=1e-4)
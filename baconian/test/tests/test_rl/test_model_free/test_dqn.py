@@ -6,6 +6,7 @@ from baconian.core.core import Basic, EnvSpec
 from baconian.envs.gym_env import make
 from baconian.algo.rl.value_func.mlp_q_value import MLPQValueFunction
 from baconian.common.sampler.sample_data import TransitionData
+from baconian.algo.rl.misc.replay_buffer import PrioritizedReplayBuffer
 import numpy as np
 import tensorflow as tf
 
@@ -132,3 +133,44 @@ class TestDQN(TestWithAll):
         for var, var2 in zip(var_list, var_list2):
             diff = np.abs(var2) - np.abs(var)
             self.assertTrue(np.greater(np.mean(diff), 0.0).all())
+
+    def test_batch_predict(self):
+        dqn, locals = self.create_dqn()
+        env = locals['env']
+        env_spec = locals['env_spec']
+        dqn.init()
+        obs = np.array([env_spec.obs_space.sample() for _ in range(5)])
+        q_values = dqn._predict_all_q_value(obs=obs,
+                                            q_value_tensor=dqn.q_value_func.q_tensor,
+                                            action_ph=dqn.action_input,
+                                            state_ph=dqn.state_input)
+        self.assertEqual(q_values.shape, (5, env_spec.flat_action_dim))
+        actions = dqn.predict(obs=obs, batch_flag=True)
+        self.assertEqual(len(actions), 5)
+        target_actions, target_q = dqn.predict_target_with_q_val(obs=obs, batch_flag=True)
+        self.assertEqual(target_q.shape, (5,))
+        for i in range(5):
+            self.assertEqual(actions[i], dqn.predict(obs=obs[i], batch_flag=False))
+            self.assertEqual(actions[i], int(np.argmax(q_values[i])))
+
+    def test_prioritized_replay(self):
+        dqn, locals = self.create_dqn()
+        env = locals['env']
+        env_spec = locals['env_spec']
+        dqn.replay_buffer = PrioritizedReplayBuffer(limit=1000, action_shape=env_spec.action_shape,
+                                                    observation_shape=env_spec.obs_shape)
+        dqn.init()
+        data = TransitionData(env_spec)
+        st = env.reset()
+        for i in range(100):
+            ac = env_spec.action_space.sample()
+            st_new, re, done, _ = env.step(action=ac)
+            data.append(state=st, new_state=st_new, action=ac, done=done, reward=re)
+            st = env.reset() if done else st_new
+        dqn.append_to_memory(data)
+        res = dqn.train(train_iter=5)
+        self.assertTrue(np.isfinite(res['average_loss']))
+        # the priorities of the trained slots are set from their td errors instead of the initial max priority
+        self.assertGreater(len(set(np.round(dqn.replay_buffer._it_sum[np.arange(100)], 8).tolist())), 1)
+        weights = dqn.replay_buffer.sample(batch_size=10)('weight_set')
+        self.assertTrue(np.all(weights > 0.0) and np.all(weights <= 1.0 + 1e-6))
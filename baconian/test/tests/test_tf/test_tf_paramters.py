@@ -1,6 +1,8 @@
+import os
+
 import numpy as np
 import tensorflow as tf
-from baconian.tf.tf_parameters import ParametersWithTensorflowVariable
+from baconian.tf.tf_parameters import ParametersWithTensorflowVariable, CheckpointWriter
 from baconian.config.dict_config import DictConfig
 from baconian.core.core import Basic, EnvSpec
 from baconian.config.global_config import GlobalConfig
@@ -67,3 +69,43 @@ class TestTensorflowParameters(TestWithAll):
         param2.load(path_to_model=GlobalConfig().DEFAULT_LOG_PATH + '/model', global_step=9)
         for var1, var2 in zip(var_val, param2('tf_var_list')):
             self.assertTrue(np.equal(var1, self.sess.run(var2)).all())
+
+    def test_async_npz_save_load(self):
+        GlobalConfig().set('DEFAULT_TF_CHECKPOINT_TYPE', 'npz')
+        try:
+            param, _ = self.create_tf_parameters('param')
+            param.init()
+            var_val = [self.sess.run(var) for var in param('tf_var_list')]
+            save_path = GlobalConfig().DEFAULT_LOG_PATH + '/npz_model'
+            for i in range(10):
+                param.save(sess=self.sess, save_path=save_path, global_step=i)
+            CheckpointWriter().wait()
+            self.assertEqual(sorted(f for f in os.listdir(save_path) if f.endswith('.npz')),
+                             ['param-{}.npz'.format(i) for i in range(10 - param.max_to_keep, 10)])
+
+            self.sess.run(tf.variables_initializer(var_list=param('tf_var_list')))
+            param.load(path_to_model=save_path)
+            for var1, var2 in zip(var_val, param('tf_var_list')):
+                self.assertTrue(np.equal(var1, self.sess.run(var2)).all())
+        finally:
+            GlobalConfig().set('DEFAULT_TF_CHECKPOINT_TYPE', 'tf')
+
+    def test_flat_and_cached_assign_op(self):
+        param, _ = self.create_tf_parameters('param')
+        param.init()
+        param2, _ = self.create_tf_parameters('param2')
+        param2.init()
+        flat = param.get_flat()
+        self.assertEqual(flat.shape, (sum(int(np.prod(var.get_shape().as_list())) for var in param('tf_var_list')),))
+        param2.set_flat(flat)
+        for var1, var2 in zip(param('tf_var_list'), param2('tf_var_list')):
+            self.assertTrue(np.equal(self.sess.run(var1), self.sess.run(var2)).all())
+
+        param2.copy_from(param)
+        op_num = len(tf.get_default_graph().get_operations())
+        for _ in range(5):
+            param2.copy_from(param)
+            param2.set_flat(param.get_flat())
+            param.save_snapshot()
+            param.load_snapshot()
+        self.assertEqual(op_num, len(tf.get_default_graph().get_operations()))
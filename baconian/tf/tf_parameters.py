@@ -1,6 +1,14 @@
+import queue
+import re
+import threading
+import weakref
+from collections import deque
+
 import tensorflow as tf
 from baconian.core.parameters import Parameters
 from baconian.config.global_config import GlobalConfig
+from baconian.common.logging import ConsoleLogger, Logger
+from baconian.common.profiler import profile_decorator
 from overrides.overrides import overrides
 from typeguard import typechecked
 import os
@@ -9,12 +17,87 @@ import numpy as np
 from copy import deepcopy
 
 
+class _SingletonCheckpointWriter(object):
+    """
+    A private class that should never be instanced, it is used to implement the singleton design pattern for
+    CheckpointWriter
+
+    Write the 'npz' checkpoints in a background thread. Each checkpoint is written into a temporary file which is
+    then renamed, so a checkpoint file is either complete or absent. Only the latest max_to_keep checkpoints (and
+    their json files of the rest parameters) of each save path and name written by this process are kept.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._kept_checkpoints = dict()
+
+    def put(self, save_path: str, name: str, global_step, var_value_dict: dict, max_to_keep: int,
+            rest_param: dict = None):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((save_path, name, global_step, var_value_dict, max_to_keep, rest_param))
+
+    def wait(self):
+        """
+        Block until all the checkpoints handed over are written.
+        """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            save_path, name, global_step, var_value_dict, max_to_keep, rest_param = self._queue.get()
+            try:
+                self._write(save_path, name, global_step, var_value_dict, max_to_keep, rest_param)
+            except Exception as e:
+                ConsoleLogger().print('error', 'failed to write checkpoint {}-{} into {}: {}'.format(
+                    name, global_step, save_path, e))
+            finally:
+                self._queue.task_done()
+
+    @profile_decorator('checkpoint/write')
+    def _write(self, save_path, name, global_step, var_value_dict, max_to_keep, rest_param):
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        file_path = os.path.join(save_path, '{}-{}.npz'.format(name, global_step))
+        tmp_path = os.path.join(save_path, '.{}-{}.npz.tmp'.format(name, global_step))
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **var_value_dict)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+        if rest_param is not None:
+            Logger().out_to_file(file_path=save_path,
+                                 file_name='{}-{}.json'.format(name, global_step),
+                                 content=rest_param)
+        kept = self._kept_checkpoints.setdefault((save_path, name), deque())
+        if global_step in kept:
+            kept.remove(global_step)
+        kept.append(global_step)
+        while max_to_keep and len(kept) > max_to_keep:
+            old_step = kept.popleft()
+            for ext in ('npz', 'json'):
+                old_path = os.path.join(save_path, '{}-{}.{}'.format(name, old_step, ext))
+                if os.path.exists(old_path):
+                    os.remove(old_path)
+
+
+class CheckpointWriter(object):
+    only_instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if CheckpointWriter.only_instance is None:
+            CheckpointWriter.only_instance = _SingletonCheckpointWriter()
+        return CheckpointWriter.only_instance
+
+
 class ParametersWithTensorflowVariable(Parameters):
 
     @typechecked
     def __init__(self, tf_var_list: list, rest_parameters: dict, name: str,
                  max_to_keep=GlobalConfig().DEFAULT_MAX_TF_SAVER_KEEP,
-                 default_save_type='tf',
+                 default_save_type: str = None,
                  source_config=None,
                  to_scheduler_param_tuple: list = None,
                  save_rest_param_flag=True,
@@ -31,10 +114,16 @@ class ParametersWithTensorflowVariable(Parameters):
         self.saver = None
         self.max_to_keep = max_to_keep
         self.require_snapshot = require_snapshot
-        self.default_checkpoint_type = default_save_type
+        self.default_checkpoint_type = default_save_type if default_save_type else \
+            GlobalConfig().DEFAULT_TF_CHECKPOINT_TYPE
         self.save_rest_param_flag = save_rest_param_flag
-        if default_save_type != 'tf':
-            raise NotImplementedError('only support saving tf')
+        if self.default_checkpoint_type not in ('tf', 'npz'):
+            raise NotImplementedError('only support saving tf or npz')
+        # the assign ops are built once and reused, so copying/restoring the weights never grows the graph
+        self._copy_from_op_dict = weakref.WeakKeyDictionary()
+        self._flat_tensor = None
+        self._flat_ph = None
+        self._set_flat_op = None
         self._registered_tf_ph_dict = dict()
         if to_ph_parameter_dict:
             for key, val in to_ph_parameter_dict.items():
@@ -46,21 +135,12 @@ class ParametersWithTensorflowVariable(Parameters):
         sess = tf.get_default_session()
         sess.run(tf.variables_initializer(var_list=self._tf_var_list))
         if self.require_snapshot is True:
-            if len(self.snapshot_var) == 0:
-                # add the snapshot op after the init
-                sess = tf.get_default_session()
-                with tf.variable_scope('snapshot'):
-                    for var in self._tf_var_list:
-                        snap_var = tf.Variable(initial_value=sess.run(var),
-                                               expected_shape=var.get_shape().as_list(),
-                                               name=str(var.name).split(':')[0])
-                        self.snapshot_var.append(snap_var)
-                        self.save_snapshot_op.append(tf.assign(snap_var, var))
-                        self.load_snapshot_op.append(tf.assign(var, snap_var))
+            self._build_snapshot_op()
             sess.run(tf.variables_initializer(var_list=self.snapshot_var))
             sess.run(self.save_snapshot_op)
-        self.saver = tf.train.Saver(max_to_keep=self.max_to_keep,
-                                    var_list=self._tf_var_list)
+        if self.default_checkpoint_type == 'tf':
+            self.saver = tf.train.Saver(max_to_keep=self.max_to_keep,
+                                        var_list=self._tf_var_list)
 
     @typechecked
     def return_tf_parameter_feed_dict(self) -> dict:
@@ -72,28 +152,74 @@ class ParametersWithTensorflowVariable(Parameters):
     def save_snapshot(self):
         sess = tf.get_default_session()
         if len(self.save_snapshot_op) == 0:
-            with tf.variable_scope('snapshot'):
-                for var in self._tf_var_list:
-                    snap_var = tf.Variable(initial_value=sess.run(var),
-                                           expected_shape=var.get_shape().as_list(),
-                                           name=var.name)
-                    self.snapshot_var.append(snap_var)
-                    self.save_snapshot_op.append(tf.assign(var, snap_var))
+            self._build_snapshot_op()
+            sess.run(tf.variables_initializer(var_list=self.snapshot_var))
         sess.run(self.save_snapshot_op)
 
     def load_snapshot(self):
         sess = tf.get_default_session()
         if len(self.load_snapshot_op) == 0:
-            with tf.variable_scope('snapshot'):
-                for var in self._tf_var_list:
-                    snap_var = tf.Variable(initial_value=sess.run(var),
-                                           expected_shape=var.get_shape().as_list(),
-                                           name=var.name)
-                    self.snapshot_var.append(snap_var)
-                    self.load_snapshot_op.append(tf.assign(snap_var, var))
+            self._build_snapshot_op()
+            sess.run(tf.variables_initializer(var_list=self.snapshot_var))
+            sess.run(self.save_snapshot_op)
         sess.run(self.load_snapshot_op)
 
+    def _build_snapshot_op(self):
+        if len(self.snapshot_var) > 0:
+            return
+        with tf.variable_scope('snapshot'):
+            for var in self._tf_var_list:
+                snap_var = tf.Variable(initial_value=tf.zeros(shape=var.get_shape(), dtype=var.dtype.base_dtype),
+                                       trainable=False,
+                                       name=var.op.name)
+                self.snapshot_var.append(snap_var)
+                self.save_snapshot_op.append(tf.assign(snap_var, var))
+                self.load_snapshot_op.append(tf.assign(var, snap_var))
+
+    def get_flat(self, sess=None) -> np.ndarray:
+        """
+        Return all the variables as one flat vector (in the order of tf_var_list), the dtype is float32 if all the
+        variables are float32 and float64 otherwise.
+        """
+        sess = sess if sess else tf.get_default_session()
+        if self._flat_tensor is None:
+            self._build_flat_op()
+        return sess.run(self._flat_tensor)
+
+    def set_flat(self, flat_vec: np.ndarray, sess=None):
+        """
+        Assign all the variables from a flat vector returned by get_flat, by one placeholder and one sess.run.
+        """
+        sess = sess if sess else tf.get_default_session()
+        if self._set_flat_op is None:
+            self._build_flat_op()
+        sess.run(self._set_flat_op, feed_dict={self._flat_ph: flat_vec})
+
+    def _build_flat_op(self):
+        flat_dtype = tf.float32 if all(var.dtype.base_dtype == tf.float32 for var in self._tf_var_list) \
+            else tf.float64
+        shapes = [var.get_shape().as_list() for var in self._tf_var_list]
+        sizes = [int(np.prod(shape)) for shape in shapes]
+        with tf.name_scope('{}_flat'.format(self.name)):
+            self._flat_tensor = tf.concat([tf.reshape(tf.cast(var, flat_dtype), [-1]) for var in self._tf_var_list],
+                                          axis=0)
+            self._flat_ph = tf.placeholder(dtype=flat_dtype, shape=[sum(sizes)])
+            self._set_flat_op = tf.group(*[tf.assign(var, tf.cast(tf.reshape(val, shape), var.dtype.base_dtype))
+                                           for var, val, shape in
+                                           zip(self._tf_var_list, tf.split(self._flat_ph, sizes), shapes)])
+
     def save(self, save_path, global_step, sess=None, name=None, *args, **kwargs):
+        if self.save_rest_param_flag is False:
+            to_save_dict = dict(_source_config=self._source_config.config_dict)
+        else:
+            to_save_dict = dict(_parameters=self._parameters, _source_config=self._source_config.config_dict)
+        if self.default_checkpoint_type == 'npz':
+            self._save_to_npz(save_path=save_path,
+                              global_step=global_step,
+                              sess=sess,
+                              name=name,
+                              rest_param=to_save_dict)
+            return
         if self.default_checkpoint_type == 'tf':
             self._save_to_tf(save_path=save_path,
                              global_step=global_step,
@@ -101,10 +227,6 @@ class ParametersWithTensorflowVariable(Parameters):
                              name=name)
         elif self.default_checkpoint_type == 'h5py':
             raise NotImplementedError
-        if self.save_rest_param_flag is False:
-            to_save_dict = dict(_source_config=self._source_config.config_dict)
-        else:
-            to_save_dict = dict(_parameters=self._parameters, _source_config=self._source_config.config_dict)
         Parameters.save(self,
                         save_path=save_path,
                         global_step=global_step,
@@ -118,6 +240,10 @@ class ParametersWithTensorflowVariable(Parameters):
             self._load_from_tf(path_to_model=path_to_model,
                                global_step=global_step,
                                sess=sess, model_name=model_name)
+        elif self.default_checkpoint_type == 'npz':
+            global_step = self._load_from_npz(path_to_model=path_to_model,
+                                              global_step=global_step,
+                                              sess=sess, model_name=model_name)
         elif self.default_checkpoint_type == 'h5py':
             self._load_from_h5py(*args, **kwargs)
         Parameters.load(self,
@@ -146,6 +272,34 @@ class ParametersWithTensorflowVariable(Parameters):
         self.saver.restore(sess=sess,
                            save_path=loaded_path)
 
+    def _save_to_npz(self, save_path, global_step, rest_param, sess=None, name=None):
+        name = name if name else self.name
+        sess = sess if sess else tf.get_default_session()
+        # one sess.run copies all the variables into memory, the file is written by the CheckpointWriter thread
+        values = sess.run(self._tf_var_list)
+        CheckpointWriter().put(save_path=save_path,
+                               name=name,
+                               global_step=global_step,
+                               var_value_dict={var.op.name: val for var, val in zip(self._tf_var_list, values)},
+                               max_to_keep=self.max_to_keep,
+                               rest_param=deepcopy(rest_param))
+
+    def _load_from_npz(self, path_to_model, model_name, global_step=None, sess=None):
+        sess = sess if sess else tf.get_default_session()
+        # the checkpoint may still be in the queue of the writer
+        CheckpointWriter().wait()
+        if global_step is None:
+            steps = [int(m.group(1)) for m in
+                     (re.match(r'^{}-(\d+)\.npz$'.format(re.escape(model_name)), f) for f in os.listdir(path_to_model))
+                     if m]
+            if len(steps) == 0:
+                raise FileNotFoundError('no checkpoint of {} in {}'.format(model_name, path_to_model))
+            global_step = max(steps)
+        with np.load(os.path.join(path_to_model, '{}-{}.npz'.format(model_name, global_step))) as f:
+            flat_vec = np.concatenate([np.ravel(f[var.op.name]) for var in self._tf_var_list])
+        self.set_flat(flat_vec, sess=sess)
+        return global_step
+
     def _save_to_h5py(self, var_list, sess):
         raise NotImplementedError
 
@@ -183,6 +337,10 @@ class ParametersWithTensorflowVariable(Parameters):
         for var in tf_var_list:
             assert isinstance(var, (tf.Tensor, tf.Variable))
         self._tf_var_list += tf_var_list
+        self._copy_from_op_dict = weakref.WeakKeyDictionary()
+        self._flat_tensor = None
+        self._flat_ph = None
+        self._set_flat_op = None
 
     @typechecked
     def to_tf_ph(self, key, ph: tf.Tensor):
@@ -195,12 +353,12 @@ class ParametersWithTensorflowVariable(Parameters):
         if not isinstance(source_parameter, type(self)):
             raise TypeError()
         super(ParametersWithTensorflowVariable, self).copy_from(source_parameter)
-        tmp_op_list = []
-        for t_para, s_para in zip(self._tf_var_list, source_parameter._tf_var_list):
-            tmp_op_list.append(tf.assign(t_para, s_para))
+        if source_parameter not in self._copy_from_op_dict:
+            assign_op_list = [tf.assign(t_para, s_para) for t_para, s_para in
+                              zip(self._tf_var_list, source_parameter._tf_var_list)]
+            self._copy_from_op_dict[source_parameter] = tf.group(*assign_op_list)
         sess = tf.get_default_session()
-        sess.run(tmp_op_list)
-        del tmp_op_list
+        sess.run(self._copy_from_op_dict[source_parameter])
 
     def _update_dict(self, source_dict: dict, target_dict: dict):
         for key, val in source_dict.items():
@@ -0,0 +1,164 @@
+"""
+Cases of the performance benchmark. Each case builds its objects (with the creators used by the unit tests) and
+returns the function to time together with the number of operations done by one call of it.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from baconian.algo.rl.misc.replay_buffer import UniformRandomReplayBuffer, PrioritizedReplayBuffer
+from baconian.common.sampler.sample_data import TransitionData
+from baconian.test.tests.set_up.class_creator import ClassCreatorSetup
+
+CASE_DICT = OrderedDict()
+
+
+def register_case(name: str, unit: str):
+    def wrap(fn):
+        CASE_DICT[name] = dict(build=fn, unit=unit)
+        return fn
+
+    return wrap
+
+
+def _random_transition_data(env, env_spec, count, episode_length=None):
+    data = TransitionData(env_spec)
+    st = env.reset()
+    for i in range(count):
+        ac = env_spec.action_space.sample()
+        new_st, re, done, _ = env.step(action=ac)
+        if episode_length is not None:
+            done = (i + 1) % episode_length == 0
+        data.append(state=st, new_state=new_st, action=ac, reward=re, done=done)
+        st = env.reset() if done else new_st
+    return data
+
+
+@register_case('transition_data_append', unit='transition')
+def transition_data_append(creator: ClassCreatorSetup):
+    data = TransitionData(obs_shape=[3], action_shape=[1])
+    st, ac = np.random.rand(3), np.random.rand(1)
+
+    def fn():
+        if len(data) >= 100000:
+            data.reset()
+        data.append(state=st, new_state=st, action=ac, reward=1.0, done=False)
+
+    return fn, 1
+
+
+@register_case('transition_data_sample_batch', unit='transition')
+def transition_data_sample_batch(creator: ClassCreatorSetup):
+    data = TransitionData(obs_shape=[3], action_shape=[1])
+    data.append_batch(state=np.random.rand(10000, 3), new_state=np.random.rand(10000, 3),
+                      action=np.random.rand(10000, 1), reward=np.random.rand(10000),
+                      done=np.zeros(10000, dtype=bool))
+    return lambda: data.sample_batch(batch_size=256), 256
+
+
+def _filled_replay_buffer(buffer_cls):
+    buffer = buffer_cls(limit=100000, action_shape=(1,), observation_shape=(3,))
+    data = TransitionData(obs_shape=[3], action_shape=[1])
+    data.append_batch(state=np.random.rand(10000, 3), new_state=np.random.rand(10000, 3),
+                      action=np.random.rand(10000, 1), reward=np.random.rand(10000),
+                      done=np.zeros(10000, dtype=bool))
+    buffer.extend(data)
+    return buffer, data
+
+
+@register_case('replay_buffer_append', unit='transition')
+def replay_buffer_append(creator: ClassCreatorSetup):
+    buffer, _ = _filled_replay_buffer(UniformRandomReplayBuffer)
+    st, ac = np.random.rand(3), np.random.rand(1)
+    return lambda: buffer.append(obs0=st, obs1=st, action=ac, reward=1.0, terminal1=False), 1
+
+
+@register_case('replay_buffer_extend', unit='transition')
+def replay_buffer_extend(creator: ClassCreatorSetup):
+    buffer, data = _filled_replay_buffer(UniformRandomReplayBuffer)
+    return lambda: buffer.extend(data), len(data)
+
+
+@register_case('replay_buffer_sample', unit='transition')
+def replay_buffer_sample(creator: ClassCreatorSetup):
+    buffer, _ = _filled_replay_buffer(UniformRandomReplayBuffer)
+    return lambda: buffer.sample(batch_size=256), 256
+
+
+@register_case('prioritized_replay_buffer_sample', unit='transition')
+def prioritized_replay_buffer_sample(creator: ClassCreatorSetup):
+    buffer, _ = _filled_replay_buffer(PrioritizedReplayBuffer)
+    return lambda: buffer.sample(batch_size=256), 256
+
+
+@register_case('sampler_step', unit='env step')
+def sampler_step(creator: ClassCreatorSetup):
+    dqn, local = creator.create_dqn()
+    env, env_spec = local['env'], local['env_spec']
+    agent, _ = creator.create_agent(algo=dqn, env=env, env_spec=env_spec, eps=creator.create_eps(env_spec)[0])
+    creator.register_global_status_when_test(agent=agent, env=env)
+    agent.init()
+    env.reset()
+    return lambda: agent.sample(env=env, sample_count=100, in_which_status='TRAIN', store_flag=False), 100
+
+
+@register_case('mpc_predict', unit='action')
+def mpc_predict(creator: ClassCreatorSetup):
+    mpc, local = creator.create_mpc(env_id='Pendulum-v0')
+    mpc.init()
+    obs = local['env_spec'].obs_space.sample()
+    return lambda: mpc.predict(obs=obs), 1
+
+
+@register_case('ilqr_policy_forward', unit='action')
+def ilqr_policy_forward(creator: ClassCreatorSetup):
+    policy, local = creator.create_ilqr_policy()
+    policy.init()
+    obs = local['env_spec'].obs_space.sample()
+    return lambda: policy.forward(obs=obs), 1
+
+
+@register_case('dqn_train', unit='update')
+def dqn_train(creator: ClassCreatorSetup):
+    dqn, local = creator.create_dqn()
+    dqn.init()
+    dqn.append_to_memory(_random_transition_data(local['env'], local['env_spec'], count=1000))
+    return lambda: dqn.train(train_iter=1), 1
+
+
+@register_case('ddpg_train', unit='update')
+def ddpg_train(creator: ClassCreatorSetup):
+    ddpg, local = creator.create_ddpg()
+    ddpg.init()
+    ddpg.append_to_memory(_random_transition_data(local['env'], local['env_spec'], count=1000))
+    return lambda: ddpg.train(train_iter=1), 1
+
+
+@register_case('ddpg_fused_train', unit='update')
+def ddpg_fused_train(creator: ClassCreatorSetup):
+    ddpg, local = creator.create_ddpg(fused_update=True)
+    ddpg.init()
+    ddpg.append_to_memory(_random_transition_data(local['env'], local['env_spec'], count=1000))
+    return lambda: ddpg.train(train_iter=1), 1
+
+
+@register_case('ddpg_fused_train_iter_10', unit='update')
+def ddpg_fused_train_iter_10(creator: ClassCreatorSetup):
+    ddpg, local = creator.create_ddpg(fused_update=True)
+    ddpg.init()
+    ddpg.append_to_memory(_random_transition_data(local['env'], local['env_spec'], count=1000))
+    return lambda: ddpg.train(train_iter=10), 10
+
+
+@register_case('ppo_train', unit='update')
+def ppo_train(creator: ClassCreatorSetup):
+    ppo, local = creator.create_ppo()
+    ppo.init()
+    data = _random_transition_data(local['env'], local['env_spec'], count=200, episode_length=50)
+
+    def fn():
+        # the trajectory memory is consumed by every train
+        ppo.append_to_memory(data)
+        ppo.train(train_iter=1)
+
+    return fn, 1
@@ -0,0 +1,137 @@
+"""
+Performance benchmark of the hot paths (sample data, replay buffer, sampler, planners and algorithm updates), CPU only.
+
+Run all the cases and save the results as a baseline:
+    python -m benchmark.perf_benchmark.run_perf_benchmark --save benchmark/perf_benchmark/baselines/my_laptop.json
+Compare a new run with a saved baseline, the exit code is 1 if any case is slower than the baseline by more than the
+tolerance:
+    python -m benchmark.perf_benchmark.run_perf_benchmark --compare benchmark/perf_benchmark/baselines/my_laptop.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from baconian.core.global_var import reset_all
+from baconian.core.status import reset_global_status_collect
+from baconian.tf.util import create_new_tf_session
+from baconian.test.tests.set_up.class_creator import ClassCreatorSetup
+from benchmark.perf_benchmark.cases import CASE_DICT
+
+
+def _reset_case_env():
+    reset_all()
+    reset_global_status_collect()
+    if tf.get_default_session():
+        tf.get_default_session().__exit__(None, None, None)
+    tf.reset_default_graph()
+    # cuda_device=-1 hides all the gpus
+    create_new_tf_session(cuda_device=-1)
+
+
+def measure(fn, ops_per_call: int, min_time: float, repeat: int, warm_up: int = 3) -> dict:
+    """
+    Call fn for at least min_time seconds in each of the repeat rounds.
+
+    :return: dict of the throughput (median over the rounds, in operations per second) and the latency percentiles
+    of one call (in seconds)
+    """
+    for _ in range(warm_up):
+        fn()
+    throughput = []
+    latency = []
+    for _ in range(repeat):
+        call_num = 0
+        round_start = time.perf_counter()
+        while True:
+            start = time.perf_counter()
+            fn()
+            end = time.perf_counter()
+            latency.append(end - start)
+            call_num += 1
+            if end - round_start >= min_time:
+                break
+        throughput.append(call_num * ops_per_call / (end - round_start))
+    p50, p90, p99 = np.percentile(latency, (50, 90, 99))
+    return dict(ops_per_sec=float(np.median(throughput)),
+                latency_p50=float(p50),
+                latency_p90=float(p90),
+                latency_p99=float(p99),
+                call_num=len(latency))
+
+
+def run(case_list, min_time: float, repeat: int) -> dict:
+    creator = ClassCreatorSetup()
+    results = dict()
+    for name in case_list:
+        _reset_case_env()
+        fn, ops_per_call = CASE_DICT[name]['build'](creator)
+        res = measure(fn, ops_per_call=ops_per_call, min_time=min_time, repeat=repeat)
+        res['unit'] = CASE_DICT[name]['unit']
+        results[name] = res
+        print('{:<36}{:>14.1f} {}/s    p50 {:.6f}s    p90 {:.6f}s'.format(name, res['ops_per_sec'], res['unit'],
+                                                                         res['latency_p50'], res['latency_p90']))
+    return dict(meta=dict(time=time.strftime("%Y-%m-%d_%H-%M-%S"),
+                          platform=platform.platform(),
+                          processor=platform.processor(),
+                          python=platform.python_version(),
+                          numpy=np.__version__,
+                          tensorflow=tf.__version__),
+                results=results)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :return: list of (case, baseline throughput, new throughput) of the cases slower than the baseline by more than
+    tolerance (a fraction of the baseline throughput)
+    """
+    regressions = []
+    for name, res in results['results'].items():
+        if name not in baseline['results']:
+            print('{:<36} not in the baseline'.format(name))
+            continue
+        base = baseline['results'][name]['ops_per_sec']
+        ratio = res['ops_per_sec'] / base
+        flag = ratio < 1.0 - tolerance
+        print('{:<36}{:>14.1f} -> {:>14.1f} {}/s  ({:+.1%}){}'.format(name, base, res['ops_per_sec'], res['unit'],
+                                                                     ratio - 1.0, '  REGRESSION' if flag else ''))
+        if flag:
+            regressions.append((name, base, res['ops_per_sec']))
+    return regressions
+
+
+def main():
+    arg = argparse.ArgumentParser()
+    arg.add_argument('--case', type=str, nargs='*', choices=list(CASE_DICT.keys()), default=None,
+                     help='cases to run, all the cases by default')
+    arg.add_argument('--min_time', type=float, default=1.0, help='minimal time (s) of each round of a case')
+    arg.add_argument('--repeat', type=int, default=3, help='number of rounds of each case')
+    arg.add_argument('--save', type=str, default=None, help='path to save the results as json')
+    arg.add_argument('--compare', type=str, default=None, help='path of a saved baseline to compare with')
+    arg.add_argument('--tolerance', type=float, default=0.2,
+                     help='allowed throughput drop (fraction of the baseline) before a case is flagged')
+    args = arg.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    case_list = args.case if args.case else list(CASE_DICT.keys())
+    if baseline is not None and not args.case:
+        case_list = [name for name in case_list if name in baseline['results']]
+    results = run(case_list, min_time=args.min_time, repeat=args.repeat)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+    if baseline is not None:
+        regressions = compare(results, baseline, tolerance=args.tolerance)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,8 +18,8 @@ from baconian.core.status import get_global_status_collect
 from baconian.common.schedules import PeriodicalEventSchedule
 
 
-def pendulum_task_fn():
-    exp_config = PENDULUM_BENCHMARK_CONFIG_DICT
+def pendulum_task_fn(exp_config: dict = None):
+    exp_config = exp_config if exp_config else PENDULUM_BENCHMARK_CONFIG_DICT
     GlobalConfig().set('DEFAULT_EXPERIMENT_END_POINT',
                        exp_config['DEFAULT_EXPERIMENT_END_POINT'])
 
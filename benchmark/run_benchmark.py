@@ -7,7 +7,7 @@ import argparse
 import os
 import time
 from baconian.config.global_config import GlobalConfig
-from baconian.core.experiment_runner import duplicate_exp_runner
+from baconian.core.experiment_runner import duplicate_exp_runner, parallel_exp_runner
 
 arg = argparse.ArgumentParser()
 env_id_to_task_fn = {
@@ -24,14 +24,21 @@ env_id_to_task_fn = {
 }
 alog_list = ['ddpg', 'dyna', 'mpc', 'ppo', 'ilqr']
 
-arg.add_argument('--env_id', type=str, choices=list(env_id_to_task_fn.keys()))
-arg.add_argument('--algo', type=str, choices=alog_list)
-arg.add_argument('--count', type=int, default=1)
-arg.add_argument('--cuda_id', type=int, default=-1)
-args = arg.parse_args()
+if __name__ == '__main__':
+    arg.add_argument('--env_id', type=str, choices=list(env_id_to_task_fn.keys()))
+    arg.add_argument('--algo', type=str, choices=alog_list)
+    arg.add_argument('--count', type=int, default=1)
+    arg.add_argument('--cuda_id', type=int, default=-1)
+    arg.add_argument('--process_num', type=int, default=1,
+                     help='number of the seeds run in parallel processes, the seeds are run one by one if 1')
+    args = arg.parse_args()
 
-CURRENT_PATH = os.path.dirname(os.path.realpath(__file__))
+    CURRENT_PATH = os.path.dirname(os.path.realpath(__file__))
 
-GlobalConfig().set('DEFAULT_LOG_PATH', os.path.join(CURRENT_PATH, 'benchmark_log', args.env_id, args.algo,
-                                                    time.strftime("%Y-%m-%d_%H-%M-%S")))
-duplicate_exp_runner(args.count, env_id_to_task_fn[args.env_id][args.algo], gpu_id=args.cuda_id)
+    GlobalConfig().set('DEFAULT_LOG_PATH', os.path.join(CURRENT_PATH, 'benchmark_log', args.env_id, args.algo,
+                                                        time.strftime("%Y-%m-%d_%H-%M-%S")))
+    if args.process_num > 1:
+        parallel_exp_runner(args.count, env_id_to_task_fn[args.env_id][args.algo], process_num=args.process_num,
+                            gpu_id=args.cuda_id)
+    else:
+        duplicate_exp_runner(args.count, env_id_to_task_fn[args.env_id][args.algo], gpu_id=args.cuda_id)